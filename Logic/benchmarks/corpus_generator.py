@@ -0,0 +1,316 @@
+import argparse
+import json
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+SYLLABLES = [
+    "ka", "lo", "mi", "ra", "ten", "dor", "vel", "an", "is", "or", "qu", "ster", "mar", "bel", "th",
+    "ion", "ric", "sa", "ne", "gu", "win", "al", "ber", "to", "ly", "den", "fi", "ro", "chi", "ul",
+]
+TEXT_FIELDS = ("summaries", "synopsis")
+
+
+class CorpusStatistics:
+    def __init__(self, movies):
+        """
+        The statistics of a crawled corpus that the synthetic corpus reproduces.
+
+        Parameters
+        ----------
+        movies : list of dict
+            The crawled movies (the format of IMDB_Crawled.json).
+        """
+        self.movie_count = len(movies)
+        word_counts = Counter()
+        self.text_lengths = {field: [] for field in TEXT_FIELDS + ("reviews",)}
+        self.list_lengths = {field: [] for field in TEXT_FIELDS + ("reviews",)}
+        star_counts, genre_counts, name_counts = Counter(), Counter(), Counter()
+        self.star_list_lengths, self.genre_list_lengths, self.related_link_counts = [], [], []
+        self.values = {field: [] for field in ("release_year", "mpaa", "budget", "gross_worldwide", "rating")}
+        self.languages, self.countries, self.review_scores = [], [], []
+
+        for movie in movies:
+            for field in TEXT_FIELDS:
+                texts = movie.get(field, None) or []
+                self.list_lengths[field].append(len(texts))
+                for text in texts:
+                    words = self.tokenize(text)
+                    word_counts.update(words)
+                    self.text_lengths[field].append(len(words))
+            reviews = movie.get("reviews", None) or []
+            self.list_lengths["reviews"].append(len(reviews))
+            for review in reviews:
+                words = self.tokenize(review[0])
+                word_counts.update(words)
+                self.text_lengths["reviews"].append(len(words))
+                if len(review) > 1 and review[1]:
+                    self.review_scores.append(review[1])
+
+            stars = movie.get("stars", None) or []
+            star_counts.update(stars)
+            self.star_list_lengths.append(len(stars))
+            genres = movie.get("genres", None) or []
+            genre_counts.update(genres)
+            self.genre_list_lengths.append(len(genres))
+            for field in ("directors", "writers"):
+                name_counts.update(movie.get(field, None) or [])
+            self.related_link_counts.append(len(movie.get("related_links", None) or []))
+            for field in self.values:
+                if movie.get(field, None) is not None:
+                    self.values[field].append(movie[field])
+            if movie.get("languages", None):
+                self.languages.append(movie["languages"])
+            if movie.get("countries_of_origin", None):
+                self.countries.append(movie["countries_of_origin"])
+
+        self.vocabulary = [word for word, _ in word_counts.most_common()]
+        self.zipf_exponent = self.estimate_zipf_exponent([count for _, count in word_counts.most_common()])
+        self.stars = star_counts.most_common()
+        self.genres = genre_counts.most_common()
+        names = list(star_counts) + list(name_counts)
+        self.first_names = sorted({name.split()[0] for name in names if len(name.split()) > 1})
+        self.last_names = sorted({name.split()[-1] for name in names if len(name.split()) > 1})
+
+    @staticmethod
+    def tokenize(text):
+        return re.findall(r"[a-z]+", text.lower())
+
+    @staticmethod
+    def estimate_zipf_exponent(counts, max_rank=1000):
+        """
+        Fits log(count) = c - s * log(rank) over the most frequent words and returns s.
+        """
+        counts = np.array(counts[:max_rank], dtype=np.float64)
+        if len(counts) < 2:
+            return 1.0
+        ranks = np.arange(1, len(counts) + 1)
+        slope, _ = np.polyfit(np.log(ranks), np.log(counts), 1)
+        return float(max(-slope, 0.5))
+
+
+class SyntheticCorpusGenerator:
+    def __init__(self, statistics, scale=10, seed=0, heaps_exponent=0.5):
+        """
+        Generates IMDb-like movie documents with the statistics of a crawled corpus.
+
+        Texts are sampled from a Zipfian distribution over the crawled vocabulary, which grows
+        with the corpus following Heaps' law (new synthetic words are added at the tail ranks).
+        Stars and genres follow their crawled popularity distributions, with synthetic names added
+        for larger corpora, and related_links form a preferential-attachment graph over the
+        generated movie IDs. List lengths, text lengths and scalar fields are sampled from their
+        crawled values.
+
+        Parameters
+        ----------
+        statistics : CorpusStatistics
+            The statistics of the crawled corpus.
+        scale : float
+            The size of the generated corpus relative to the crawled one.
+        seed : int
+            The seed of the random generator.
+        heaps_exponent : float
+            How fast the vocabulary and the number of stars grow with the corpus.
+        """
+        self.statistics = statistics
+        self.scale = scale
+        self.rng = np.random.default_rng(seed)
+        self.movie_count = max(int(round(statistics.movie_count * scale)), 1)
+        growth = max(scale, 1) ** heaps_exponent
+
+        self.vocabulary = list(statistics.vocabulary)
+        self.vocabulary += self.make_words(int(len(self.vocabulary) * (growth - 1)), set(self.vocabulary))
+        self.vocabulary = np.array(self.vocabulary, dtype=object)
+        self.word_cdf = self.zipf_cdf(len(self.vocabulary), statistics.zipf_exponent)
+
+        star_names = [name for name, _ in statistics.stars]
+        star_names += self.make_names(int(len(star_names) * (growth - 1)), set(star_names))
+        self.star_names = star_names
+        star_counts = np.array([count for _, count in statistics.stars], dtype=np.float64)
+        self.star_cdf = self.zipf_cdf(len(star_names), self.statistics.estimate_zipf_exponent(list(star_counts)))
+
+        self.genre_names = [genre for genre, _ in statistics.genres]
+        genre_weights = np.array([count for _, count in statistics.genres], dtype=np.float64)
+        self.genre_probabilities = genre_weights / genre_weights.sum() if len(genre_weights) else genre_weights
+
+    @staticmethod
+    def zipf_cdf(size, exponent):
+        weights = 1.0 / np.arange(1, size + 1) ** exponent
+        cdf = np.cumsum(weights)
+        return cdf / cdf[-1]
+
+    def sample_ranks(self, cdf, count):
+        return np.searchsorted(cdf, self.rng.random(count))
+
+    def make_words(self, count, existing):
+        words = []
+        while len(words) < count:
+            word = "".join(self.rng.choice(SYLLABLES, size=self.rng.integers(2, 5)))
+            if word not in existing:
+                existing.add(word)
+                words.append(word)
+        return words
+
+    def make_names(self, count, existing):
+        names = []
+        first_names = self.statistics.first_names or ["Alex"]
+        last_names = self.statistics.last_names or ["Smith"]
+        attempts = 0
+        while len(names) < count:
+            attempts += 1
+            last = self.rng.choice(last_names)
+            if attempts > 10 * count:
+                # the crawled names are exhausted, make up new last names
+                last = "".join(self.rng.choice(SYLLABLES, size=3)).capitalize()
+            name = f"{self.rng.choice(first_names)} {last}"
+            if name not in existing:
+                existing.add(name)
+                names.append(name)
+        return names
+
+    def sample(self, values, default=None):
+        if len(values) == 0:
+            return default
+        return values[self.rng.integers(len(values))]
+
+    def make_text(self, length):
+        """
+        Returns a text of length Zipf-sampled words, split into sentences.
+        """
+        length = max(int(length), 1)
+        words = self.vocabulary[self.sample_ranks(self.word_cdf, length)].tolist()
+        # sentences of 8 to 24 words, enough of them to cover the text
+        boundaries = np.cumsum(self.rng.integers(8, 25, size=length // 8 + 1)).tolist()
+        sentences = []
+        position = 0
+        for boundary in boundaries:
+            if position >= length:
+                break
+            sentences.append(" ".join(words[position:boundary]).capitalize() + ".")
+            position = boundary
+        return " ".join(sentences)
+
+    def make_texts(self, field):
+        count = self.sample(self.statistics.list_lengths[field], 1)
+        return [self.make_text(self.sample(self.statistics.text_lengths[field], 50)) for _ in range(count)]
+
+    def get_id(self, number):
+        return f"tt{90000000 + number}"
+
+    def generate(self, count=None):
+        """
+        Generates the movies one at a time.
+
+        Parameters
+        ----------
+        count : int
+            The number of movies. Defaults to scale times the number of crawled movies.
+
+        Yields
+        ------
+        dict
+            A movie in the format of IMDB_Crawled.json.
+        """
+        count = count if count is not None else self.movie_count
+        # preferential attachment: every movie is in the pool once, plus once per link it received,
+        # so a uniform draw from the pool picks a movie with probability proportional to 1 + in-degree
+        attachment_pool = list(range(count))
+        for number in range(count):
+            stars = [
+                self.star_names[rank]
+                for rank in np.unique(self.sample_ranks(self.star_cdf, self.sample(self.statistics.star_list_lengths, 5)))
+            ]
+            genre_count = min(max(self.sample(self.statistics.genre_list_lengths, 1), 1), len(self.genre_names))
+            genres = list(self.rng.choice(self.genre_names, size=genre_count, replace=False, p=self.genre_probabilities)) if genre_count else []
+
+            link_count = min(self.sample(self.statistics.related_link_counts, 12), count - 1)
+            links = set()
+            while len(links) < link_count:
+                link = attachment_pool[self.rng.integers(len(attachment_pool))]
+                if link != number:
+                    links.add(link)
+            attachment_pool.extend(links)
+            related_links = [self.get_id(link) for link in links]
+
+            summaries = self.make_texts("summaries")
+            reviews = [
+                [self.make_text(self.sample(self.statistics.text_lengths["reviews"], 100)), self.sample(self.statistics.review_scores, "")]
+                for _ in range(self.sample(self.statistics.list_lengths["reviews"], 5))
+            ]
+            yield {
+                "id": self.get_id(number),
+                "title": self.make_text(self.rng.integers(1, 5)).rstrip(".").title(),
+                "first_page_summary": summaries[0] if summaries else "",
+                "release_year": self.sample(self.statistics.values["release_year"]),
+                "mpaa": self.sample(self.statistics.values["mpaa"]),
+                "budget": self.sample(self.statistics.values["budget"]),
+                "gross_worldwide": self.sample(self.statistics.values["gross_worldwide"]),
+                "rating": self.sample(self.statistics.values["rating"]),
+                "directors": self.make_names(1, set()),
+                "writers": self.make_names(int(self.rng.integers(1, 3)), set()),
+                "stars": stars,
+                "related_links": related_links,
+                "genres": [str(genre) for genre in genres],
+                "languages": self.sample(self.statistics.languages, ["English"]),
+                "countries_of_origin": self.sample(self.statistics.countries, ["United States"]),
+                "summaries": summaries,
+                "synopsis": self.make_texts("synopsis"),
+                "reviews": reviews,
+            }
+
+    def write(self, path, count=None, jsonl=False):
+        """
+        Streams the generated movies to a file, one movie at a time.
+
+        Parameters
+        ----------
+        path : str
+            The output file.
+        count : int
+            The number of movies. Defaults to scale times the number of crawled movies.
+        jsonl : bool
+            Write one JSON object per line instead of a JSON list (the format of IMDB_Crawled.json).
+
+        Returns
+        -------
+        int
+            The number of movies written.
+        """
+        written = 0
+        with open(path, "w") as file:
+            if not jsonl:
+                file.write("[\n")
+            for movie in self.generate(count):
+                if not jsonl and written > 0:
+                    file.write(",\n")
+                file.write(json.dumps(movie))
+                if jsonl:
+                    file.write("\n")
+                written += 1
+            if not jsonl:
+                file.write("\n]\n")
+        return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic IMDb-like corpus for scale testing")
+    parser.add_argument("--source", default=os.getcwd() + "/Logic/tests/CrawlerResults/IMDB_Crawled.json")
+    parser.add_argument("--output", default=os.getcwd() + "/Logic/tests/CrawlerResults/IMDB_Synthetic.json")
+    parser.add_argument("--scale", type=float, default=10, help="size relative to the crawled corpus")
+    parser.add_argument("--count", type=int, help="number of movies, overrides --scale")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jsonl", action="store_true", help="write one movie per line")
+    args = parser.parse_args()
+
+    source = args.source
+    if not os.path.exists(source):
+        source = os.getcwd() + "/Logic/tests/CrawlerResults/IMDB_Crawled_Head.json"
+    with open(source, "r") as file:
+        statistics = CorpusStatistics(json.load(file))
+
+    scale = args.scale if args.count is None else args.count / statistics.movie_count
+    generator = SyntheticCorpusGenerator(statistics, scale=scale, seed=args.seed)
+    written = generator.write(args.output, args.count, jsonl=args.jsonl)
+    print(f"{written} movies written to {args.output}")
@@ -0,0 +1,120 @@
+import argparse
+import os
+import re
+import sys
+import time
+
+import nltk
+from nltk.stem import WordNetLemmatizer, PorterStemmer
+
+sys.path.append(os.getcwd() + "/Logic/core/utility/")
+from preprocess import Preprocessor, load_documents, preprocess_parallel
+
+FIELDS = ["genres", "summaries", "stars"]
+
+
+class LegacyPreprocessor(Preprocessor):
+    """
+    The pipeline before the fused normalization: ten re.sub passes per text and a regex compiled
+    per stopword per text, the stopwords removed after stemming, nltk.word_tokenize and no
+    normalization cache.
+    Kept to measure the speedup.
+    """
+
+    def __init__(self, documents: list):
+        super().__init__(documents)
+        # the old patterns, verbatim: "\b" is a backspace in a plain string, so none of them ever matched
+        self.legacy_stopwords = ["\bthis\b", "\bthat\b", "\babout\b", "\bwhom\b", "\bbeing\b", "\bwhere\b", "\bwhy\b", "\bhad\b", "\bshould\b", "\beach\b"]
+        self.stemmer = PorterStemmer()
+        self.lemmatizer = WordNetLemmatizer()
+
+    def normalize_token(self, token: str):
+        return self.lemmatizer.lemmatize(self.stemmer.stem(token))
+
+    def tokenize(self, text: str):
+        return nltk.word_tokenize(text)
+
+    def preprocess_text(self, text: str):
+        text = self.remove_links(text)
+        text = self.remove_punctuations(text)
+        text = self.normalize(text)
+        return self.remove_stopwords(text)
+
+    def remove_links(self, text: str):
+        patterns = [r'http\S*', r'www\S*', r'\S+\.com\S*', r'\S+\.org\S*', r'\S*@\S*']
+        clean_text = re.sub("<[^<]+?>", "", text)
+        for pattern in patterns:
+            clean_text = re.sub(pattern, "", clean_text)
+        return clean_text
+
+    def remove_punctuations(self, text: str):
+        text = re.sub(r"\n", " ", text)
+        text = re.sub(r"&#[0-9]+;", " ", text)
+        text = re.sub(r"[\u0080-\uffff]", " ", text)
+        text = re.sub(r"[^\w\s]", " ", text)
+        return text
+
+    def remove_stopwords(self, text: str):
+        for stopword in self.legacy_stopwords:
+            pattern = re.compile(stopword, re.IGNORECASE)
+            text = re.sub(pattern, "", text)
+        return text
+
+
+def time_pipeline(preprocessor, documents, cleaning_only=False, repeat=1):
+    """
+    Returns the best throughput in documents per second over repeat passes.
+
+    Parameters
+    ----------
+    preprocessor : Preprocessor
+        The preprocessor to time.
+    documents : list of dict
+        The crawled movies.
+    cleaning_only : bool
+        Only time link and punctuation removal, which is the part the regexes are used in.
+    repeat : int
+        The number of passes.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if cleaning_only:
+            for document in documents:
+                for field in FIELDS:
+                    for text in document[field] or []:
+                        preprocessor.remove_punctuations(preprocessor.remove_links(text))
+        else:
+            preprocessor.documents = documents
+            preprocessor.preprocess()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(documents) / best if best > 0 else float("inf")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the preprocessing throughput before and after the fused pipeline")
+    parser.add_argument("--corpus", default=os.getcwd() + "/Logic/tests/CrawlerResults/IMDB_Crawled.json")
+    parser.add_argument("--limit", type=int, help="only use the first N documents")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cleaning-only", action="store_true", help="skip tokenization, stemming and lemmatization")
+    parser.add_argument("--workers", type=int, nargs="*", default=[], help="also time preprocess_parallel with these numbers of processes")
+    args = parser.parse_args()
+
+    corpus = args.corpus
+    if not os.path.exists(corpus):
+        corpus = os.getcwd() + "/Logic/tests/CrawlerResults/IMDB_Crawled_Head.json"
+    documents = list(load_documents(corpus))[:args.limit]
+    print(f"{len(documents)} documents from {corpus}")
+
+    results = {}
+    for name, preprocessor in [("legacy", LegacyPreprocessor([])), ("fused", Preprocessor([]))]:
+        results[name] = time_pipeline(preprocessor, documents, args.cleaning_only, args.repeat)
+        print(f"{name:<8} {results[name]:10.1f} docs/sec")
+    print(f"speedup  {results['fused'] / results['legacy']:10.2f}x")
+
+    for num_workers in args.workers:
+        start = time.perf_counter()
+        preprocess_parallel(documents, os.devnull, num_workers)
+        throughput = len(documents) / (time.perf_counter() - start)
+        print(f"{num_workers:>2} procs {throughput:10.1f} docs/sec  ({throughput / results['fused']:.2f}x serial)")
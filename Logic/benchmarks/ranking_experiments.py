@@ -0,0 +1,464 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.getcwd() + "/Logic/core/")
+sys.path.append(os.getcwd() + "/Logic/core/utility/")
+from indexer.indexes_enum import Indexes
+from scorer import Scorer
+from evaluation import RelevanceMatrix, read_trec_qrels
+
+FIELDS = [Indexes.STARS, Indexes.GENRES, Indexes.SUMMARIES]
+
+SMART_METHODS = ["ltn.lnn", "ltc.lnc", "lnc.ltc", "nnc.nnc"]
+
+
+def make_configurations(
+    smart_methods=SMART_METHODS,
+    k1_values=(0.9, 1.2, 1.5, 2.0),
+    b_values=(0.25, 0.5, 0.75, 1.0),
+    alphas=(10.0, 100.0, 500.0, 1000.0, 2000.0),
+    lamdas=(0.1, 0.3, 0.5, 0.7, 0.9),
+):
+    """
+    Returns the scoring configurations of the grid: the SMART methods, OkapiBM25 and BM25F for
+    every k1 and b, unigram bayes for every alpha, mixture (maximum likelihood document model) for
+    every lamda and naive. The keys are arguments of SearchEngine.search.
+    """
+    configurations = [{"method": method} for method in smart_methods]
+    for method in ["OkapiBM25", "BM25F"]:
+        configurations += [{"method": method, "k1": k1, "b": b} for k1 in k1_values for b in b_values]
+    configurations += [{"method": "unigram", "smoothing_method": "bayes", "alpha": alpha} for alpha in alphas]
+    configurations += [
+        {"method": "unigram", "smoothing_method": "mixture", "alpha": 0.0, "lamda": lamda} for lamda in lamdas
+    ]
+    configurations.append({"method": "unigram", "smoothing_method": "naive"})
+    return configurations
+
+
+def make_weight_grid(values=(0, 1, 2)):
+    """
+    Returns every combination of the values as field weights, except all zeros.
+    """
+    return [
+        dict(zip(FIELDS, combination))
+        for combination in itertools.product(values, repeat=len(FIELDS))
+        if any(combination)
+    ]
+
+
+def get_name(configuration, weights):
+    """
+    Returns the name of a configuration and its field weights in the leaderboard.
+    """
+    parameters = " ".join(f"{key}={value}" for key, value in configuration.items() if key != "method")
+    fields = " ".join(f"{field.value}={weights[field]}" for field in FIELDS)
+    return f"{configuration['method']} {parameters}".strip() + f" | {fields}"
+
+
+def load_queries(path):
+    """
+    Reads the queries of the experiment, one "query_id<TAB>query" per line. Empty lines and lines
+    starting with # are skipped.
+
+    Returns
+    -------
+    dict
+        The query of each query id, in the order of the file.
+    """
+    queries = {}
+    with open(path, "r") as file:
+        for line in file:
+            if not line.strip() or line.startswith("#"):
+                continue
+            query_id, query = line.rstrip("\n").split("\t", 1)
+            queries[query_id] = query
+    return queries
+
+
+class PreparedQuery:
+    def __init__(self, search_engine, query, relevance=None):
+        """
+        Everything the scoring and the evaluation of a query need, fetched from the indexes and
+        the judgments once.
+
+        The candidates are the documents containing a query term in any field, sorted by id. For
+        each field, the tfs of the query terms in the candidates are a terms x candidates matrix,
+        along with the document frequencies of the terms and the lengths of the candidates.
+
+        Parameters
+        ----------
+        search_engine : SearchEngine
+            The engine whose indexes and query analyzer are used.
+        query : str
+            The query to prepare.
+        relevance : dict, optional
+            The relevance of the judged documents, looked up once for all the candidates.
+        """
+        self.search_engine = search_engine
+        query_tfs = {}
+        for term in search_engine.query_analyzer.analyze(query):
+            query_tfs[term] = query_tfs.get(term, 0) + 1
+        self.terms = list(query_tfs)
+        self.query_tfs = np.array([query_tfs[term] for term in self.terms], dtype=np.float64)
+
+        indexes = [search_engine.document_indexes[field.value].index for field in FIELDS]
+        candidates = set()
+        for index in indexes:
+            for term in self.terms:
+                candidates.update(index.get(term, {}).keys())
+        self.candidates = np.array(sorted(candidates), dtype=object)
+        positions = {document_id: position for position, document_id in enumerate(self.candidates)}
+
+        self.tfs = np.zeros((len(FIELDS), len(self.terms), len(self.candidates)))
+        self.dfs = np.zeros((len(FIELDS), len(self.terms)))
+        self.lengths = np.full((len(FIELDS), len(self.candidates)), np.nan)
+        for i, (field, index) in enumerate(zip(FIELDS, indexes)):
+            for j, term in enumerate(self.terms):
+                postings = index.get(term, {})
+                self.dfs[i, j] = len(postings)
+                for document_id, tf in postings.items():
+                    self.tfs[i, j, positions[document_id]] = tf
+            document_lengths = search_engine.document_lengths_index[field.value].index
+            for position, document_id in enumerate(self.candidates):
+                length = document_lengths.get(document_id, None)
+                if length is not None:
+                    self.lengths[i, position] = length
+        self.present = self.tfs > 0
+        self.document_norms = {}
+        relevance = relevance or {}
+        self.gains = np.array([max(relevance.get(document_id, 0), 0) for document_id in self.candidates], dtype=np.float64)
+
+    def get_document_norms(self, field_position, document_method):
+        """
+        Returns the cosine normalization length of every candidate in a field, 0 if unknown.
+        """
+        key = (field_position, document_method[:2])
+        norms = self.document_norms.get(key, None)
+        if norms is None:
+            field = FIELDS[field_position]
+            scorer = Scorer(
+                self.search_engine.document_indexes[field.value].index,
+                self.search_engine.metadata_index.index["document_count"],
+                document_norms=self.search_engine.document_norms[field.value],
+            )
+            field_norms = scorer.get_document_norms(document_method)
+            norms = np.array([field_norms.get(document_id, 0.0) for document_id in self.candidates])
+            self.document_norms[key] = norms
+        return norms
+
+
+class ExperimentGrid:
+    def __init__(self, search_engine, queries, qrels, max_results=100):
+        """
+        Evaluates a grid of ranking configurations (method, parameters and field weights) with
+        safe ranking, without running a search per configuration.
+
+        The postings of each query are fetched once (PreparedQuery). Each scoring configuration
+        then computes the raw score of every candidate in every field with array operations, and
+        the field weights are applied to these fields x candidates scores with one matrix product
+        for all the weight vectors. The rankings are the ones of SearchEngine.search, except that
+        ties are broken by document id.
+
+        Parameters
+        ----------
+        search_engine : SearchEngine
+            The engine whose indexes and query analyzer are used.
+        queries : dict
+            The query of each query id.
+        qrels : dict
+            The relevance judgments, {query_id: {document_id: relevance}}. Queries without
+            judgments are not evaluated.
+        max_results : int
+            The depth of the rankings.
+        """
+        self.search_engine = search_engine
+        self.query_ids = [query_id for query_id in queries if query_id in qrels]
+        self.queries = [queries[query_id] for query_id in self.query_ids]
+        self.actual = [qrels[query_id] for query_id in self.query_ids]
+        self.max_results = max_results
+        self.number_of_documents = search_engine.metadata_index.index["document_count"]
+        average_lengths = search_engine.metadata_index.index["averge_document_length"]
+        self.average_lengths = np.array([average_lengths[field.value] or 1.0 for field in FIELDS])
+        self.timings = {}
+
+    def get_smart_scores(self, prepared, method):
+        """
+        Returns the vector space model scores of the candidates in every field (fields x candidates).
+        """
+        document_method, query_method = method.split(".")
+        scores = np.zeros((len(FIELDS), len(prepared.candidates)))
+        for i in range(len(FIELDS)):
+            dfs = prepared.dfs[i]
+            idfs = np.log(self.number_of_documents / np.maximum(dfs, 1)) * (dfs > 0)
+            tfs = prepared.tfs[i]
+            document_weights = tfs if document_method[0] == "n" else np.where(
+                prepared.present[i], 1 + np.log(np.maximum(tfs, 1)), 0.0
+            )
+            if document_method[1] == "t":
+                document_weights = document_weights * idfs[:, None]
+            query_weights = prepared.query_tfs if query_method[0] == "n" else 1 + np.log(prepared.query_tfs)
+            if query_method[1] == "t":
+                query_weights = query_weights * idfs
+            scores[i] = query_weights @ document_weights
+            query_norm = np.sqrt(np.sum(query_weights * query_weights))
+            if query_method[2] == "c" and query_norm > 0:
+                scores[i] /= query_norm
+            if document_method[2] == "c":
+                norms = prepared.get_document_norms(i, document_method)
+                scores[i] = np.where(norms > 0, scores[i] / np.where(norms > 0, norms, 1.0), scores[i])
+        return scores
+
+    def get_bm25_scores(self, prepared, k1, b):
+        """
+        Returns the Okapi BM25 scores of the candidates in every field (fields x candidates).
+        """
+        scores = np.zeros((len(FIELDS), len(prepared.candidates)))
+        for i, field in enumerate(FIELDS):
+            field_b = b[field] if isinstance(b, dict) else b
+            dfs = prepared.dfs[i]
+            idfs = np.log((self.number_of_documents - dfs + 0.5) / (dfs + 0.5) + 1)
+            lengths = np.where(np.isnan(prepared.lengths[i]), self.average_lengths[i], prepared.lengths[i])
+            normalization = k1 * (1 - field_b + field_b * lengths / self.average_lengths[i])
+            tfs = prepared.tfs[i]
+            saturated = np.zeros_like(tfs)
+            np.divide(tfs * (k1 + 1), tfs + normalization, out=saturated, where=prepared.present[i])
+            scores[i] = (prepared.query_tfs * idfs) @ saturated
+        return scores
+
+    def get_unigram_scores(self, prepared, smoothing_method, alpha, lamda):
+        """
+        Returns the unigram scores of the candidates in every field, and which candidates have a
+        score in each field.
+        """
+        scores = np.zeros((len(FIELDS), len(prepared.candidates)))
+        scored = np.zeros((len(FIELDS), len(prepared.candidates)), dtype=bool)
+        for i, field in enumerate(FIELDS):
+            model = self.search_engine.get_collection_model(field)
+            mu, field_lamda, uniform_background = model.get_smoothing_parameters(smoothing_method, alpha, lamda)
+            # the terms out of the field and the documents without a length are ignored, as in CollectionModel.score
+            in_field = np.array([term in model.collection_probabilities for term in prepared.terms], dtype=bool)
+            known = ~np.isnan(prepared.lengths[i])
+            if not known.any():
+                continue
+            scored[i] = known
+            if uniform_background:
+                collection_probabilities = np.full(len(prepared.terms), 1.0 / model.vocabulary_size)
+            else:
+                collection_probabilities = np.array(
+                    [model.collection_probabilities.get(term, 1.0) for term in prepared.terms]
+                )
+            query_tfs = prepared.query_tfs * in_field
+            lengths = prepared.lengths[i][known]
+            tfs = prepared.tfs[i][:, known]
+            denominators = np.maximum(lengths + mu, 1e-12)
+            background = (field_lamda * mu + (1 - field_lamda) * (lengths + mu)) / denominators
+            if uniform_background or field_lamda < 1 or mu > 0:
+                field_scores = query_tfs.sum() * np.log(np.maximum(background, 1e-300))
+                # only the postings are updated, an empty document may have no background mass
+                ratios = np.zeros_like(tfs)
+                np.divide(
+                    field_lamda * tfs,
+                    denominators * collection_probabilities[:, None] * background,
+                    out=ratios,
+                    where=tfs > 0,
+                )
+                field_scores = field_scores + query_tfs @ np.log1p(ratios)
+            else:
+                # unsmoothed maximum likelihood: the documents lacking a term get no score in the field
+                present = tfs > 0
+                logs = np.log(np.where(present, tfs, 1.0) / denominators)
+                field_scores = query_tfs @ (logs * present)
+                missing = (~present[in_field]).any(axis=0)
+                field_scores[missing] = 0.0
+                scored[i][np.flatnonzero(known)[missing]] = False
+            scores[i][known] = field_scores
+        return scores, scored
+
+    def get_bm25f_scores(self, prepared, weights, k1, b):
+        """
+        Returns the BM25F scores of the candidates for every weight vector (weights x candidates),
+        and which candidates are retrieved, i.e. contain a term in a field with a non-zero weight.
+        """
+        normalized = np.zeros_like(prepared.tfs)
+        for i, field in enumerate(FIELDS):
+            field_b = b[field] if isinstance(b, dict) else b
+            lengths = np.where(np.isnan(prepared.lengths[i]), self.average_lengths[i], prepared.lengths[i])
+            np.divide(
+                prepared.tfs[i],
+                1 - field_b + field_b * lengths / self.average_lengths[i],
+                out=normalized[i],
+                where=prepared.present[i],
+            )
+        pseudo_tfs = np.tensordot(weights, normalized, axes=1)
+        present = np.tensordot(weights != 0, prepared.present, axes=1) > 0
+        dfs = present.sum(axis=2)
+        idfs = np.log((self.number_of_documents - dfs + 0.5) / (dfs + 0.5) + 1)
+        saturated = np.where(present, pseudo_tfs / (k1 + np.where(present, pseudo_tfs, 1.0)), 0.0)
+        scores = np.einsum("t,wt,wtc->wc", prepared.query_tfs, idfs, saturated)
+        return scores, present.any(axis=1)
+
+    def score(self, prepared, configuration, weights):
+        """
+        Returns the scores of the candidates of a prepared query for every weight vector
+        (weights x candidates), and which candidates are retrieved.
+        """
+        method = configuration["method"]
+        k1 = configuration.get("k1", 1.2)
+        b = configuration.get("b", 0.75)
+        if method == "BM25F":
+            return self.get_bm25f_scores(prepared, weights, k1, b)
+        retrieved = np.ones((len(weights), len(prepared.candidates)), dtype=bool)
+        if method == "OkapiBM25":
+            field_scores = self.get_bm25_scores(prepared, k1, b)
+        elif method == "unigram":
+            field_scores, scored = self.get_unigram_scores(
+                prepared,
+                configuration.get("smoothing_method", None),
+                configuration.get("alpha", 0.5),
+                configuration.get("lamda", 0.5),
+            )
+            # the unigram candidates only come from the fields with a non-zero weight, and are only
+            # retrieved if one of these fields scores them
+            weighted = weights != 0
+            retrieved = (weighted @ prepared.present.any(axis=1) > 0) & (weighted @ scored > 0)
+        else:
+            field_scores = self.get_smart_scores(prepared, method)
+        return weights @ field_scores, retrieved
+
+    def rank(self, scores, retrieved):
+        """
+        Ranks the retrieved candidates of every row of scores.
+
+        Returns
+        -------
+        tuple
+            (positions, counts): the positions in the candidates of the first max_results of each
+            row, and the number of them that are retrieved.
+        """
+        scores = np.where(retrieved, scores, -np.inf)
+        positions = np.argsort(-scores, axis=1, kind="stable")[:, :self.max_results]
+        counts = np.minimum(retrieved.sum(axis=1), self.max_results)
+        return positions, counts
+
+    def get_ranking(self, query, configuration, weights):
+        """
+        Returns the ranked document ids of one query for one configuration and weights, e.g. to
+        look at the results of the best configuration of the leaderboard.
+        """
+        prepared = PreparedQuery(self.search_engine, query)
+        if len(prepared.candidates) == 0:
+            return []
+        weights = np.array([[weights[field] for field in FIELDS]], dtype=np.float64)
+        positions, counts = self.rank(*self.score(prepared, configuration, weights))
+        return prepared.candidates[positions[0][:counts[0]]].tolist()
+
+    def run(self, configurations, weight_grid, ks=(None, 5, 10), sort_by="AP", verbose=True):
+        """
+        Evaluates every configuration with every weight vector.
+
+        The queries are prepared once. For each configuration, the gains of the ranked candidates
+        of every weight vector are gathered from the gains of the candidates, and the metrics are
+        computed with RelevanceMatrix.from_gains.
+
+        Parameters
+        ----------
+        configurations : List[dict]
+            The scoring configurations, see make_configurations.
+        weight_grid : List[dict]
+            The field weights, see make_weight_grid.
+        ks : iterable
+            The cutoffs of the metrics, None for the whole ranking.
+        sort_by : str
+            The metric the leaderboard is sorted by, e.g. "AP" or "NDCG@10".
+        verbose : bool
+            Whether to print the timings.
+
+        Returns
+        -------
+        List[dict]
+            The leaderboard: the name, configuration, weights and mean metrics of each
+            combination, best first.
+        """
+        weights = np.array([[weights[field] for field in FIELDS] for weights in weight_grid], dtype=np.float64)
+        ideal = [sorted((gain for gain in relevance.values() if gain > 0), reverse=True) for relevance in self.actual]
+        ideal_gains = np.zeros((len(ideal), max([self.max_results] + [len(gains) for gains in ideal])))
+        for query, gains in enumerate(ideal):
+            ideal_gains[query, :len(gains)] = gains
+
+        self.timings = {"preparation": 0.0, "scoring": 0.0, "evaluation": 0.0}
+        start = time.perf_counter()
+        prepared_queries = [
+            PreparedQuery(self.search_engine, query, relevance) for query, relevance in zip(self.queries, self.actual)
+        ]
+        self.timings["preparation"] = time.perf_counter() - start
+
+        leaderboard = []
+        for configuration in configurations:
+            start = time.perf_counter()
+            gains = np.zeros((len(weight_grid), len(prepared_queries), self.max_results))
+            num_retrieved = np.zeros((len(weight_grid), len(prepared_queries)))
+            for query, prepared in enumerate(prepared_queries):
+                if len(prepared.candidates) == 0:
+                    continue
+                positions, counts = self.rank(*self.score(prepared, configuration, weights))
+                ranked_gains = prepared.gains[positions]
+                ranked_gains[np.arange(positions.shape[1]) >= counts[:, None]] = 0
+                gains[:, query, :positions.shape[1]] = ranked_gains
+                num_retrieved[:, query] = counts
+            self.timings["scoring"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            for j, field_weights in enumerate(weight_grid):
+                metrics = RelevanceMatrix.from_gains(gains[j], ideal_gains, num_retrieved[j]).evaluate(ks)
+                row = {
+                    "name": get_name(configuration, field_weights),
+                    "configuration": configuration,
+                    "weights": {field.value: field_weights[field] for field in FIELDS},
+                }
+                row.update({metric: float(values.mean()) for metric, values in metrics.items()})
+                leaderboard.append(row)
+            self.timings["evaluation"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        leaderboard.sort(key=lambda row: row[sort_by], reverse=True)
+        self.timings["evaluation"] += time.perf_counter() - start
+        if verbose:
+            print(
+                f"{len(leaderboard)} configurations on {len(self.queries)} queries: "
+                + "  ".join(f"{stage} {elapsed:.2f} s" for stage, elapsed in self.timings.items())
+            )
+        return leaderboard
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate a grid of ranking configurations")
+    parser.add_argument("--queries", required=True, help="one query_id<TAB>query per line")
+    parser.add_argument("--qrels", required=True, help="the relevance judgments in the TREC qrels format")
+    parser.add_argument("--max-results", type=int, default=100)
+    parser.add_argument("--k", type=int, nargs="*", default=[5, 10], help="the cutoffs of the metrics")
+    parser.add_argument("--weight-values", type=float, nargs="*", default=[0, 1, 2])
+    parser.add_argument("--sort-by", default="AP")
+    parser.add_argument("--top", type=int, default=20, help="the number of configurations printed")
+    parser.add_argument("--output", help="where to write the JSON leaderboard")
+    args = parser.parse_args()
+
+    from search import SearchEngine
+
+    search_engine = SearchEngine(preload=True)
+    grid = ExperimentGrid(
+        search_engine, load_queries(args.queries), read_trec_qrels(args.qrels), max_results=args.max_results
+    )
+    leaderboard = grid.run(make_configurations(), make_weight_grid(args.weight_values), [None] + args.k, args.sort_by)
+    metrics = [metric for metric in leaderboard[0] if metric not in ("name", "configuration", "weights")]
+    print(f"{'rank':<5}{'configuration':<70}" + "".join(f"{metric:>10}" for metric in metrics))
+    for rank, row in enumerate(leaderboard[:args.top], 1):
+        print(f"{rank:<5}{row['name']:<70}" + "".join(f"{row[metric]:10.4f}" for metric in metrics))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"timings_s": grid.timings, "leaderboard": leaderboard}, file, indent=4)
@@ -0,0 +1,311 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.getcwd() + "/Logic/core/")
+from indexer.indexes_enum import Indexes
+from search_trace import TraceRecorder
+
+SMART_METHODS = ["ltn.lnn", "ltc.lnc", "lnc.ltc", "nnc.nnc"]
+
+CONFIGURATIONS = (
+    [
+        {"name": f"{method}/{'safe' if safe else 'unsafe'}", "method": method, "safe_ranking": safe}
+        for method in SMART_METHODS + ["OkapiBM25"]
+        for safe in (True, False)
+    ]
+    + [{"name": "BM25F", "method": "BM25F", "safe_ranking": True}]
+    + [
+        {"name": "unigram/bayes", "method": "unigram", "safe_ranking": True,
+         "smoothing_method": "bayes", "alpha": 1000.0},
+        {"name": "unigram/naive", "method": "unigram", "safe_ranking": True,
+         "smoothing_method": "naive"},
+        {"name": "unigram/mixture", "method": "unigram", "safe_ranking": True,
+         "smoothing_method": "mixture", "alpha": 0.5, "lamda": 0.5},
+    ]
+)
+
+DEFAULT_WEIGHTS = {Indexes.STARS: 1, Indexes.GENRES: 1, Indexes.SUMMARIES: 1}
+
+
+def load_queries(path):
+    """
+    Reads a query log with one query per line. Empty lines and lines starting with # are skipped.
+
+    Parameters
+    ----------
+    path : str
+        The path of the query log.
+
+    Returns
+    -------
+    List[str]
+        The queries.
+    """
+    with open(path, "r") as file:
+        return [line.strip() for line in file if line.strip() and not line.startswith("#")]
+
+
+def get_max_rss_kb():
+    """
+    Returns the peak resident set size of the process in KB, or None where it is not available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB on Linux
+    return max_rss / 1024 if sys.platform == "darwin" else max_rss
+
+
+class SearchBenchmark:
+    def __init__(self, search_engine, queries, weights=None, repeat=3, warmup=1, max_results=10):
+        """
+        Replays a query log through SearchEngine.search for each configuration.
+
+        Parameters
+        ----------
+        search_engine : SearchEngine
+            The engine to benchmark.
+        queries : List[str]
+            The query log.
+        weights : dict
+            The weights of the fields.
+        repeat : int
+            The number of timed passes over the query log per configuration.
+        warmup : int
+            The number of untimed passes before timing, so lazily built structures (collection
+            models, document norms) are not counted as query latency.
+        max_results : int
+            The number of results requested per query.
+        """
+        self.search_engine = search_engine
+        self.queries = queries
+        self.weights = weights if weights is not None else DEFAULT_WEIGHTS
+        self.repeat = repeat
+        self.warmup = warmup
+        self.max_results = max_results
+
+    def search(self, query, configuration):
+        return self.search_engine.search(
+            query,
+            configuration["method"],
+            self.weights,
+            safe_ranking=configuration.get("safe_ranking", True),
+            max_results=self.max_results,
+            smoothing_method=configuration.get("smoothing_method", None),
+            alpha=configuration.get("alpha", 0.5),
+            lamda=configuration.get("lamda", 0.5),
+        )
+
+    def run_configuration(self, configuration, measure_memory=False, stages=True):
+        """
+        Benchmarks one configuration.
+
+        Parameters
+        ----------
+        configuration : dict
+            The method, safe_ranking and smoothing parameters.
+        measure_memory : bool
+            Whether to run an extra pass under tracemalloc to find the peak memory allocated
+            while searching. It is a separate pass because tracemalloc slows every allocation.
+        stages : bool
+            Whether to run an extra traced pass to report the mean time of each search stage.
+
+        Returns
+        -------
+        dict
+            The latency percentiles in milliseconds, the throughput and the memory usage.
+        """
+        try:
+            for _ in range(self.warmup):
+                for query in self.queries:
+                    self.search(query, configuration)
+        except Exception as e:
+            return {"configuration": configuration, "error": f"{type(e).__name__}: {e}"}
+
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(self.repeat):
+            for query in self.queries:
+                query_start = time.perf_counter()
+                self.search(query, configuration)
+                latencies.append(time.perf_counter() - query_start)
+        elapsed = time.perf_counter() - start
+        latencies = np.array(latencies) * 1e3
+
+        report = {
+            "configuration": configuration,
+            "queries": len(latencies),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "mean_ms": float(latencies.mean()),
+            "max_ms": float(latencies.max()),
+            "qps": len(latencies) / elapsed if elapsed > 0 else None,
+            "max_rss_kb": get_max_rss_kb(),
+        }
+
+        if stages:
+            recorder = TraceRecorder(max_traces=len(self.queries))
+            previous_hook = self.search_engine.trace_hook
+            self.search_engine.set_trace_hook(recorder)
+            try:
+                for query in self.queries:
+                    self.search(query, configuration)
+            finally:
+                self.search_engine.set_trace_hook(previous_hook)
+            summary = recorder.summary()
+            report["stages_ms"] = summary["stages_ms"]
+            report["counts"] = summary["counts"]
+
+        if measure_memory:
+            tracemalloc.start()
+            try:
+                for query in self.queries:
+                    self.search(query, configuration)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            report["peak_traced_memory_kb"] = peak / 1024
+        return report
+
+    def run(self, configurations=CONFIGURATIONS, measure_memory=False, stages=True, verbose=True):
+        """
+        Benchmarks every configuration.
+
+        Returns
+        -------
+        dict
+            The environment and the report of each configuration, keyed by its name.
+        """
+        results = {}
+        for configuration in configurations:
+            report = self.run_configuration(configuration, measure_memory, stages)
+            results[configuration["name"]] = report
+            if verbose:
+                print(format_report_line(configuration["name"], report))
+        return {
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "query_count": len(self.queries),
+            "repeat": self.repeat,
+            "max_results": self.max_results,
+            "results": results,
+        }
+
+
+def format_report_line(name, report):
+    if "error" in report:
+        return f"{name:<20} ERROR {report['error']}"
+    line = (
+        f"{name:<20} p50 {report['p50_ms']:8.3f} ms  p95 {report['p95_ms']:8.3f} ms  "
+        f"p99 {report['p99_ms']:8.3f} ms  {report['qps']:9.1f} q/s"
+    )
+    if "peak_traced_memory_kb" in report:
+        line += f"  peak {report['peak_traced_memory_kb']:9.1f} KB"
+    return line
+
+
+def compare_with_baseline(report, baseline, tolerance=0.2):
+    """
+    Compares a benchmark report with a saved baseline.
+
+    Parameters
+    ----------
+    report : dict
+        The current report.
+    baseline : dict
+        The baseline report.
+    tolerance : float
+        The allowed relative slowdown of p50/p95/p99 and drop of QPS.
+
+    Returns
+    -------
+    List[str]
+        A message for every regression. Empty if there is none.
+    """
+    regressions = []
+    for name, old in baseline["results"].items():
+        new = report["results"].get(name, None)
+        if new is None or "error" in old:
+            continue
+        if "error" in new:
+            regressions.append(f"{name}: now fails with {new['error']}")
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if new[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {old[metric]:.3f} -> {new[metric]:.3f}")
+        if old.get("qps") and new.get("qps") and new["qps"] < old["qps"] * (1 - tolerance):
+            regressions.append(f"{name}: qps {old['qps']:.1f} -> {new['qps']:.1f}")
+        if old.get("peak_traced_memory_kb") and new.get("peak_traced_memory_kb"):
+            if new["peak_traced_memory_kb"] > old["peak_traced_memory_kb"] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: peak memory {old['peak_traced_memory_kb']:.1f} KB -> {new['peak_traced_memory_kb']:.1f} KB"
+                )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a query log through SearchEngine.search")
+    parser.add_argument("--queries", default=os.getcwd() + "/Logic/benchmarks/queries.txt")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--max-results", type=int, default=10)
+    parser.add_argument("--only", nargs="*", help="names of the configurations to run, e.g. BM25F ltn.lnn/safe")
+    parser.add_argument("--memory", action="store_true", help="also measure peak memory with tracemalloc")
+    parser.add_argument("--output", help="where to write the JSON report")
+    parser.add_argument("--save-baseline", action="store_true", help="write the report as the baseline")
+    parser.add_argument("--baseline", default=os.getcwd() + "/Logic/benchmarks/baselines/search.json")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    from search import SearchEngine
+
+    start = time.perf_counter()
+    search_engine = SearchEngine()
+    startup_time = time.perf_counter() - start
+    print(f"SearchEngine startup: {startup_time * 1e3:.1f} ms")
+    startup_report = search_engine.preload(groups=("index", "document_length", "metadata", "tiered"))
+    print(f"Index loading: {startup_report}")
+
+    configurations = CONFIGURATIONS
+    if args.only:
+        configurations = [c for c in CONFIGURATIONS if c["name"] in args.only]
+
+    benchmark = SearchBenchmark(
+        search_engine, load_queries(args.queries), repeat=args.repeat, warmup=args.warmup, max_results=args.max_results
+    )
+    report = benchmark.run(configurations, measure_memory=args.memory)
+    report["startup_ms"] = startup_time * 1e3
+    report["startup_report"] = startup_report
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=4)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+        print("No regressions against the baseline.")
@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.getcwd() + "/Logic/core/utility/")
+from spell_correction import SpellCorrection
+from symspell import SymSpell
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def misspell(word, edits, rng):
+    """
+    Applies random edits (deletion, insertion, substitution or transposition of adjacent letters)
+    to the word.
+    """
+    for _ in range(edits):
+        i = rng.randrange(len(word))
+        operation = rng.choice(["delete", "insert", "substitute", "transpose"])
+        if operation == "delete" and len(word) > 1:
+            word = word[:i] + word[i + 1:]
+        elif operation == "insert":
+            word = word[:i] + rng.choice(LETTERS) + word[i:]
+        elif operation == "substitute":
+            word = word[:i] + rng.choice(LETTERS) + word[i + 1:]
+        elif operation == "transpose" and i < len(word) - 1:
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word
+
+
+def make_misspellings(word_counter, count, max_edits=2, min_length=3, seed=0):
+    """
+    Samples words of the vocabulary by frequency, as they would appear in queries, and misspells
+    each with 1 to max_edits edits. Misspellings that are themselves in the vocabulary are skipped.
+
+    Returns
+    -------
+    List[tuple]
+        (misspelled word, correct word) pairs.
+    """
+    rng = random.Random(seed)
+    words = [word for word in word_counter if len(word) >= min_length and word.isalpha()]
+    weights = [word_counter[word] for word in words]
+    pairs = []
+    while len(pairs) < count:
+        word = rng.choices(words, weights)[0]
+        misspelled = misspell(word, rng.randint(1, max_edits), rng)
+        if misspelled not in word_counter:
+            pairs.append((misspelled, word))
+    return pairs
+
+
+def build(factory):
+    """
+    Returns the model built by factory, the build time and the memory it allocated.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    model = factory()
+    build_time = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return model, build_time, memory
+
+
+def evaluate(spell_corrector, pairs):
+    """
+    Returns the accuracy of spell_check, the accuracy of the five candidates of
+    find_nearest_words and the latencies of both in seconds.
+    """
+    top1 = top5 = 0
+    correction_latencies = []
+    candidates_latencies = []
+    for misspelled, word in pairs:
+        start = time.perf_counter()
+        correction = spell_corrector.spell_check(misspelled)
+        correction_latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        candidates = spell_corrector.find_nearest_words(misspelled)
+        candidates_latencies.append(time.perf_counter() - start)
+        top1 += correction == word
+        top5 += word in candidates
+    return top1 / len(pairs), top5 / len(pairs), np.array(correction_latencies), np.array(candidates_latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the Jaccard and the symmetric delete spell correction")
+    parser.add_argument("--corpus", default=os.getcwd() + "/Logic/Data/corpus_for_spell_correction.json")
+    parser.add_argument("--count", type=int, default=1000, help="the number of misspelled words")
+    parser.add_argument("--max-edits", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=256, help="the chunk size of the batch Jaccard")
+    parser.add_argument("--output", help="where to write the JSON report")
+    args = parser.parse_args()
+
+    with open(args.corpus, "r") as file:
+        corpus = json.load(file)
+    jaccard, jaccard_build, jaccard_memory = build(lambda: SpellCorrection(corpus))
+    # the SymSpell dictionary is built on top of the counts of SpellCorrection, only its own
+    # structures are measured
+    symspell, symspell_build, symspell_memory = build(lambda: SymSpell.from_spell_correction(jaccard))
+    pairs = make_misspellings(jaccard.word_counter, args.count, args.max_edits, seed=args.seed)
+    print(f"{len(jaccard.word_counter)} words, {len(pairs)} misspellings with up to {args.max_edits} edits")
+
+    report = {}
+    for name, spell_corrector, build_time, memory in [
+        ("jaccard", jaccard, jaccard_build, jaccard_memory),
+        ("symspell", symspell, symspell_build, symspell_memory),
+    ]:
+        top1, top5, correction_latencies, candidates_latencies = evaluate(spell_corrector, pairs)
+        report[name] = {
+            "accuracy@1": top1,
+            "accuracy@5": top5,
+            "build_s": build_time,
+            "memory_mb": memory / 2 ** 20,
+        }
+        for stage, latencies in [("correction", correction_latencies), ("candidates", candidates_latencies)]:
+            report[name][stage] = {
+                "mean_ms": float(latencies.mean() * 1e3),
+                "p50_ms": float(np.percentile(latencies, 50) * 1e3),
+                "p95_ms": float(np.percentile(latencies, 95) * 1e3),
+            }
+        print(
+            f"{name:<9} acc@1 {top1:6.1%}  acc@5 {top5:6.1%}  build {build_time:5.2f} s  "
+            f"memory {report[name]['memory_mb']:6.1f} MB"
+        )
+        for stage in ["correction", "candidates"]:
+            latencies = report[name][stage]
+            print(
+                f"          {stage:<10} mean {latencies['mean_ms']:7.3f} ms  p50 {latencies['p50_ms']:7.3f} ms  "
+                f"p95 {latencies['p95_ms']:7.3f} ms"
+            )
+
+    # the same candidates as jaccard's find_nearest_words, for all the words at once
+    misspelled_words = [misspelled for misspelled, _ in pairs]
+    start = time.perf_counter()
+    batch_candidates = jaccard.find_nearest_words_batch(misspelled_words, chunk_size=args.chunk_size)
+    batch_time = time.perf_counter() - start
+    report["jaccard_batch"] = {
+        "accuracy@5": sum(word in candidates for (_, word), candidates in zip(pairs, batch_candidates)) / len(pairs),
+        "words_per_s": len(pairs) / batch_time,
+        "speedup": report["jaccard"]["candidates"]["mean_ms"] * 1e-3 * len(pairs) / batch_time,
+    }
+    print(
+        f"jaccard batch  {report['jaccard_batch']['words_per_s']:8.0f} words/s  "
+        f"({report['jaccard_batch']['speedup']:.1f}x find_nearest_words)"
+    )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
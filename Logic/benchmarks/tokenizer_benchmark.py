@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.getcwd() + "/Logic/core/utility/")
+from preprocess import Preprocessor, load_documents
+from tokenizer import TOKENIZERS
+
+FIELDS = ["genres", "summaries", "stars"]
+
+
+def time_tokenizer(tokenizer, texts, repeat=3):
+    """
+    Returns the best time in seconds to tokenize all the texts over repeat passes.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            tokenizer(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare nltk.word_tokenize with the fast tokenizer")
+    parser.add_argument("--corpus", default=os.getcwd() + "/Logic/tests/CrawlerResults/IMDB_Crawled.json")
+    parser.add_argument("--queries", default=os.getcwd() + "/Logic/benchmarks/queries.txt")
+    parser.add_argument("--limit", type=int, help="only use the first N documents")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = args.corpus
+    if not os.path.exists(corpus):
+        corpus = os.getcwd() + "/Logic/tests/CrawlerResults/IMDB_Crawled_Head.json"
+    documents = list(load_documents(corpus))[:args.limit]
+    preprocessor = Preprocessor([])
+
+    # the indexing path tokenizes the cleaned, lower cased fields
+    clean = lambda text: preprocessor.remove_punctuations(preprocessor.remove_links(text)).lower()
+    texts = [clean(text) for document in documents for field in FIELDS for text in document[field] or []]
+    with open(args.queries, "r") as file:
+        queries = [clean(line.strip()) for line in file if line.strip() and not line.startswith("#")]
+
+    print(f"{len(documents)} documents ({len(texts)} texts) from {corpus}, {len(queries)} queries")
+    results = {}
+    for name, tokenizer in TOKENIZERS.items():
+        indexing = time_tokenizer(tokenizer, texts, args.repeat)
+        querying = time_tokenizer(tokenizer, queries, args.repeat * 100) / len(queries)
+        results[name] = (indexing, querying)
+        print(f"{name:<5} indexing {len(documents) / indexing:10.1f} docs/sec   query {querying * 1e6:8.2f} us/query")
+    print(
+        f"speedup indexing {results['nltk'][0] / results['fast'][0]:.1f}x, "
+        f"query {results['nltk'][1] / results['fast'][1]:.1f}x"
+    )
@@ -156,7 +156,7 @@ class Index:
         
         # stars
         term_freq = dict()
-        for star in document["stars"]:
+        for star in document["stars"] or []:
             star_splitted = star.split()
             for term in star_splitted:
                 if term not in self.index["stars"]: # TODO: probable bug
@@ -174,7 +174,7 @@ class Index:
         
         # genres
         term_freq = dict()
-        for genre in document["genres"]:
+        for genre in document["genres"] or []:
             genre_splitted = genre.split()
             for term in genre_splitted:
                 if term not in self.index["genres"]:
@@ -192,7 +192,7 @@ class Index:
 
         # summaries
         term_freq = dict()
-        for summary in document["summaries"]:
+        for summary in document["summaries"] or []:
             summary_splitted = summary.split()
             for term in summary_splitted:
                 if term not in self.index["summaries"]:
@@ -223,19 +223,19 @@ class Index:
         document = self.index["documents"][document_id]
         del self.index["documents"][document_id]
         # stars
-        for star in document["stars"]:
+        for star in document["stars"] or []:
             star_splitted = star.split()
             for term in star_splitted:
                 if document_id in self.index["stars"][term]:
                     del self.index["stars"][term][document_id]
         # genres
-        for genre in document["genres"]:
+        for genre in document["genres"] or []:
             genre_splitted = genre.split()
             for term in genre_splitted:
                 if document_id in self.index["genres"][term]:
                     del self.index["genres"][term][document_id]        
         # summaries
-        for summary in document["summaries"]:
+        for summary in document["summaries"] or []:
             summary_splitted = summary.split()
             for term in summary_splitted:
                 if document_id in self.index["summaries"][term]:
@@ -375,7 +375,7 @@ class Index:
         """
 
         # brute force to check check_word in the summaries
-        start = time.time()
+        start = time.perf_counter()
         docs = []
         for document in self.preprocessed_documents:
             if index_type not in document or document[index_type] is None:
@@ -390,15 +390,15 @@ class Index:
             if len(docs) == 3:
                 break
 
-        end = time.time()
+        end = time.perf_counter()
         brute_force_time = end - start
 
         # check by getting the posting list of the word
-        start = time.time()
+        start = time.perf_counter()
         # TODO: based on your implementation, you may need to change the following line
         posting_list = self.get_posting_list(check_word, index_type)
 
-        end = time.time()
+        end = time.perf_counter()
         implemented_time = end - start
 
         print('Brute force time: ', brute_force_time)
@@ -423,8 +423,14 @@ class Index:
 
 if __name__ == "__main__":
     preprocessed_documents = None
-    with open(os.getcwd() + "/Logic/Data/PreprocessedDocuments.json", "r") as file:
-        preprocessed_documents = json.load(file)
+    # written by preprocess.py, one document per line
+    jsonl_path = os.getcwd() + "/Logic/Data/PreprocessedDocuments.jsonl"
+    if os.path.exists(jsonl_path):
+        with open(jsonl_path, "r") as file:
+            preprocessed_documents = [json.loads(line) for line in file if line.strip()]
+    else:
+        with open(os.getcwd() + "/Logic/Data/PreprocessedDocuments.json", "r") as file:
+            preprocessed_documents = json.load(file)
     my_index = Index(preprocessed_documents)
     my_index.store_index("documents")
     my_index.store_index("stars")
@@ -1,7 +1,9 @@
 from indexes_enum import Indexes, Index_types
 import json
+import threading
+import time
 class Index_reader:
-    def __init__(self, path: str, index_name: Indexes, index_type: Index_types = None):
+    def __init__(self, path: str, index_name: Indexes, index_type: Index_types = None, lazy: bool = False):
         """
         Initializes the Index_reader.
 
@@ -12,29 +14,65 @@ class Index_reader:
         index_name : Indexes
             The name of the index to read.
         index_type : Index_types
-            The type of the index to read.  
+            The type of the index to read.
+        lazy : bool
+            If True, the file is only read on the first access to self.index (or on load()).
         """
         self.path = path
         self.index_name = index_name
         self.index_type = index_type
-        self.index = self.get_index()
+        self.load_time = None
+        self._index = None
+        self._lock = threading.Lock()
+        if not lazy:
+            self.load()
 
-    def get_index(self):
+    @property
+    def index(self):
+        if self._index is None:
+            self.load()
+        return self._index
+
+    @index.setter
+    def index(self, index):
+        self._index = index
+
+    @property
+    def loaded(self):
+        return self._index is not None
+
+    def load(self):
         """
-        Gets the index from the file.
+        Reads the index if it is not read yet. Safe to call from several threads.
 
         Returns
         -------
         dict
             The index.
         """
+        with self._lock:
+            if self._index is None:
+                start = time.perf_counter()
+                self._index = self.get_index()
+                self.load_time = time.perf_counter() - start
+        return self._index
+
+    def get_file_path(self):
         absolute_path = self.path + self.index_name.value
-        
+
         if self.index_type != None:
             absolute_path = absolute_path + "_" + self.index_type.value
 
-        absolute_path = absolute_path + "_index.json"
-        
-        with open(absolute_path, 'r') as file:
+        return absolute_path + "_index.json"
+
+    def get_index(self):
+        """
+        Gets the index from the file.
+
+        Returns
+        -------
+        dict
+            The index.
+        """
+        with open(self.get_file_path(), 'r') as file:
             return json.load(file)
-        
\ No newline at end of file
@@ -0,0 +1,219 @@
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+sys.path.append(os.getcwd() + "/Logic/core/")
+sys.path.append(os.getcwd() + "/Logic/core/utility/")
+sys.path.append(os.getcwd() + "/Logic/core/indexer/")
+from preprocess import Preprocessor, load_documents
+from index import Index
+from indexer.indexes_enum import Indexes
+from indexer.metadata_index import Metadata_index
+from document_lengths_index import DocumentLengthsIndex
+from tiered_index import Tiered_index
+
+_END = object()
+
+
+class _StageError:
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def bounded(iterable, maxsize=64):
+    """
+    Runs an iterable in a background thread and yields its items through a bounded queue.
+
+    The producer blocks when the consumer is maxsize items behind, so chaining stages with
+    bounded() overlaps them (e.g. crawling I/O with preprocessing) while keeping at most maxsize
+    documents in flight between two stages. An exception in the producer is raised in the
+    consumer.
+
+    Parameters
+    ----------
+    iterable : iterable
+        The producing stage.
+    maxsize : int
+        The capacity of the queue.
+
+    Yields
+    ------
+    The items of the iterable, in order.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        items.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            items.put(_END)
+        except BaseException as e:
+            items.put(_StageError(e))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                break
+            if isinstance(item, _StageError):
+                raise item.exception
+            yield item
+    finally:
+        # the consumer stopped early, let the producer exit
+        stop.set()
+
+
+class IngestionPipeline:
+    def __init__(self, index=None, preprocessor=None, queue_size=64, preprocessed_output=None):
+        """
+        Streams documents from a source (e.g. IMDbCrawler.crawl_movies or a JSONL file) through
+        the Preprocessor into an Index, one document at a time.
+
+        The crawling, preprocessing and indexing stages run concurrently and are connected by
+        bounded queues, so a movie is in the pipeline's index as soon as it has gone through the
+        three stages, and the memory used by the pipeline does not depend on the size of the
+        corpus (the index itself still grows with it). SearchEngine reads the stored indexes, so
+        the movies become searchable once store() has written them and the engine is restarted
+        on that directory.
+
+        Parameters
+        ----------
+        index : Index
+            The index the documents are added to. A new, empty one if None.
+        preprocessor : Preprocessor
+            The preprocessor. A new one if None.
+        queue_size : int
+            The capacity of each queue between two stages.
+        preprocessed_output : str
+            If given, the preprocessed documents are also appended to this JSONL file.
+        """
+        self.index = index if index is not None else Index([])
+        self.preprocessor = preprocessor if preprocessor is not None else Preprocessor([])
+        self.queue_size = queue_size
+        self.preprocessed_output = preprocessed_output
+        self.indexed_count = 0
+        # seconds from the moment the source produced a document to the moment it was indexed
+        self.latencies = deque(maxlen=10000)
+        self.lock = threading.Lock()
+
+    def timestamped(self, documents):
+        for document in documents:
+            yield time.perf_counter(), document
+
+    def preprocess(self, documents):
+        """
+        The preprocessing stage.
+        """
+        for start, document in documents:
+            yield start, self.preprocessor.preprocess_document(document)
+
+    def run(self, documents, on_indexed=None):
+        """
+        Index the documents of the source.
+
+        Parameters
+        ----------
+        documents : iterable of dict
+            The crawled movies.
+        on_indexed : callable
+            Called with each document after it is added to the index.
+
+        Returns
+        -------
+        int
+            The number of indexed documents.
+        """
+        stream = bounded(self.timestamped(documents), self.queue_size)
+        stream = bounded(self.preprocess(stream), self.queue_size)
+        output = open(self.preprocessed_output, "a") if self.preprocessed_output else None
+        count = 0
+        try:
+            for start, document in stream:
+                with self.lock:
+                    self.index.add_document_to_index(document)
+                    self.indexed_count += 1
+                self.latencies.append(time.perf_counter() - start)
+                if output is not None:
+                    output.write(json.dumps(document) + "\n")
+                if on_indexed is not None:
+                    on_indexed(document)
+                count += 1
+        finally:
+            if output is not None:
+                output.close()
+        return count
+
+    def get_latency_stats(self):
+        """
+        Returns the end-to-end latency percentiles of the indexed documents in seconds.
+        """
+        if len(self.latencies) == 0:
+            return {}
+        latencies = np.array(self.latencies)
+        return {
+            "p50_s": float(np.percentile(latencies, 50)),
+            "p95_s": float(np.percentile(latencies, 95)),
+            "max_s": float(latencies.max()),
+        }
+
+    def store(self, path=os.getcwd() + "/Logic/Data/"):
+        """
+        Stores every index of the pipeline, then rebuilds the indexes derived from them (document
+        lengths, metadata and tiered indexes) in the same directory, so they all describe the same
+        documents.
+
+        Parameters
+        ----------
+        path : str
+            The directory of the indexes, ending with a separator.
+        """
+        with self.lock:
+            for index_type in Indexes:
+                self.index.store_index(index_type.value, path)
+            # the document lengths first, the metadata are computed from them
+            DocumentLengthsIndex(path)
+            Metadata_index(path).store_metadata_index()
+            Tiered_index(path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Crawl, preprocess and index movies as a stream")
+    parser.add_argument("--source", default="crawl", help="'crawl' or the path of a JSON/JSONL file of crawled movies")
+    parser.add_argument("--threshold", type=int, default=100, help="number of movies to crawl")
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--preprocessed-output", help="also append the preprocessed movies to this JSONL file")
+    parser.add_argument("--output-dir", default=os.getcwd() + "/Logic/Data/", help="where to store the indexes")
+    args = parser.parse_args()
+
+    if args.source == "crawl":
+        from crawler import IMDbCrawler
+        crawler = IMDbCrawler(crawling_threshold=args.threshold)
+        source = crawler.crawl_movies(store=False)
+    else:
+        source = load_documents(args.source)
+
+    pipeline = IngestionPipeline(queue_size=args.queue_size, preprocessed_output=args.preprocessed_output)
+    start = time.perf_counter()
+    count = pipeline.run(source)
+    elapsed = time.perf_counter() - start
+    print(f"{count} movies indexed in {elapsed:.1f} s ({count / elapsed:.1f} movies/sec)")
+    print(f"end-to-end latency: {pipeline.get_latency_stats()}")
+    pipeline.store(args.output_dir)
@@ -2,39 +2,167 @@ import json
 import numpy as np
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 sys.path.append(os.getcwd() + "/Logic/core/")
-from preprocess import Preprocessor
-from scorer import Scorer
+sys.path.append(os.getcwd() + "/Logic/core/utility/")
+from query_analyzer import QueryAnalyzer
+from scorer import Scorer, CollectionModel
 sys.path.append(os.getcwd() + "/Logic/core/indexer/")
 from indexer.indexes_enum import Indexes, Index_types
 from indexer.index_reader import Index_reader
+from search_trace import SearchTrace, NULL_TRACE
 from copy import deepcopy
 
 class SearchEngine:
-    def __init__(self):
+    def __init__(self, warm_up=True, preload=False):
         """
         Initializes the search engine.
 
+        The indexes are read lazily, on the first query that needs them, so creating the engine is
+        fast and e.g. the tiered indexes are never read if unsafe ranking is not used. Call
+        preload() to read them ahead of time.
+
+        Parameters
+        ----------
+        warm_up : bool
+            Whether to warm up the query analyzer (WordNet loading) now instead of on the first
+            query.
+        preload : bool
+            Whether to read the indexes used by safe ranking now, in parallel.
         """
+        start = time.perf_counter()
         path = os.getcwd() + "/Logic/Data/"
-        self.document_indexes = {
-            Indexes.STARS.value: Index_reader(path, Indexes.STARS),
-            Indexes.GENRES.value: Index_reader(path, Indexes.GENRES),
-            Indexes.SUMMARIES.value: Index_reader(path, Indexes.SUMMARIES)
-        }
+        fields = [Indexes.STARS, Indexes.GENRES, Indexes.SUMMARIES]
+        self.document_indexes = {field.value: Index_reader(path, field, lazy=True) for field in fields}
         self.tiered_index = {
-            Indexes.STARS.value: Index_reader(path, Indexes.STARS, Index_types.TIERED),
-            Indexes.GENRES.value: Index_reader(path, Indexes.GENRES, Index_types.TIERED),
-            Indexes.SUMMARIES.value: Index_reader(path, Indexes.SUMMARIES, Index_types.TIERED)
+            field.value: Index_reader(path, field, Index_types.TIERED, lazy=True) for field in fields
         }
         self.document_lengths_index = {
-            Indexes.STARS.value: Index_reader(path, Indexes.STARS, Index_types.DOCUMENT_LENGTH),
-            Indexes.GENRES.value: Index_reader(path, Indexes.GENRES, Index_types.DOCUMENT_LENGTH),
-            Indexes.SUMMARIES.value: Index_reader(path, Indexes.SUMMARIES, Index_types.DOCUMENT_LENGTH)
+            field.value: Index_reader(path, field, Index_types.DOCUMENT_LENGTH, lazy=True) for field in fields
         }
         self.metadata_index = Index_reader(
-            path, Indexes.DOCUMENTS, Index_types.METADATA
+            path, Indexes.DOCUMENTS, Index_types.METADATA, lazy=True
         )
+        # built on the first unigram query of each field
+        self.collection_models = {}
+        # cosine normalization lengths, filled by the scorers on first use
+        self.document_norms = {
+            Indexes.STARS.value: {},
+            Indexes.GENRES.value: {},
+            Indexes.SUMMARIES.value: {},
+        }
+        self.trace_hook = None
+        self.query_analyzer = QueryAnalyzer()
+        self.startup_times = {"construction": time.perf_counter() - start}
+        if warm_up:
+            self.warm_up()
+        if preload:
+            self.preload()
+
+    def warm_up(self):
+        """
+        Warms up the query analyzer.
+        """
+        start = time.perf_counter()
+        self.query_analyzer.warm_up()
+        self.startup_times["warm_up"] = time.perf_counter() - start
+
+    def get_index_readers(self, groups=("index", "document_length", "metadata", "tiered")):
+        """
+        Returns the index readers of the given groups: "index" (the inverted indexes),
+        "document_length", "metadata" and "tiered".
+        """
+        readers = []
+        if "index" in groups:
+            readers += self.document_indexes.values()
+        if "document_length" in groups:
+            readers += self.document_lengths_index.values()
+        if "metadata" in groups:
+            readers.append(self.metadata_index)
+        if "tiered" in groups:
+            readers += self.tiered_index.values()
+        return readers
+
+    def preload(self, groups=("index", "document_length", "metadata"), max_workers=4):
+        """
+        Reads the indexes of the given groups in a thread pool. The files are independent, so
+        reading one overlaps with parsing another. The tiered indexes are not read by default,
+        they are only used by unsafe ranking.
+
+        Parameters
+        ----------
+        groups : tuple
+            The groups of indexes to read, see get_index_readers.
+        max_workers : int
+            The number of threads.
+
+        Returns
+        -------
+        dict
+            The startup report, see get_startup_report.
+        """
+        start = time.perf_counter()
+        readers = [reader for reader in self.get_index_readers(groups) if not reader.loaded]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for reader, error in zip(readers, executor.map(self.try_load, readers)):
+                if error is not None:
+                    print(f"Could not preload {reader.get_file_path()}: {error}")
+        self.startup_times["preload"] = time.perf_counter() - start
+        return self.get_startup_report()
+
+    def build_caches(self):
+        """
+        Builds what the scorers otherwise build on their first query: the collection model of
+        every field (unigram) and the cosine document norms of every document weighting. Call it
+        with preload() before forking workers, so they share these instead of each building them.
+        """
+        start = time.perf_counter()
+        for field_name, reader in self.document_indexes.items():
+            field = Indexes(field_name)
+            self.get_collection_model(field)
+            scorer = Scorer(
+                reader.index,
+                self.metadata_index.index["document_count"],
+                document_norms=self.document_norms[field_name],
+            )
+            for document_method in ["nnc", "ntc", "lnc", "ltc"]:
+                scorer.get_document_norms(document_method)
+        self.startup_times["build_caches"] = time.perf_counter() - start
+
+    @staticmethod
+    def try_load(reader):
+        try:
+            reader.load()
+        except (OSError, ValueError) as e:
+            return e
+        return None
+
+    def get_startup_report(self):
+        """
+        Returns the time spent creating the engine, warming it up and preloading the indexes, and
+        the load time of each index read so far, in milliseconds.
+        """
+        return {
+            "startup_ms": {stage: elapsed * 1e3 for stage, elapsed in self.startup_times.items()},
+            "indexes_ms": {
+                os.path.basename(reader.get_file_path()): reader.load_time * 1e3
+                for reader in self.get_index_readers()
+                if reader.loaded and reader.load_time is not None
+            },
+        }
+
+    def set_trace_hook(self, hook):
+        """
+        Enables per-query tracing. After every search, hook is called with a SearchTrace holding
+        the time spent in each stage and counts such as postings scanned and candidates scored.
+
+        Parameters
+        ----------
+        hook : callable
+            Called with the SearchTrace of each query. None disables tracing.
+        """
+        self.trace_hook = hook
 
     def search(
         self,
@@ -46,6 +174,9 @@ class SearchEngine:
         smoothing_method=None,
         alpha=0.5,
         lamda=0.5,
+        k1=1.2,
+        b=0.75,
+        trace=None,
     ):
         """
         searches for the query in the indexes.
@@ -54,8 +185,9 @@ class SearchEngine:
         ----------
         query : str
             The query to search for.
-        method : str ((n|l)(n|t)(n|c).(n|l)(n|t)(n|c)) | OkapiBM25 | Unigram
-            The method to use for searching.
+        method : str ((n|l)(n|t)(n|c).(n|l)(n|t)(n|c)) | OkapiBM25 | BM25F | Unigram
+            The method to use for searching. BM25F combines the fields while scoring instead of
+            aggregating the separately scored fields.
         weights: dict
             The weights of the fields.
         safe_ranking : bool
@@ -70,41 +202,87 @@ class SearchEngine:
         lamda : float, optional
             The parameter used in some smoothing methods to balance between the document
             probability and the collection probability. Defaults to 0.5.
+        k1 : float, optional
+            The term frequency saturation parameter of OkapiBM25 and BM25F. Defaults to 1.2.
+        b : float or dict, optional
+            The length normalization parameter of OkapiBM25 and BM25F, either shared or one per
+            field. Defaults to 0.75.
+        trace : SearchTrace, optional
+            A trace to record this query's stages in, e.g. when the caller also times the snippet
+            generation. The caller finishes it. If None, a trace is created and finished here
+            when a trace hook is set.
 
         Returns
         -------
         list
             A list of tuples containing the document IDs and their scores sorted by their scores.
         """
-        preprocessor = Preprocessor([query])
-        query = preprocessor.preprocess()[0].split()
+        owns_trace = trace is None
+        if trace is None:
+            trace = NULL_TRACE if self.trace_hook is None else SearchTrace(query, self.trace_hook)
+        trace.set("method", method)
+        trace.set("safe_ranking", safe_ranking)
+
+        with trace.stage("preprocessing"):
+            query = self.query_analyzer.analyze(query)
 
         if max_results == -1:
-            max_results = self.metadata_index["document_count"]
-        
+            max_results = self.metadata_index.index["document_count"]
+
+        if trace.enabled:
+            self.count_postings(query, weights, trace)
+
         scores = {}
-        if method == "unigram":
+        final_scores = {}
+        if method == "BM25F":
+            self.find_scores_with_bm25f(query, weights, final_scores, k1, b, trace=trace)
+        elif method == "unigram":
             self.find_scores_with_unigram_model(
-                query, smoothing_method, weights, scores, alpha, lamda
+                query, smoothing_method, weights, scores, alpha, lamda, trace=trace
             )
         elif safe_ranking:
-            self.find_scores_with_safe_ranking(query, method, weights, scores)
+            self.find_scores_with_safe_ranking(query, method, weights, scores, k1, b, trace=trace)
         else:
             self.find_scores_with_unsafe_ranking(
-                query, method, weights, max_results, scores
+                query, method, weights, max_results, scores, k1, b, trace=trace
             )
 
-        final_scores = {}
-
-        self.aggregate_scores(weights, scores, final_scores)
+        if method != "BM25F":
+            with trace.stage("aggregation"):
+                self.aggregate_scores(weights, scores, final_scores)
+        trace.count("candidates_scored", len(final_scores))
 
-        result = sorted(final_scores.items(), key=lambda x: x[1], reverse=True)
-        print(len(result))
-        if max_results is not None:
-            result = result[:max_results]
+        with trace.stage("top_k"):
+            result = sorted(final_scores.items(), key=lambda x: x[1], reverse=True)
+            if max_results is not None:
+                result = result[:max_results]
 
+        if owns_trace:
+            trace.finish()
         return result
 
+    def count_postings(self, query, weights, trace):
+        """
+        Counts the postings of the query terms in the weighted fields. Only called when tracing.
+        With unsafe ranking, this is an upper bound of what the tiered index scans.
+
+        Parameters
+        ----------
+        query: List[str]
+            The query terms.
+        weights: dict
+            The weights of the fields.
+        trace : SearchTrace
+            The trace to add the counts to.
+        """
+        for field, weight in weights.items():
+            if weight == 0:
+                continue
+            index = self.document_indexes[field.value].index
+            postings = sum(len(index[term]) for term in query if term in index)
+            trace.count("postings_scanned", postings)
+            trace.count("postings_scanned." + field.value, postings)
+
     def aggregate_scores(self, weights, scores, final_scores):
         """
         Aggregates the scores of the fields.
@@ -126,7 +304,9 @@ class SearchEngine:
                     final_scores[doc] = 0
                 final_scores[doc] += score * weights[field]
 
-    def find_scores_with_unsafe_ranking(self, query, method, weights, max_results, scores):
+    def find_scores_with_unsafe_ranking(
+        self, query, method, weights, max_results, scores, k1=1.2, b=0.75, trace=NULL_TRACE
+    ):
         """
         Finds the scores of the documents using the unsafe ranking method using the tiered index.
 
@@ -142,19 +322,123 @@ class SearchEngine:
             The maximum number of results to return.
         scores : dict
             The scores of the documents.
+        k1 : float
+            The term frequency saturation parameter of OkapiBM25.
+        b : float or dict
+            The length normalization parameter of OkapiBM25, either shared or one per field.
+        trace : SearchTrace, optional
+            The trace of the query.
         """
         for field in weights:
-            for tier in ["first_tier", "second_tier", "third_tier"]:
-                scorer = Scorer(self.tiered_index[field.value].index[tier], self.metadata_index.index["document_count"])
+            field_b = b[field] if isinstance(b, dict) else b
+            self.find_field_scores_with_unsafe_ranking(query, method, field, max_results, scores, k1, field_b, trace)
+
+    def find_field_scores_with_unsafe_ranking(
+        self, query, method, field, max_results, scores, k1=1.2, b=0.75, trace=NULL_TRACE
+    ):
+        """
+        Scores one field with the tiers of its tiered index, stopping at the first tier that
+        brings max_results documents. The candidates of the tiers are collected in the
+        candidate_generation stage, and scored in the scoring stage of the field.
+        """
+        scores[field] = {}
+        for tier in ["first_tier", "second_tier", "third_tier"]:
+            # the dfs and the cosine norms of the whole index, cached across queries like in safe ranking
+            scorer = Scorer(
+                self.tiered_index[field.value].index[tier],
+                self.metadata_index.index["document_count"],
+                document_norms=self.document_norms[field.value],
+                statistics_index=self.document_indexes[field.value].index,
+            )
+            with trace.stage("candidate_generation"):
+                documents = scorer.get_list_of_documents(query)
+            with trace.stage("scoring." + field.value):
                 if method == "OkapiBM25":
-                    score = scorer.compute_socres_with_okapi_bm25(query, self.metadata_index.index["averge_document_length"][field.value], self.document_lengths_index[field].index)
+                    score = scorer.compute_socres_with_okapi_bm25(query, self.metadata_index.index["averge_document_length"][field.value], self.document_lengths_index[field.value].index, k1, b, documents)
                 else:
-                    score = scorer.compute_scores_with_vector_space_model(query, method)
+                    score = scorer.compute_scores_with_vector_space_model(query, method, documents)
                 scores[field] = self.merge_scores(scores[field], score)
-                if len(scores[field]) >= max_results:
-                    break
+            if max_results is not None and len(scores[field]) >= max_results:
+                break
+
+    def find_scores_with_bm25f(self, query, weights, final_scores, k1=1.2, b=0.75, trace=NULL_TRACE):
+        """
+        Finds the scores of the documents with BM25F.
+
+        Instead of scoring each field with BM25 and summing the weighted field scores, the term
+        frequencies of the fields are length-normalized per field, weighted and summed into one
+        pseudo term frequency per document, and the BM25 saturation is applied once:
+
+            tf~(t, d) = sum_f weight_f * tf_f(t, d) / (1 - b_f + b_f * |d_f| / avgdl_f)
+            score(d) = sum_t qtf * idf(t) * tf~(t, d) / (k1 + tf~(t, d))
+
+        The postings of all fields are merged per term in a single traversal into one dict, so
+        there is one candidate set and one sort instead of one per field.
+
+        Parameters
+        ----------
+        query: List[str]
+            The query to be scored
+        weights: dict
+            The weights of the fields.
+        final_scores : dict
+            The final scores of the documents.
+        k1 : float
+            The term frequency saturation parameter.
+        b : float or dict
+            The length normalization parameter, either shared or one per field.
+        trace : SearchTrace, optional
+            The trace of the query.
+        """
+        N = self.metadata_index.index["document_count"]
+        average_lengths = self.metadata_index.index["averge_document_length"]
+        fields = []
+        for field, weight in weights.items():
+            if weight == 0:
+                continue
+            field_b = b[field] if isinstance(b, dict) else b
+            average_length = average_lengths[field.value] or 1.0
+            fields.append((
+                self.document_indexes[field.value].index,
+                self.document_lengths_index[field.value].index,
+                weight,
+                field_b,
+                average_length,
+            ))
+
+        query_tfs = {}
+        for term in query:
+            query_tfs[term] = query_tfs.get(term, 0) + 1
+
+        # the merged traversal of the postings, which also collects the candidates
+        with trace.stage("candidate_generation"):
+            term_pseudo_tfs = {}
+            for term in query_tfs:
+                pseudo_tfs = {}
+                for index, document_lengths, weight, field_b, average_length in fields:
+                    postings = index.get(term, None)
+                    if postings is None:
+                        continue
+                    for document_id, tf in postings.items():
+                        length = document_lengths.get(document_id, average_length)
+                        normalized = weight * tf / (1 - field_b + field_b * length / average_length)
+                        pseudo_tfs[document_id] = pseudo_tfs.get(document_id, 0.0) + normalized
+                term_pseudo_tfs[term] = pseudo_tfs
+
+        with trace.stage("scoring.bm25f"):
+            for term, query_tf in query_tfs.items():
+                pseudo_tfs = term_pseudo_tfs[term]
+                if len(pseudo_tfs) == 0:
+                    continue
+
+                # df counts the documents containing the term in any of the weighted fields
+                df = len(pseudo_tfs)
+                idf = float(np.log((N - df + 0.5) / (df + 0.5) + 1))
+                for document_id, pseudo_tf in pseudo_tfs.items():
+                    score = query_tf * idf * pseudo_tf / (k1 + pseudo_tf)
+                    final_scores[document_id] = final_scores.get(document_id, 0.0) + score
 
-    def find_scores_with_safe_ranking(self, query, method, weights, scores):
+    def find_scores_with_safe_ranking(self, query, method, weights, scores, k1=1.2, b=0.75, trace=NULL_TRACE):
         """
         Finds the scores of the documents using the safe ranking method.
 
@@ -168,15 +452,101 @@ class SearchEngine:
             The weights of the fields.
         scores : dict
             The scores of the documents.
+        k1 : float
+            The term frequency saturation parameter of OkapiBM25.
+        b : float or dict
+            The length normalization parameter of OkapiBM25, either shared or one per field.
+        trace : SearchTrace, optional
+            The trace of the query.
+        """
+
+        for field in weights:
+            scorer = Scorer(
+                self.document_indexes[field.value].index,
+                self.metadata_index.index["document_count"],
+                document_norms=self.document_norms[field.value],
+            )
+            with trace.stage("candidate_generation"):
+                documents = scorer.get_list_of_documents(query)
+            with trace.stage("scoring." + field.value):
+                if method == "OkapiBM25":
+                    field_b = b[field] if isinstance(b, dict) else b
+                    score = scorer.compute_socres_with_okapi_bm25(query, self.metadata_index.index['averge_document_length'][field.value], self.document_lengths_index[field.value].index, k1, field_b, documents)
+                else:
+                    score = scorer.compute_scores_with_vector_space_model(query, method, documents)
+                scores[field] = score
+
+    def get_collection_model(self, field):
+        """
+        Returns the precomputed unigram statistics of a field, building them on first use.
+
+        Parameters
+        ----------
+        field : Indexes
+            The field to get the collection model for.
+
+        Returns
+        -------
+        CollectionModel
+            The collection model of the field.
+        """
+        model = self.collection_models.get(field.value, None)
+        if model is None:
+            model = CollectionModel(
+                self.document_indexes[field.value].index,
+                self.document_lengths_index[field.value].index,
+            )
+            self.collection_models[field.value] = model
+        return model
+
+    def find_scores_with_unigram_model(
+        self, query, smoothing_method, weights, scores, alpha=0.5, lamda=0.5, trace=NULL_TRACE
+    ):
+        """
+        Calculates the scores for each document based on the unigram model.
+
+        Every field scores the same candidate set (the documents containing a query term in any
+        field), so a document lacking the terms in one field still gets that field's smoothed
+        background score instead of no score at all.
+
+        Parameters
+        ----------
+        query : List[str]
+            The query to search for.
+        smoothing_method : str (bayes | naive | mixture)
+            The method used for smoothing the probabilities in the unigram model.
+        weights : dict
+            The weights of the fields. Fields with a weight of 0 are not scored.
+        scores : dict
+            The scores of the documents.
+        alpha : float, optional
+            The parameter used in bayesian smoothing method. Defaults to 0.5.
+        lamda : float, optional
+            The parameter used in some smoothing methods to balance between the document
+            probability and the collection probability. Defaults to 0.5.
+        trace : SearchTrace, optional
+            The trace of the query.
         """
+        fields = [field for field in weights if weights[field] != 0]
+        with trace.stage("candidate_generation"):
+            candidates = set()
+            for field in fields:
+                index = self.document_indexes[field.value].index
+                for term in query:
+                    if term in index:
+                        candidates.update(index[term].keys())
+            candidates = list(candidates)
 
         for field in weights:
-            scorer = Scorer(self.document_indexes[field.value].index, self.metadata_index.index["document_count"])
-            if method == "OkapiBM25":
-                score = scorer.compute_socres_with_okapi_bm25(query, self.metadata_index.index['averge_document_length'][field.value], self.document_lengths_index[field].index)
-            else:
-                score = scorer.compute_scores_with_vector_space_model(query, method)
-            scores[field] = score
+            if field not in fields:
+                scores[field] = {}
+                continue
+            with trace.stage("scoring." + field.value):
+                model = self.get_collection_model(field)
+                scorer = Scorer(model.index, self.metadata_index.index["document_count"], model)
+                scores[field] = scorer.compute_scores_with_unigram_model(
+                    query, smoothing_method, alpha=alpha, lamda=lamda, document_ids=candidates
+                )
 
     def merge_scores(self, scores1, scores2):
         """
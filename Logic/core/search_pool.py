@@ -0,0 +1,205 @@
+import gc
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import Future
+
+sys.path.append(os.getcwd() + "/Logic/core/")
+
+
+def _worker_main(search_engine, connection):
+    """
+    The loop of a forked worker. It inherits the already loaded search engine from the parent,
+    so the indexes are shared copy-on-write instead of being loaded again.
+
+    Parameters
+    ----------
+    search_engine : SearchEngine
+        The search engine inherited from the parent process.
+    connection : multiprocessing.connection.Connection
+        The worker's end of the pipe to the dispatcher.
+    """
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        request_id, args, kwargs = message
+        try:
+            connection.send((request_id, True, search_engine.search(*args, **kwargs)))
+        except Exception as e:
+            connection.send((request_id, False, f"{type(e).__name__}: {e}"))
+    connection.close()
+
+
+class SearchWorkerPool:
+    def __init__(self, search_engine=None, num_workers=None):
+        """
+        A pool of pre-forked search processes sharing one loaded index.
+
+        The parent loads the indexes once and then forks the workers, so every worker sees the
+        same memory pages copy-on-write. Before forking, the loaded objects are moved to the
+        permanent generation of the garbage collector (gc.freeze), otherwise the first
+        collection in each worker would write to, and therefore copy, every page of the index.
+
+        Parameters
+        ----------
+        search_engine : SearchEngine
+            The loaded search engine. A new one is created if None.
+        num_workers : int
+            The number of worker processes. Defaults to the number of CPUs.
+        """
+        if search_engine is None:
+            from search import SearchEngine
+            search_engine = SearchEngine()
+        self.search_engine = search_engine
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.processes = []
+        self.connections = []
+        self.send_locks = []
+        self.readers = []
+        self.outstanding = []
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.request_ids = itertools.count()
+        self.started = False
+
+    def start(self):
+        """
+        Forks the workers and starts a dispatcher thread for each of them.
+        """
+        if self.started:
+            return self
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("SearchWorkerPool needs the 'fork' start method, which is not available on this platform")
+        context = multiprocessing.get_context("fork")
+
+        # the engine reads its indexes and builds its scoring caches lazily; do it all here, tiered
+        # indexes included, so the workers share them instead of each building its own copy
+        if hasattr(self.search_engine, "preload"):
+            self.search_engine.preload(groups=("index", "document_length", "metadata", "tiered"))
+            self.search_engine.build_caches()
+        gc.collect()
+        gc.freeze()
+        for i in range(self.num_workers):
+            parent_connection, child_connection = context.Pipe()
+            process = context.Process(
+                target=_worker_main, args=(self.search_engine, child_connection), daemon=True
+            )
+            process.start()
+            child_connection.close()
+            self.processes.append(process)
+            self.connections.append(parent_connection)
+            self.send_locks.append(threading.Lock())
+            self.outstanding.append(0)
+        gc.unfreeze()
+
+        for i in range(self.num_workers):
+            reader = threading.Thread(target=self.read_results, args=(i,), daemon=True)
+            reader.start()
+            self.readers.append(reader)
+        self.started = True
+        return self
+
+    def read_results(self, worker):
+        """
+        Receives the results of one worker and resolves the corresponding futures.
+        """
+        connection = self.connections[worker]
+        while True:
+            try:
+                request_id, ok, result = connection.recv()
+            except (EOFError, OSError):
+                break
+            with self.lock:
+                _, future = self.futures.pop(request_id, (None, None))
+                self.outstanding[worker] -= 1
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(result))
+
+        # the worker is gone, fail the queries it still had
+        with self.lock:
+            lost = [request_id for request_id, (w, _) in self.futures.items() if w == worker]
+            lost = [self.futures.pop(request_id)[1] for request_id in lost]
+            self.outstanding[worker] = 0
+        for future in lost:
+            future.set_exception(RuntimeError(f"Search worker {worker} exited"))
+
+    def submit(self, *args, **kwargs):
+        """
+        Sends a query to the least loaded worker.
+
+        Parameters
+        ----------
+        args, kwargs :
+            The arguments of SearchEngine.search.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            A future resolving to the result of SearchEngine.search.
+        """
+        if not self.started:
+            self.start()
+        future = Future()
+        with self.lock:
+            request_id = next(self.request_ids)
+            worker = min(range(self.num_workers), key=lambda w: self.outstanding[w])
+            self.outstanding[worker] += 1
+            self.futures[request_id] = (worker, future)
+        with self.send_locks[worker]:
+            self.connections[worker].send((request_id, args, kwargs))
+        return future
+
+    def search(self, *args, **kwargs):
+        """
+        Same as SearchEngine.search, but runs in one of the workers.
+        """
+        return self.submit(*args, **kwargs).result()
+
+    def close(self):
+        """
+        Stops the workers.
+        """
+        for connection, send_lock in zip(self.connections, self.send_locks):
+            with send_lock:
+                try:
+                    connection.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for connection in self.connections:
+            connection.close()
+        self.processes, self.connections, self.send_locks, self.readers, self.outstanding = [], [], [], [], []
+        self.started = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+if __name__ == "__main__":
+    import time
+    from indexer.indexes_enum import Indexes
+
+    weights = {Indexes.STARS: 1, Indexes.GENRES: 1, Indexes.SUMMARIES: 1}
+    queries = ["tom holland spider man", "spider man in wonderland", "the godfather", "batman dark knight"] * 50
+    with SearchWorkerPool() as pool:
+        start = time.time()
+        futures = [pool.submit(query, "lnc.ltc", weights) for query in queries]
+        results = [future.result() for future in futures]
+        end = time.time()
+    print(f"{len(queries)} queries with {pool.num_workers} workers: {len(queries) / (end - start):.1f} queries/sec")
@@ -0,0 +1,156 @@
+import time
+from collections import deque
+
+
+class _Stage:
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        self.trace.stages[self.name] = self.trace.stages.get(self.name, 0.0) + elapsed
+        return False
+
+
+class SearchTrace:
+    enabled = True
+
+    def __init__(self, query, hook=None):
+        """
+        The timings and counts of one query.
+
+        Stages are timed with `with trace.stage("name"):` and accumulate if entered more than once.
+        Counts (e.g. postings scanned, candidates scored) are added with trace.count.
+
+        Parameters
+        ----------
+        query : str
+            The query being traced.
+        hook : callable
+            Called with the trace when finish() is called.
+        """
+        self.query = query
+        self.hook = hook
+        self.stages = {}
+        self.counts = {}
+        self.info = {}
+        self.start = time.perf_counter()
+        self.total = None
+
+    def stage(self, name):
+        """
+        Returns a context manager timing the stage with the given name.
+        """
+        return _Stage(self, name)
+
+    def count(self, name, value):
+        """
+        Adds value to the count with the given name.
+        """
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def set(self, name, value):
+        """
+        Records a piece of information about the query, e.g. the method.
+        """
+        self.info[name] = value
+
+    def finish(self):
+        """
+        Records the total time and passes the trace to the hook.
+        """
+        self.total = time.perf_counter() - self.start
+        if self.hook is not None:
+            self.hook(self)
+        return self
+
+    def to_dict(self):
+        """
+        Returns the trace as a JSON-serializable dict, with times in milliseconds.
+        """
+        return {
+            "query": self.query,
+            "info": dict(self.info),
+            "total_ms": None if self.total is None else self.total * 1e3,
+            "stages_ms": {name: elapsed * 1e3 for name, elapsed in self.stages.items()},
+            "counts": dict(self.counts),
+        }
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class NullTrace:
+    """
+    The trace used when tracing is disabled. Every method is a no-op, so an untraced query only
+    pays for a few method calls.
+    """
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def count(self, name, value):
+        pass
+
+    def set(self, name, value):
+        pass
+
+    def finish(self):
+        return self
+
+
+NULL_TRACE = NullTrace()
+
+
+class TraceRecorder:
+    def __init__(self, max_traces=10000):
+        """
+        A trace hook keeping the most recent traces in memory.
+
+        Parameters
+        ----------
+        max_traces : int
+            The number of traces to keep.
+        """
+        self.traces = deque(maxlen=max_traces)
+
+    def __call__(self, trace):
+        self.traces.append(trace.to_dict())
+
+    def summary(self):
+        """
+        Returns the mean time of each stage and the mean of each count over the recorded traces.
+
+        Returns
+        -------
+        dict
+            {"queries": int, "stages_ms": {stage: mean}, "counts": {name: mean}}
+        """
+        stages, counts = {}, {}
+        for trace in self.traces:
+            for name, elapsed in trace["stages_ms"].items():
+                stages[name] = stages.get(name, 0.0) + elapsed
+            for name, value in trace["counts"].items():
+                counts[name] = counts.get(name, 0) + value
+        n = max(len(self.traces), 1)
+        return {
+            "queries": len(self.traces),
+            "stages_ms": {name: total / n for name, total in stages.items()},
+            "counts": {name: total / n for name, total in counts.items()},
+        }
+
+    def clear(self):
+        self.traces.clear()
@@ -144,16 +144,36 @@ class IMDbCrawler:
         ThreadPoolExecutor is used to make the crawler faster by using multiple threads to crawl the pages.
         You are free to use it or not. If used, not to forget safe access to the shared resources.
         """
+        for movie in self.crawl_movies():
+            self.write_to_file_as_json()
+
+    def crawl_movies(self, store=True):
+        """
+        Crawl the movies until the crawling threshold is reached, yielding each movie as soon as it
+        is crawled, so the following stages (preprocessing, indexing) can consume them as a stream.
+
+        Parameters
+        ----------
+        store: bool
+            Whether to also keep the movies in self.crawled. Disable it when streaming a large crawl
+            so the memory does not grow with the number of movies.
+
+        Yields
+        ----------
+        dict
+            The crawled movie
+        """
         if len(self.crawled) == 0 and len(self.added_ids) == 0 and len(self.not_crawled) == 0:
             self.extract_top_250()
         for i in range(self.crawling_threshold):
+            if len(self.not_crawled) == 0:
+                break
             URL = self.get_url_from_id(self.not_crawled[0])
             # self.not_crawled.remove(self.not_crawled[0])
             self.not_crawled.pop(0)
-            self.crawl_page_info(URL)
-            self.write_to_file_as_json()
+            yield self.crawl_page_info(URL, store)
 
-    def crawl_page_info(self, URL):
+    def crawl_page_info(self, URL, store=True):
         """
         Main Logic of the crawler. It crawls the page and extracts the information of the movie.
         Use related links of a movie to crawl more movies.
@@ -162,6 +182,13 @@ class IMDbCrawler:
         ----------
         URL: str
             The URL of the site
+        store: bool
+            Whether to append the movie to self.crawled
+
+        Returns
+        ----------
+        dict
+            The crawled movie
         """
         new_movie = self.get_imdb_instance()
         self.extract_movie_info(self.crawl(URL), new_movie, URL)
@@ -171,11 +198,13 @@ class IMDbCrawler:
                     self.added_ids.append(related_movie_id)
                     # self.check_dup()
                     self.not_crawled.append(related_movie_id)
-        self.crawled.append(new_movie)
+        if store:
+            self.crawled.append(new_movie)
         if new_movie["title"] is None:
             print("finished: ", new_movie["id"])
         else:
             print("finished: ", new_movie["title"])
+        return new_movie
 
     def extract_movie_info(self, res, movie, URL):
         """
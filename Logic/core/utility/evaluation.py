@@ -1,13 +1,240 @@
 from typing import List
-import wandb
+import argparse
+import json
 import numpy as np
 
+
+class RelevanceMatrix:
+    def __init__(self, actual: List[List[str]], predicted: List[List[str]], depth: int = None):
+        """
+        The runs of many queries as NumPy matrices (queries x ranks), from which all the metrics
+        are computed at any cutoff k with array operations instead of per-query loops.
+
+        The relevance is graded by the order of the actual results: the first of n actual results
+        has a gain of n, the last a gain of 1, and the other documents a gain of 0. The actual
+        results of a query can also be a dict from document to its gain (e.g. from TREC qrels).
+        A document predicted more than once only counts at its first rank.
+
+        Parameters
+        ----------
+        actual : List[List[str]]
+            The actual results of each query, the most relevant first, or dicts of gains.
+        predicted : List[List[str]]
+            The predicted results of each query, in rank order.
+        depth : int
+            The number of ranks kept. The longest predicted list if None.
+        """
+        if depth is None:
+            depth = max((len(results) for results in predicted), default=0)
+        self.depth = depth
+        self.gains = np.zeros((len(predicted), depth), dtype=np.float64)
+        # wider than depth if needed: without a cutoff, the ideal ranking has all the actual results
+        ideal_depth = max([depth] + [len(set(results)) for results in actual[:len(predicted)]])
+        self.ideal_gains = np.zeros((len(predicted), ideal_depth), dtype=np.float64)
+        self.num_relevant = np.zeros(len(predicted), dtype=np.float64)
+        self.num_retrieved = np.zeros(len(predicted), dtype=np.float64)
+        for query in range(len(predicted)):
+            if isinstance(actual[query], dict):
+                relevant = {document: gain for document, gain in actual[query].items() if gain > 0}
+            else:
+                relevant = {}
+                for rank, document in enumerate(actual[query]):
+                    relevant.setdefault(document, len(actual[query]) - rank)
+            self.num_relevant[query] = len(relevant)
+            ideal = sorted(relevant.values(), reverse=True)
+            self.ideal_gains[query, :len(ideal)] = ideal
+            results = predicted[query][:depth]
+            self.gains[query, :len(results)] = [relevant.get(document, 0) for document in results]
+            unique_results = set(results)
+            self.num_retrieved[query] = len(unique_results)
+            if len(unique_results) < len(results):
+                seen = set()
+                for rank, document in enumerate(results):
+                    if document in seen:
+                        self.gains[query, rank] = 0
+                    seen.add(document)
+        self.relevant = self.gains > 0
+        self.discounts = 1 / np.log2(np.arange(2, ideal_depth + 2))
+
+    @classmethod
+    def from_gains(cls, gains: np.ndarray, ideal_gains: np.ndarray, num_retrieved: np.ndarray):
+        """
+        Builds the matrices from gains already looked up, e.g. when the same queries are evaluated
+        for many rankings.
+
+        Parameters
+        ----------
+        gains : np.ndarray
+            The gain of the result at each rank of each query (queries x ranks), 0 if irrelevant.
+        ideal_gains : np.ndarray
+            The gains of the actual results of each query, in decreasing order, padded with 0.
+        num_retrieved : np.ndarray
+            The number of (distinct) results of each query.
+        """
+        matrix = cls.__new__(cls)
+        matrix.depth = gains.shape[1]
+        ideal_depth = max(matrix.depth, ideal_gains.shape[1])
+        matrix.gains = np.asarray(gains, dtype=np.float64)
+        matrix.ideal_gains = np.zeros((len(gains), ideal_depth), dtype=np.float64)
+        matrix.ideal_gains[:, :ideal_gains.shape[1]] = ideal_gains
+        matrix.num_relevant = (matrix.ideal_gains > 0).sum(axis=1).astype(np.float64)
+        matrix.num_retrieved = np.asarray(num_retrieved, dtype=np.float64)
+        matrix.relevant = matrix.gains > 0
+        matrix.discounts = 1 / np.log2(np.arange(2, ideal_depth + 2))
+        return matrix
+
+    def _cutoff(self, k):
+        return self.depth if k is None else min(k, self.depth)
+
+    @staticmethod
+    def _divide(numerators, denominators):
+        return np.divide(numerators, denominators, out=np.zeros_like(numerators), where=denominators > 0)
+
+    def precision(self, k: int = None) -> np.ndarray:
+        """
+        Returns the precision of each query at k: the relevant results in the first k over k, or
+        over the number of results if k is None.
+        """
+        denominators = self.num_retrieved if k is None else np.full(len(self.gains), float(k))
+        return self._divide(self.relevant[:, :self._cutoff(k)].sum(axis=1).astype(np.float64), denominators)
+
+    def recall(self, k: int = None) -> np.ndarray:
+        """
+        Returns the recall of each query at k.
+        """
+        return self._divide(self.relevant[:, :self._cutoff(k)].sum(axis=1).astype(np.float64), self.num_relevant)
+
+    def average_precision(self, k: int = None) -> np.ndarray:
+        """
+        Returns the average precision of each query at k: the mean of the precisions at the ranks
+        of the relevant results, over all the relevant documents of the query.
+        """
+        relevant = self.relevant[:, :self._cutoff(k)]
+        precisions = np.cumsum(relevant, axis=1) / np.arange(1, relevant.shape[1] + 1)
+        return self._divide((precisions * relevant).sum(axis=1), self.num_relevant)
+
+    def dcg(self, k: int = None) -> np.ndarray:
+        """
+        Returns the discounted cumulative gain of each query at k, with a discount of
+        1 / log2(rank + 1).
+        """
+        cutoff = self._cutoff(k)
+        return self.gains[:, :cutoff] @ self.discounts[:cutoff]
+
+    def ndcg(self, k: int = None) -> np.ndarray:
+        """
+        Returns the DCG of each query at k over the DCG at k of the ideal ranking of its actual
+        results.
+        """
+        cutoff = self.ideal_gains.shape[1] if k is None else k
+        return self._divide(self.dcg(k), self.ideal_gains[:, :cutoff] @ self.discounts[:cutoff])
+
+    def reciprocal_rank(self, k: int = None) -> np.ndarray:
+        """
+        Returns 1 / the rank of the first relevant result of each query in the first k, 0 if
+        there is none.
+        """
+        relevant = self.relevant[:, :self._cutoff(k)]
+        if relevant.shape[1] == 0:
+            # no query has a result
+            return np.zeros(len(relevant))
+        first = np.argmax(relevant, axis=1)
+        return np.where(relevant.any(axis=1), 1 / (first + 1), 0.0)
+
+    def evaluate(self, ks=(None,)) -> dict:
+        """
+        Computes all the metrics of each query at each cutoff.
+
+        Parameters
+        ----------
+        ks : iterable of int
+            The cutoffs, None for the whole ranking.
+
+        Returns
+        -------
+        dict
+            From the metric name (e.g. "NDCG@10", or "NDCG" for None) to the array of the
+            per-query values.
+        """
+        metrics = {}
+        for k in ks:
+            suffix = "" if k is None else f"@{k}"
+            metrics["P" + suffix] = self.precision(k)
+            metrics["R" + suffix] = self.recall(k)
+            metrics["AP" + suffix] = self.average_precision(k)
+            metrics["DCG" + suffix] = self.dcg(k)
+            metrics["NDCG" + suffix] = self.ndcg(k)
+            metrics["RR" + suffix] = self.reciprocal_rank(k)
+        return metrics
+
+
+def read_trec_qrels(path: str) -> dict:
+    """
+    Reads a TREC qrels file, with lines "query_id iteration document_id relevance".
+
+    Parameters
+    ----------
+    path : str
+        The path of the qrels file.
+
+    Returns
+    -------
+    dict
+        From each query id to a dict from its judged documents to their relevance.
+    """
+    qrels = {}
+    with open(path, "r") as file:
+        for line in file:
+            fields = line.split()
+            if len(fields) != 4:
+                continue
+            query_id, _, document_id, relevance = fields
+            qrels.setdefault(query_id, {})[document_id] = float(relevance)
+    return qrels
+
+
+def read_trec_run(path: str):
+    """
+    Reads a TREC run file, with lines "query_id Q0 document_id rank score run_name", one query
+    at a time, so a run of any size is read with the memory of its largest query. The lines of a
+    query must be contiguous (as written by any TREC tool, or after sort -k1,1).
+
+    Parameters
+    ----------
+    path : str
+        The path of the run file.
+
+    Yields
+    ------
+    tuple
+        The query id and its document ids by decreasing score (ties by decreasing document id,
+        as trec_eval).
+    """
+    done = set()
+    query_id, results = None, []
+    with open(path, "r") as file:
+        for line in file:
+            fields = line.split()
+            if len(fields) < 6:
+                continue
+            if fields[0] != query_id:
+                if query_id is not None:
+                    yield query_id, [document for _, document in sorted(results, reverse=True)]
+                    done.add(query_id)
+                if fields[0] in done:
+                    raise ValueError(f"The lines of query {fields[0]} are not contiguous in {path}")
+                query_id, results = fields[0], []
+            results.append((float(fields[4]), fields[2]))
+    if query_id is not None:
+        yield query_id, [document for _, document in sorted(results, reverse=True)]
+
+
 class Evaluation:
 
     def __init__(self, name: str):
             self.name = name
 
-    def calculate_precision(self, actual: List[List[str]], predicted: List[List[str]]) -> float:
+    def calculate_precision(self, actual: List[List[str]], predicted: List[List[str]], k: int = None) -> float:
         """
         Calculates the precision of the predicted results
 
@@ -17,20 +244,19 @@ class Evaluation:
             The actual results
         predicted : List[List[str]]
             The predicted results
+        k : int
+            Only the first k predicted results of each query are considered, all if None
 
         Returns
         -------
         float
             The precision of the predicted results
         """
-        tp = 0
-        total = 0
-        for i in range(len(actual)):
-            tp += len(set(actual[i]).intersection(set(predicted[i]))) 
-            total += len(set(predicted[i])) 
-        return tp / total
+        matrix = RelevanceMatrix(actual, predicted, k)
+        num_retrieved = matrix.num_retrieved.sum()
+        return matrix.relevant.sum() / num_retrieved if num_retrieved > 0 else 0.0
     
-    def calculate_recall(self, actual: List[List[str]], predicted: List[List[str]]) -> float:
+    def calculate_recall(self, actual: List[List[str]], predicted: List[List[str]], k: int = None) -> float:
         """
         Calculates the recall of the predicted results
 
@@ -40,18 +266,17 @@ class Evaluation:
             The actual results
         predicted : List[List[str]]
             The predicted results
+        k : int
+            Only the first k predicted results of each query are considered, all if None
 
         Returns
         -------
         float
             The recall of the predicted results
         """
-        tp = 0
-        total = 0
-        for i in range(len(actual)):
-            tp += len(set(actual[i]).intersection(set(predicted[i]))) 
-            total += len(set(actual[i])) 
-        return tp / total  
+        matrix = RelevanceMatrix(actual, predicted, k)
+        num_relevant = matrix.num_relevant.sum()
+        return matrix.relevant.sum() / num_relevant if num_relevant > 0 else 0.0
     
     def calculate_F1(self, actual: List[List[str]], predicted: List[List[str]]) -> float:
         """
@@ -78,31 +303,27 @@ class Evaluation:
             f1 = (2 * p * r) / (p + r)
         return f1
     
-    def calculate_AP(self, actual: List[List[str]], predicted: List[List[str]]) -> float:
+    def calculate_AP(self, actual: List[str], predicted: List[str], k: int = None) -> float:
         """
-        Calculates the Mean Average Precision of the predicted results
+        Calculates the Average Precision of the predicted results of one query
 
         Parameters
         ----------
-        actual : List[List[str]]
+        actual : List[str]
             The actual results
-        predicted : List[List[str]]
+        predicted : List[str]
             The predicted results
+        k : int
+            Only the first k predicted results are considered, all if None
 
         Returns
         -------
         float
             The Average Precision of the predicted results
         """
-        AP = 0.0
-        tp = 0
-        for i in range(len(predicted)):
-            if predicted[i] in actual:
-                tp += 1
-                AP += tp / (i+1)
-        return AP / tp
+        return float(RelevanceMatrix([actual], [predicted], k).average_precision()[0])
     
-    def calculate_MAP(self, actual: List[List[str]], predicted: List[List[str]]) -> float:
+    def calculate_MAP(self, actual: List[List[str]], predicted: List[List[str]], k: int = None) -> float:
         """
         Calculates the Mean Average Precision of the predicted results
 
@@ -112,20 +333,19 @@ class Evaluation:
             The actual results
         predicted : List[List[str]]
             The predicted results
+        k : int
+            Only the first k predicted results of each query are considered, all if None
 
         Returns
         -------
         float
             The Mean Average Precision of the predicted results
         """
-        MAP = 0.0
-        for i in range(len(predicted)):
-            MAP += self.calculate_AP(actual[i], predicted[i])
-        return MAP / len(predicted)
+        return float(RelevanceMatrix(actual, predicted, k).average_precision().mean())
     
-    def cacluate_DCG(self, actual: List[List[str]], predicted: List[List[str]]) -> float:
+    def cacluate_DCG(self, actual: List[List[str]], predicted: List[List[str]], k: int = None) -> float:
         """
-        Calculates the Normalized Discounted Cumulative Gain (NDCG) of the predicted results
+        Calculates the Discounted Cumulative Gain (DCG) of the predicted results
 
         Parameters
         ----------
@@ -133,24 +353,17 @@ class Evaluation:
             The actual results
         predicted : List[List[str]]
             The predicted results
+        k : int
+            Only the first k predicted results of each query are considered, all if None
 
         Returns
         -------
         float
             The DCG of the predicted results
         """
-        DCG = 0.0
-        N = len(predicted)
-        for i in range(N):
-            for j in range(len(predicted[i])):
-                if predicted[i][j] in actual[i]:
-                    if j == 0:
-                        DCG += len(actual[i]) - actual[i].index(predicted[i][j])
-                    else:
-                        DCG += (len(actual[i]) - actual[i].index(predicted[i][j])) / (np.log(j + 1))
-        return DCG / N
+        return float(RelevanceMatrix(actual, predicted, k).dcg().mean())
     
-    def cacluate_NDCG(self, actual: List[List[str]], predicted: List[List[str]]) -> float:
+    def cacluate_NDCG(self, actual: List[List[str]], predicted: List[List[str]], k: int = None) -> float:
         """
         Calculates the Normalized Discounted Cumulative Gain (NDCG) of the predicted results
 
@@ -160,50 +373,37 @@ class Evaluation:
             The actual results
         predicted : List[List[str]]
             The predicted results
+        k : int
+            Only the first k predicted results of each query are considered, all if None
 
         Returns
         -------
         float
             The NDCG of the predicted results
         """
-        NDCG = 0.0
-        N = len(predicted)
-        for i in range(N):
-            normal_coeffs = []
-            for j in range(len(actual[i])):
-                if j == 0:
-                    normal_coeffs.append(len(actual[i]))
-                else:
-                    normal_coeffs.append(normal_coeffs[-1] + (len(actual[i]) - j) / (np.log(j + 1)))
-            for j in range(len(predicted[i])):
-                if predicted[i][j] in actual[i]:
-                    if j == 0:
-                        NDCG += (len(actual[i]) - actual[i].index(predicted[i][j])) / len(actual[i])
-                    else:    
-                        NDCG += ((len(actual[i]) - actual[i].index(predicted[i][j])) / (np.log(j + 1))) / normal_coeffs[j]
-        return NDCG
+        return float(RelevanceMatrix(actual, predicted, k).ndcg(k).mean())
     
-    def cacluate_RR(self, actual: List[List[str]], predicted: List[List[str]]) -> float:
+    def cacluate_RR(self, actual: List[str], predicted: List[str], k: int = None) -> float:
         """
-        Calculates the Mean Reciprocal Rank of the predicted results
+        Calculates the Reciprocal Rank of the predicted results of one query
 
         Parameters
         ----------
-        actual : List[List[str]]
+        actual : List[str]
             The actual results
-        predicted : List[List[str]]
+        predicted : List[str]
             The predicted results
+        k : int
+            Only the first k predicted results are considered, all if None
 
         Returns
         -------
         float
             The Reciprocal Rank of the predicted results
         """
-        for i in range(len(predicted)):
-            if predicted[i] in actual:
-                    return 1 / (i + 1)
+        return float(RelevanceMatrix([actual], [predicted], k).reciprocal_rank()[0])
     
-    def cacluate_MRR(self, actual: List[List[str]], predicted: List[List[str]]) -> float:
+    def cacluate_MRR(self, actual: List[List[str]], predicted: List[List[str]], k: int = None) -> float:
         """
         Calculates the Mean Reciprocal Rank of the predicted results
 
@@ -213,16 +413,15 @@ class Evaluation:
             The actual results
         predicted : List[List[str]]
             The predicted results
+        k : int
+            Only the first k predicted results of each query are considered, all if None
 
         Returns
         -------
         float
             The MRR of the predicted results
         """
-        MRR = 0.0
-        for i in range(len(predicted)):
-            MRR += self.cacluate_RR(actual[i], predicted[i])
-        return MRR / len(predicted)
+        return float(RelevanceMatrix(actual, predicted, k).reciprocal_rank().mean())
 
     def print_evaluation(self, precision, recall, f1, ap, MAP, dcg, ndcg, rr, mrr):
         """
@@ -236,16 +435,16 @@ class Evaluation:
             The recall of the predicted results
         f1 : float
             The F1 score of the predicted results
-        ap : float
-            The Average Precision of the predicted results
+        ap : np.ndarray
+            The Average Precision of each query
         map : float
             The Mean Average Precision of the predicted results
         dcg: float
             The Discounted Cumulative Gain of the predicted results
         ndcg : float
             The Normalized Discounted Cumulative Gain of the predicted results
-        rr: float
-            The Reciprocal Rank of the predicted results
+        rr: np.ndarray
+            The Reciprocal Rank of each query
         mrr : float
             The Mean Reciprocal Rank of the predicted results
             
@@ -273,24 +472,26 @@ class Evaluation:
             The recall of the predicted results
         f1 : float
             The F1 score of the predicted results
-        ap : float
-            The Average Precision of the predicted results
+        ap : np.ndarray
+            The Average Precision of each query
         map : float
             The Mean Average Precision of the predicted results
         dcg: float
             The Discounted Cumulative Gain of the predicted results
         ndcg : float
             The Normalized Discounted Cumulative Gain of the predicted results
-        rr: float
-            The Reciprocal Rank of the predicted results
+        rr: np.ndarray
+            The Reciprocal Rank of each query
         mrr : float
             The Mean Reciprocal Rank of the predicted results
             
         """        
+        # optional, only needed to log
+        import wandb
         wandb.init(project="Evaluation")
         wandb.log({"Precision": precision, "Recall": recall, "F1": f1, "MAP": map, "DCG": dcg, "NDCG": ndcg, "MRR": mrr})
 
-    def calculate_evaluation(self, actual: List[List[str]], predicted: List[List[str]]):
+    def calculate_evaluation(self, actual: List[List[str]], predicted: List[List[str]], log: bool = True):
         """
         call all functions to calculate evaluation metrics
 
@@ -300,19 +501,105 @@ class Evaluation:
             The actual results
         predicted : List[List[str]]
             The predicted results
+        log : bool
+            Whether to log the metrics to wandb (which then has to be installed)
             
         """
 
-        precision = self.calculate_precision(actual, predicted)
-        recall = self.calculate_recall(actual, predicted)
-        f1 = self.calculate_F1(actual, predicted)
-        ap = self.calculate_AP(actual, predicted)
-        map_score = self.calculate_MAP(actual, predicted)
-        dcg = self.cacluate_DCG(actual, predicted)
-        ndcg = self.cacluate_NDCG(actual, predicted)
-        rr = self.cacluate_RR(actual, predicted)
-        mrr = self.cacluate_MRR(actual, predicted)
+        # one matrix for all the metrics
+        matrix = RelevanceMatrix(actual, predicted)
+        num_retrieved, num_relevant = matrix.num_retrieved.sum(), matrix.num_relevant.sum()
+        precision = matrix.relevant.sum() / num_retrieved if num_retrieved > 0 else 0.0
+        recall = matrix.relevant.sum() / num_relevant if num_relevant > 0 else 0.0
+        f1 = 0 if precision == 0 and recall == 0 else (2 * precision * recall) / (precision + recall)
+        # the metrics of each query
+        ap = matrix.average_precision()
+        map_score = float(ap.mean())
+        dcg = float(matrix.dcg().mean())
+        ndcg = float(matrix.ndcg().mean())
+        rr = matrix.reciprocal_rank()
+        mrr = float(rr.mean())
 
         #call print and viualize functions
         self.print_evaluation(precision, recall, f1, ap, map_score, dcg, ndcg, rr, mrr)
-        self.log_evaluation(precision, recall, f1, ap, map_score, dcg, ndcg, rr, mrr)
+        if log:
+            self.log_evaluation(precision, recall, f1, ap, map_score, dcg, ndcg, rr, mrr)
+
+    def evaluate_trec(
+        self, qrels_path: str, run_path: str, output_path: str, ks=(None, 5, 10), batch_size: int = 1000
+    ):
+        """
+        Evaluates a TREC run file against a TREC qrels file in a streaming fashion: the run is
+        read one query at a time and evaluated batch_size queries at a time, so the memory does
+        not depend on the number of queries. Only the qrels are held in memory.
+
+        The metrics of each query are written to output_path as lines "metric query_id value"
+        (like trec_eval -q), followed by their means over the queries with query id "all". The
+        queries of the run without judgments are skipped, as with trec_eval.
+
+        Parameters
+        ----------
+        qrels_path : str
+            The path of the qrels file.
+        run_path : str
+            The path of the run file.
+        output_path : str
+            Where to write the metrics.
+        ks : iterable of int
+            The cutoffs, None for the whole ranking.
+        batch_size : int
+            The number of queries evaluated together.
+
+        Returns
+        -------
+        dict
+            The means of the metrics over the queries, with the number of queries in
+            "num_queries".
+        """
+        qrels = read_trec_qrels(qrels_path)
+        sums = {}
+        num_queries = 0
+
+        def evaluate_batch(query_ids, actual, predicted, file):
+            metrics = RelevanceMatrix(actual, predicted).evaluate(ks)
+            for name, values in metrics.items():
+                sums[name] = sums.get(name, 0.0) + float(values.sum())
+            names = list(metrics)
+            values = np.column_stack([metrics[name] for name in names]).tolist()
+            for query_id, query_values in zip(query_ids, values):
+                file.writelines(f"{name}\t{query_id}\t{value:.4f}\n" for name, value in zip(names, query_values))
+
+        with open(output_path, "w") as file:
+            query_ids, actual, predicted = [], [], []
+            for query_id, results in read_trec_run(run_path):
+                if query_id not in qrels:
+                    continue
+                query_ids.append(query_id)
+                actual.append(qrels[query_id])
+                predicted.append(results)
+                if len(query_ids) == batch_size:
+                    evaluate_batch(query_ids, actual, predicted, file)
+                    num_queries += len(query_ids)
+                    query_ids, actual, predicted = [], [], []
+            if query_ids:
+                evaluate_batch(query_ids, actual, predicted, file)
+                num_queries += len(query_ids)
+
+            means = {name: total / num_queries for name, total in sums.items()}
+            for name, value in means.items():
+                file.write(f"{name}\tall\t{value:.4f}\n")
+        means["num_queries"] = num_queries
+        return means
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate a TREC run file against TREC qrels")
+    parser.add_argument("--qrels", required=True)
+    parser.add_argument("--run", required=True)
+    parser.add_argument("--output", required=True, help="where to write the per-query and mean metrics")
+    parser.add_argument("--k", type=int, nargs="*", default=[5, 10], help="the cutoffs, besides the whole ranking")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    means = Evaluation("trec").evaluate_trec(args.qrels, args.run, args.output, [None] + args.k, args.batch_size)
+    print(json.dumps(means, indent=4))
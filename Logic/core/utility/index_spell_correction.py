@@ -0,0 +1,107 @@
+from functools import lru_cache
+
+from spell_correction import SpellCorrection
+
+
+class IndexSpellCorrection:
+    def __init__(self, spell_model, indexes, query_analyzer, cache_size=4096):
+        """
+        Spell correction driven by the vocabulary of the search indexes.
+
+        The query is split into words with the tokenization of the Preprocessor, so "spidr-man" is
+        the two words "spidr" and "man", as it is searched. A query word is only corrected if it is
+        out of vocabulary: its analyzed terms (the same terms the search looks up) are not all in
+        one of the field indexes. Stopwords analyze to
+        no term and are never corrected. The candidates are the words of the spell model whose
+        term is in an index, weighted by the document frequency of the term, so a word is never
+        corrected into a word that retrieves nothing. The corrections are cached per word.
+
+        Parameters
+        ----------
+        spell_model : SpellCorrection
+            Gives the surface words (the indexes only have normalized terms, which are not shown to
+            the user).
+        indexes : list of dict
+            The field indexes, from term to postings.
+        query_analyzer : QueryAnalyzer
+            The analyzer of the search engine.
+        cache_size : int
+            The number of corrected words cached.
+        """
+        self.indexes = indexes
+        self.query_analyzer = query_analyzer
+        self.document_frequencies = dict()
+        for index in indexes:
+            for term, postings in index.items():
+                self.document_frequencies[term] = self.document_frequencies.get(term, 0) + len(postings)
+
+        word_counter = dict()
+        preprocessor = query_analyzer.preprocessor
+        for word in spell_model.word_counter:
+            # not through query_analyzer.analyze, the vocabulary would evict the cached queries
+            terms = preprocessor.preprocess_text(word).split()
+            if len(terms) == 1 and terms[0] in self.document_frequencies:
+                word_counter[word] = self.document_frequencies[terms[0]]
+        self.spell_correction = SpellCorrection.from_word_counter(word_counter)
+        self.cache_size = cache_size
+        self._correct_word_cached = lru_cache(maxsize=cache_size)(self._correct_word)
+
+    def is_known(self, word: str):
+        """
+        Returns whether the word needs no correction: all its analyzed terms are in an index.
+        """
+        return all(term in self.document_frequencies for term in self.query_analyzer.analyze(word))
+
+    def get_words(self, query: str):
+        """
+        Returns the lower case words of the query, split as the Preprocessor splits it before
+        normalization: without links and punctuations, then tokenized.
+        """
+        preprocessor = self.query_analyzer.preprocessor
+        return preprocessor.tokenize(preprocessor.remove_punctuations(preprocessor.remove_links(query)).lower())
+
+    def get_unknown_words(self, query: str):
+        """
+        Returns the words of the query that would be corrected, in order.
+        """
+        return [word for word in self.get_words(query) if not self.is_known(word)]
+
+    def _correct_word(self, word: str):
+        candidates = self.spell_correction.find_nearest_words(word)
+        return candidates[0] if candidates else word
+
+    def correct_word(self, word: str):
+        """
+        Correct one lower case out-of-vocabulary word.
+
+        Parameters
+        ----------
+        word : str
+            The misspelled word.
+
+        Returns
+        -------
+        str
+            The word of the indexes vocabulary with the best score.
+        """
+        return self._correct_word_cached(word)
+
+    def spell_check(self, query: str):
+        """
+        Find correct form of a misspelled query. The known words are kept as they are.
+
+        Parameters
+        ----------
+        query : str
+            The misspelled query.
+
+        Returns
+        -------
+        str
+            Correct form of the query, lower case.
+        """
+        words = self.get_words(query)
+        return " ".join(word if self.is_known(word) else self.correct_word(word) for word in words)
+
+    def get_cache_info(self):
+        return self._correct_word_cached.cache_info()
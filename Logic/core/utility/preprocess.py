@@ -1,13 +1,46 @@
-import nltk
-from nltk.stem import WordNetLemmatizer, PorterStemmer
 import re
-from copy import deepcopy
 import os
 import json
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from term_normalizer import get_default_normalizer
+from tokenizer import get_tokenizer
+
+FIELDS = ["genres", "summaries", "stars"]
+STOPWORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stopwords.txt")
+
+TAG_PATTERN = re.compile(r"<[^<]+?>")
+# the link patterns only match inside a whitespace separated token, so they are only run on the
+# tokens containing one of their markers, in the same order as before
+LINK_PATTERNS = [re.compile(pattern) for pattern in [r'http\S*', r'www\S*', r'\S+\.com\S*', r'\S+\.org\S*', r'\S*@\S*']]
+LINK_MARKER_PATTERN = re.compile(r"http|www|\.com|\.org|@")
+LINK_TOKEN_PATTERN = re.compile(r"\S*(?:http|www|\.com|\.org|@)\S*")
+HTML_ENTITY_PATTERN = re.compile(r"&#[0-9]+;")
+NON_ASCII_PATTERN = re.compile(r"[\u0080-\uffff]|[^\w\x00-\x7f]")
+# new lines and ASCII punctuations are replaced by a space with one str.translate
+PUNCTUATION_TABLE = str.maketrans(
+    {character: " " for character in "\n" + "".join(chr(i) for i in range(128) if re.match(r"[^\w\s]", chr(i)))}
+)
+
+
+def _remove_links_from_token(match):
+    token = match.group()
+    for pattern in LINK_PATTERNS:
+        token = pattern.sub("", token)
+    return token
+
+
+@lru_cache(maxsize=None)
+def load_stopwords(path=STOPWORDS_PATH):
+    with open(path, "r") as file:
+        return tuple(line.strip().lower() for line in file if line.strip())
+
 
 class Preprocessor:
 
-    def __init__(self, documents: list):
+    def __init__(self, documents: list, normalizer=None, tokenizer="fast"):
         """
         Initialize the class.
 
@@ -15,12 +48,20 @@ class Preprocessor:
         ----------
         documents : list
             The list of documents to be preprocessed, path to stop words, or other parameters.
+        normalizer : TermNormalizer
+            Stems and lemmatizes the tokens. Defaults to the normalizer shared by the process.
+        tokenizer : str
+            "fast" (str.split on text without punctuation, token-identical to nltk) or "nltk"
+            (nltk.word_tokenize).
         """
-        # TODO
         self.documents = documents
-        self.stopwords = ["\bthis\b", "\bthat\b", "\babout\b", "\bwhom\b", "\bbeing\b", "\bwhere\b", "\bwhy\b", "\bhad\b", "\bshould\b", "\beach\b"]
-        self.stemmer = PorterStemmer()
-        self.lemmatizer = WordNetLemmatizer()
+        self.tokenizer = get_tokenizer(tokenizer)
+        self.normalizer = normalizer if normalizer is not None else get_default_normalizer()
+        self.stopwords = list(load_stopwords())
+        self.stopword_set = frozenset(self.stopwords)
+        self.stopwords_pattern = re.compile(
+            r"\b(?:" + "|".join(re.escape(stopword) for stopword in self.stopwords) + r")\b", re.IGNORECASE
+        )
 
     def preprocess(self):
         """
@@ -34,32 +75,57 @@ class Preprocessor:
         if len(self.documents) == 0:
             return []
         if type(self.documents[0]) is str:
-            documents = deepcopy(self.documents)
-            for i, doc in enumerate(documents):
-                documents[i] = self.remove_links(documents[i])
-                documents[i] = self.remove_punctuations(documents[i])
-                documents[i] = self.normalize(documents[i])
-                documents[i] = self.remove_stopwords(documents[i])
-            return documents
-        
-        documents = deepcopy(self.documents)
-        for doc in documents:
-            fields = ["genres", "summaries", "stars"]
-            for field in fields:
-                if doc[field] is None:
-                    continue
-                for i in range(len(doc[field])):
-                    doc[field][i] = self.remove_links(doc[field][i])
-                    doc[field][i] = self.remove_punctuations(doc[field][i])
-                    doc[field][i] = self.normalize(doc[field][i])
-                    doc[field][i] = self.remove_stopwords(doc[field][i])
-            fields = []
-            for field in fields:
-                if doc[field] is None:
-                    continue
-                for i in range(len(doc[field])):
-                    doc[field][i] = doc[field][i].lower()   
-        return documents
+            return [self.preprocess_text(doc) for doc in self.documents]
+
+        return [self.preprocess_document(doc) for doc in self.documents]
+
+    def preprocess_document(self, document: dict):
+        """
+        Preprocess the fields of one crawled movie.
+
+        Parameters
+        ----------
+        document : dict
+            The crawled movie. It is not modified.
+
+        Returns
+        ----------
+        dict
+            A shallow copy of the movie with its genres, summaries and stars preprocessed.
+        """
+        document = dict(document)
+        for field in FIELDS:
+            if document[field] is None:
+                continue
+            document[field] = [self.preprocess_text(text) for text in document[field]]
+        return document
+
+    def preprocess_text(self, text: str):
+        """
+        Preprocess one text with the fused pipeline: one pass removing links and HTML tags, one
+        pass replacing punctuations, then tokenization, stopword removal on the tokens, stemming
+        and lemmatization.
+
+        Parameters
+        ----------
+        text : str
+            The text to be preprocessed.
+
+        Returns
+        ----------
+        str
+            The preprocessed text.
+        """
+        text = self.remove_punctuations(self.remove_links(text))
+        # stopwords are removed before stemming, otherwise "this" would already be "thi"
+        tokens = [token for token in self.tokenize(text.lower()) if token not in self.stopword_set]
+        return " ".join(self.normalize_token(token) for token in tokens)
+
+    def normalize_token(self, token: str):
+        """
+        Stem and then lemmatize a lower case token.
+        """
+        return self.normalizer.normalize(token)
 
     def normalize(self, text: str):
         """
@@ -78,11 +144,8 @@ class Preprocessor:
         text = text.lower()
         # tokenization
         tokens = self.tokenize(text)
-        # stemming
-        stemmed = [self.stemmer.stem(token) for token in tokens]
-        # lemmatization of the stemmed tokens
-        lemmatized = [self.lemmatizer.lemmatize(stemmed_token) for stemmed_token in stemmed]
-        return " ".join(lemmatized)
+        # stemming and then lemmatization of the stemmed tokens
+        return " ".join(self.normalize_token(token) for token in tokens)
 
     def remove_links(self, text: str):
         """
@@ -98,12 +161,12 @@ class Preprocessor:
         str
             The text with links removed.
         """
-        # patterns = [r'\S*http\S*', r'\S*www\S*', r'\S+\.ir\S*', r'\S+\.com\S*', r'\S+\.org\S*', r'\S*@\S*']
-        patterns = [r'http\S*', r'www\S*', r'\S+\.com\S*', r'\S+\.org\S*', r'\S*@\S*']
-        clean_text = re.sub("<[^<]+?>","", text)
-        for pattern in patterns:
-            clean_text = re.sub(pattern, "", clean_text)
-        return clean_text
+        # fast path: most texts have no tags and no links
+        if "<" in text:
+            text = TAG_PATTERN.sub("", text)
+        if LINK_MARKER_PATTERN.search(text) is None:
+            return text
+        return LINK_TOKEN_PATTERN.sub(_remove_links_from_token, text)
 
     def remove_punctuations(self, text: str):
         """
@@ -119,10 +182,12 @@ class Preprocessor:
         str
             The text with punctuations removed.
         """
-        text = re.sub(r"\n", " ", text)
-        text = re.sub(r"&#[0-9]+;", " ", text)
-        text = re.sub(r"[\u0080-\uffff]", " ", text)
-        text = re.sub(r"[^\w\s]", " ", text)
+        if "&#" in text:
+            text = HTML_ENTITY_PATTERN.sub(" ", text)
+        text = text.translate(PUNCTUATION_TABLE)
+        # fast path: the regex is only needed for non-ASCII characters
+        if not text.isascii():
+            text = NON_ASCII_PATTERN.sub(" ", text)
         return text
 
     def tokenize(self, text: str):
@@ -139,7 +204,7 @@ class Preprocessor:
         list
             The list of words.
         """
-        return nltk.word_tokenize(text)
+        return self.tokenizer(text)
 
     def remove_stopwords(self, text: str):
         """
@@ -155,17 +220,95 @@ class Preprocessor:
         list
             The list of words with stopwords removed.
         """
-        for stopword in self.stopwords:
-            pattern = re.compile(stopword, re.IGNORECASE)
-            text = re.sub(pattern, "", text)
-        return text
+        return self.stopwords_pattern.sub("", text)
+
+_worker_preprocessor = None
+
+
+def _init_worker():
+    global _worker_preprocessor
+    _worker_preprocessor = Preprocessor([])
+
+
+def _preprocess_chunk(chunk):
+    # the documents are serialized in the worker, so the parent only writes lines
+    return [json.dumps(_worker_preprocessor.preprocess_document(document)) + "\n" for document in chunk]
+
+
+def load_documents(path):
+    """
+    Yields the documents of a JSON list or a JSONL (one document per line) file.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file. Files ending with .jsonl are read line by line.
+    """
+    with open(path, "r") as file:
+        if path.endswith(".jsonl"):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(file)
+
+
+def preprocess_parallel(documents, output_path, num_workers=None, chunk_size=16):
+    """
+    Preprocess crawled movies in worker processes and stream them to a JSONL file.
+
+    The documents are split in chunks that are sent to a pool of processes, each with its own
+    Preprocessor (and so its own stemmer and lemmatizer). At most two chunks per worker are in
+    flight, so the input can be a generator over a corpus larger than memory, and the results are
+    written in the input order as soon as they are ready.
+
+    Parameters
+    ----------
+    documents : iterable of dict
+        The crawled movies.
+    output_path : str
+        The JSONL file to write, one preprocessed movie per line.
+    num_workers : int
+        The number of processes. Defaults to the number of CPUs.
+    chunk_size : int
+        The number of documents sent to a worker at once.
+
+    Returns
+    ----------
+    int
+        The number of documents written.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    documents = iter(documents)
+    chunks = iter(lambda: list(itertools.islice(documents, chunk_size)), [])
+    written = 0
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker) as executor, \
+            open(output_path, "w") as file:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_preprocess_chunk, chunk))
+            if len(pending) >= 2 * num_workers:
+                lines = pending.popleft().result()
+                file.writelines(lines)
+                written += len(lines)
+        while pending:
+            lines = pending.popleft().result()
+            file.writelines(lines)
+            written += len(lines)
+    return written
+
 
 if __name__ == "__main__":
-    documents = None
-    with open(os.getcwd() + "/Logic/tests/CrawlerResults/IMDB_Crawled.json", "r") as file:
-        documents = json.load(file)
-    preprocessor = Preprocessor(documents)
-    preprocessed_documents = preprocessor.preprocess()
-    with open(os.getcwd() + "/Logic/Data/PreprocessedDocuments.json", "w") as file:
-        json.dump(preprocessed_documents, file)
-    print("the end!")
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Preprocess the crawled movies")
+    parser.add_argument("--input", default=os.getcwd() + "/Logic/tests/CrawlerResults/IMDB_Crawled.json")
+    parser.add_argument("--output", default=os.getcwd() + "/Logic/Data/PreprocessedDocuments.jsonl")
+    parser.add_argument("--workers", type=int, help="number of processes, defaults to the number of CPUs")
+    parser.add_argument("--chunk-size", type=int, default=16)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = preprocess_parallel(load_documents(args.input), args.output, args.workers, args.chunk_size)
+    print(f"{count} documents preprocessed in {time.perf_counter() - start:.1f} s, written to {args.output}")
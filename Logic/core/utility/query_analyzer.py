@@ -0,0 +1,61 @@
+from functools import lru_cache
+
+from preprocess import Preprocessor
+
+WARM_UP_QUERIES = ["spider man in wonderland", "the godfather", "tom holland movies"]
+
+
+class QueryAnalyzer:
+    def __init__(self, preprocessor=None, cache_size=4096):
+        """
+        Turns a raw query into the terms looked up in the indexes, with the same Preprocessor
+        pipeline as the documents.
+
+        One analyzer lives as long as the search engine, so the stopword pattern, the tokenizer and
+        the normalizer are set up once instead of per query, and the analyzed terms of recent
+        queries are kept in an LRU cache (users repeat queries, e.g. when paging or changing the
+        ranking method).
+
+        Parameters
+        ----------
+        preprocessor : Preprocessor
+            The preprocessor used for the queries. A new one if None.
+        cache_size : int
+            The number of raw queries whose terms are cached.
+        """
+        self.preprocessor = preprocessor if preprocessor is not None else Preprocessor([])
+        self.cache_size = cache_size
+        self._analyze_cached = lru_cache(maxsize=cache_size)(self._analyze)
+
+    def _analyze(self, query: str):
+        return tuple(self.preprocessor.preprocess_text(query).split())
+
+    def analyze(self, query: str):
+        """
+        Analyze a query.
+
+        Parameters
+        ----------
+        query : str
+            The raw query.
+
+        Returns
+        ----------
+        list
+            The terms of the query, in order, with duplicates.
+        """
+        return list(self._analyze_cached(query))
+
+    def warm_up(self, queries=WARM_UP_QUERIES):
+        """
+        Pays the one-time costs before the first user query: loading WordNet for the lemmatizer
+        and compiling the regexes of the tokenizer. The warm-up queries are not kept in the cache.
+        """
+        for query in queries:
+            self._analyze(query)
+
+    def get_cache_info(self):
+        return self._analyze_cached.cache_info()
+
+    def clear_cache(self):
+        self._analyze_cached.cache_clear()
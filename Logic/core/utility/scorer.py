@@ -1,8 +1,180 @@
 import numpy as np
 
 
+class CollectionModel:
+    def __init__(self, index, document_lengths):
+        """
+        Precomputed statistics of one field, used by the unigram model.
+
+        The collection probability of every term is computed once here, and the posting list of a
+        term is converted to NumPy arrays (document rows and tfs) the first time it is queried,
+        so scoring a query is a few array operations per term instead of a loop over documents.
+
+        Parameters
+        ----------
+        index : dict
+            The index of the field. The index type is: {term: {document_id: tf}}
+        document_lengths : dict
+            A dictionary of the document lengths. The keys are the document IDs, and the values are
+            the document's length in that field.
+        """
+        self.index = index
+        self.document_ids = list(document_lengths.keys())
+        self.document_rows = {document_id: row for row, document_id in enumerate(self.document_ids)}
+        self.document_lengths = np.array(
+            [document_lengths[document_id] for document_id in self.document_ids], dtype=np.float64
+        )
+        self.vocabulary_size = len(index)
+        total_length = float(sum(sum(postings.values()) for postings in index.values()))
+        self.collection_probabilities = {
+            term: sum(postings.values()) / total_length for term, postings in index.items()
+        } if total_length > 0 else {}
+        self.postings = {}
+
+    def get_postings(self, term):
+        """
+        Returns the posting list of a term as NumPy arrays.
+
+        Parameters
+        ----------
+        term : str
+            The term to get the posting list for.
+
+        Returns
+        -------
+        tuple
+            (rows, tfs). rows are the indexes of the documents in document_ids, sorted.
+        """
+        postings = self.postings.get(term, None)
+        if postings is None:
+            rows, tfs = [], []
+            for document_id, tf in self.index.get(term, {}).items():
+                row = self.document_rows.get(document_id, None)
+                if row is not None:
+                    rows.append(row)
+                    tfs.append(tf)
+            rows = np.array(rows, dtype=np.int64)
+            tfs = np.array(tfs, dtype=np.float64)
+            order = np.argsort(rows)
+            postings = (rows[order], tfs[order])
+            self.postings[term] = postings
+        return postings
+
+    def get_rows(self, document_ids):
+        """
+        Returns the sorted rows of the given document IDs, ignoring unknown documents.
+        """
+        rows = [self.document_rows[d] for d in document_ids if d in self.document_rows]
+        return np.unique(np.array(rows, dtype=np.int64))
+
+    def get_smoothing_parameters(self, smoothing_method, alpha, lamda):
+        """
+        Maps a smoothing method to the parameters of the general smoothed model
+
+            P(t|d) = (lamda * tf + P(t|C) * (lamda * mu + (1 - lamda) * (|d| + mu))) / (|d| + mu)
+
+        bayes is Dirichlet smoothing with prior mu = alpha (lamda = 1), mixture is Jelinek-Mercer
+        smoothing with weight lamda between the Dirichlet-smoothed document model (mu = alpha, which
+        is plain maximum likelihood for alpha = 0) and the collection model, and naive is add-one
+        (Laplace) smoothing, i.e. a uniform background model P(t|C) = 1 / |V| with mu = |V|.
+
+        Returns
+        -------
+        tuple
+            (mu, lamda, uniform_background)
+        """
+        if smoothing_method == "bayes":
+            return max(alpha, 0.0), 1.0, False
+        if smoothing_method == "mixture":
+            return max(alpha, 0.0), min(max(lamda, 0.0), 1.0), False
+        if smoothing_method == "naive":
+            return float(self.vocabulary_size), 1.0, True
+        raise ValueError(f"Invalid smoothing method: {smoothing_method}")
+
+    def score(self, query, smoothing_method, alpha=0.5, lamda=0.5, document_ids=None):
+        """
+        Scores documents with the query likelihood, in log space.
+
+        For every query term, the documents lacking it all get the same background mass
+        P(t|C) * c(d) with c(d) = (lamda * mu + (1 - lamda) * (|d| + mu)) / (|d| + mu), so
+
+            log P(q|d) = sum_t qtf * log P(t|C) + |q| * log c(d)
+                         + sum_{t in d} qtf * log(1 + lamda * tf / ((|d| + mu) * P(t|C) * c(d)))
+
+        Only the last sum depends on the postings, so each term costs one vectorized update over
+        its posting arrays. The first sum is the same for every document and is left out. Terms that
+        never occur in the field are ignored as well, since they would only add that same constant.
+
+        Parameters
+        ----------
+        query : List[str]
+            The query to be scored.
+        smoothing_method : str (bayes | naive | mixture)
+            The method used for smoothing the probabilities in the unigram model.
+        alpha : float, optional
+            The parameter used in bayesian smoothing method. Defaults to 0.5.
+        lamda : float, optional
+            The parameter used in the mixture method to balance between the document
+            probability and the collection probability. Defaults to 0.5.
+        document_ids : list, optional
+            The documents to score. Defaults to the documents containing at least one query term.
+
+        Returns
+        -------
+        dict
+            A dictionary of the document IDs and their scores.
+        """
+        mu, lamda, uniform_background = self.get_smoothing_parameters(smoothing_method, alpha, lamda)
+
+        query_tfs = {}
+        for term in query:
+            if term in self.collection_probabilities:
+                query_tfs[term] = query_tfs.get(term, 0) + 1
+        if len(query_tfs) == 0 and document_ids is None:
+            return {}
+
+        if document_ids is None:
+            rows = np.unique(np.concatenate([self.get_postings(term)[0] for term in query_tfs]))
+        else:
+            rows = self.get_rows(document_ids)
+        if len(rows) == 0:
+            return {}
+
+        lengths = self.document_lengths[rows]
+        denominators = np.maximum(lengths + mu, 1e-12)
+        background = (lamda * mu + (1 - lamda) * (lengths + mu)) / denominators
+        smoothed = uniform_background or lamda < 1 or mu > 0
+        if smoothed:
+            scores = sum(query_tfs.values()) * np.log(np.maximum(background, 1e-300))
+        else:
+            # unsmoothed maximum likelihood: a document lacking a term has probability 0
+            scores = np.zeros(len(rows))
+            missing = np.zeros(len(rows), dtype=bool)
+
+        for term, qtf in query_tfs.items():
+            term_rows, tfs = self.get_postings(term)
+            positions = np.searchsorted(rows, term_rows)
+            positions = np.minimum(positions, len(rows) - 1)
+            found = rows[positions] == term_rows
+            positions, tfs = positions[found], tfs[found]
+            if smoothed:
+                collection_probability = 1.0 / self.vocabulary_size if uniform_background else self.collection_probabilities[term]
+                scores[positions] += qtf * np.log1p(
+                    lamda * tfs / (denominators[positions] * collection_probability * background[positions])
+                )
+            else:
+                present = np.zeros(len(rows), dtype=bool)
+                present[positions] = True
+                missing |= ~present
+                scores[positions] += qtf * np.log(tfs / denominators[positions])
+
+        if not smoothed:
+            rows, scores = rows[~missing], scores[~missing]
+        return {self.document_ids[row]: float(score) for row, score in zip(rows, scores)}
+
+
 class Scorer:
-    def __init__(self, index, number_of_documents):
+    def __init__(self, index, number_of_documents, collection_model=None, document_norms=None, statistics_index=None):
         """
         Initializes the Scorer.
 
@@ -12,11 +184,25 @@ class Scorer:
             The index to score the documents with.
         number_of_documents : int
             The number of documents in the index.
+        collection_model : CollectionModel, optional
+            The precomputed statistics of the index for the unigram model. It is built from the
+            index on the first unigram query if None.
+        document_norms : dict, optional
+            A cache of the document vector lengths used by cosine normalization, of the form
+            {document_method: {document_id: norm}}. Missing entries are computed and stored in it,
+            so passing the same dict to the scorers of one index computes them only once.
+        statistics_index : dict, optional
+            The index the document frequencies and the cosine norms are computed from, if it is
+            not index, e.g. the full index of a field when index is one of its tiers, so the tiers
+            score like the full index.
         """
 
         self.index = index
         self.idf = {}
         self.N = number_of_documents
+        self.collection_model = collection_model
+        self.document_norms = document_norms if document_norms is not None else {}
+        self.statistics_index = statistics_index if statistics_index is not None else index
 
     def get_list_of_documents(self, query):
         """
@@ -66,8 +252,9 @@ class Scorer:
         """
         idf = self.idf.get(term, None)
         if idf is None:
-            # TODO
-            pass
+            df = len(self.statistics_index.get(term, {}))
+            idf = np.log(self.N / df) if df > 0 else 0.0
+            self.idf[term] = idf
         return idf
 
     def get_query_tfs(self, query):
@@ -84,10 +271,47 @@ class Scorer:
         dict
             A dictionary of the term frequencies of the terms in the query.
         """
+        query_tfs = {}
+        for term in query:
+            query_tfs[term] = query_tfs.get(term, 0) + 1
+        return query_tfs
+
+    def get_tf_weight(self, tf, method):
+        """
+        Returns the weight of a term frequency in the SMART notation: n (natural) or l (logarithm).
+        """
+        if method == "l":
+            return 1 + np.log(tf) if tf > 0 else 0.0
+        return tf
 
-        # TODO
+    def get_document_norms(self, document_method):
+        """
+        Returns the length of every document vector, weighted with the given method.
+
+        Parameters
+        ----------
+        document_method : str (n|l)(n|t)(n|c)
+            The method to use for the document.
 
-    def compute_scores_with_vector_space_model(self, query, method):
+        Returns
+        -------
+        dict
+            A dictionary of the document IDs and their vector lengths.
+        """
+        key = document_method[:2]
+        norms = self.document_norms.get(key, None)
+        if norms is None:
+            squares = {}
+            for term, postings in self.statistics_index.items():
+                idf = self.get_idf(term) if document_method[1] == "t" else 1.0
+                for document_id, tf in postings.items():
+                    weight = self.get_tf_weight(tf, document_method[0]) * idf
+                    squares[document_id] = squares.get(document_id, 0.0) + weight * weight
+            norms = {document_id: np.sqrt(square) for document_id, square in squares.items()}
+            self.document_norms[key] = norms
+        return norms
+
+    def compute_scores_with_vector_space_model(self, query, method, document_ids=None):
         """
         compute scores with vector space model
 
@@ -97,15 +321,24 @@ class Scorer:
             The query to be scored
         method : str ((n|l)(n|t)(n|c).(n|l)(n|t)(n|c))
             The method to use for searching.
+        document_ids : list, optional
+            The documents to score. Defaults to the documents containing at least one query term.
 
         Returns
         -------
         dict
             A dictionary of the document IDs and their scores.
         """
-
-        # TODO
-        pass
+        document_method, query_method = method.split(".")
+        query_tfs = self.get_query_tfs(query)
+        scores = {}
+        if document_ids is None:
+            document_ids = self.get_list_of_documents(query)
+        for document_id in document_ids:
+            scores[document_id] = self.get_vector_space_model_score(
+                query, query_tfs, document_id, document_method, query_method
+            )
+        return scores
 
     def get_vector_space_model_score(
         self, query, query_tfs, document_id, document_method, query_method
@@ -131,12 +364,32 @@ class Scorer:
         float
             The Vector Space Model score of the document for the query.
         """
-
-        # TODO
-        pass
+        score = 0.0
+        query_norm = 0.0
+        for term, query_tf in query_tfs.items():
+            query_weight = self.get_tf_weight(query_tf, query_method[0])
+            if query_method[1] == "t":
+                query_weight *= self.get_idf(term)
+            query_norm += query_weight * query_weight
+
+            tf = self.index.get(term, {}).get(document_id, 0)
+            if tf == 0:
+                continue
+            document_weight = self.get_tf_weight(tf, document_method[0])
+            if document_method[1] == "t":
+                document_weight *= self.get_idf(term)
+            score += document_weight * query_weight
+
+        if query_method[2] == "c" and query_norm > 0:
+            score /= np.sqrt(query_norm)
+        if document_method[2] == "c":
+            document_norm = self.get_document_norms(document_method).get(document_id, 0.0)
+            if document_norm > 0:
+                score /= document_norm
+        return float(score)
 
     def compute_socres_with_okapi_bm25(
-        self, query, average_document_field_length, document_lengths
+        self, query, average_document_field_length, document_lengths, k1=1.2, b=0.75, document_ids=None
     ):
         """
         compute scores with okapi bm25
@@ -150,18 +403,29 @@ class Scorer:
         document_lengths : dict
             A dictionary of the document lengths. The keys are the document IDs, and the values are
             the document's length in that field.
+        k1 : float
+            The term frequency saturation parameter.
+        b : float
+            The length normalization parameter.
+        document_ids : list, optional
+            The documents to score. Defaults to the documents containing at least one query term.
 
         Returns
         -------
         dict
             A dictionary of the document IDs and their scores.
         """
-
-        # TODO
-        pass
+        scores = {}
+        if document_ids is None:
+            document_ids = self.get_list_of_documents(query)
+        for document_id in document_ids:
+            scores[document_id] = self.get_okapi_bm25_score(
+                query, document_id, average_document_field_length, document_lengths, k1, b
+            )
+        return scores
 
     def get_okapi_bm25_score(
-        self, query, document_id, average_document_field_length, document_lengths
+        self, query, document_id, average_document_field_length, document_lengths, k1=1.2, b=0.75
     ):
         """
         Returns the Okapi BM25 score of a document for a query.
@@ -177,45 +441,60 @@ class Scorer:
         document_lengths : dict
             A dictionary of the document lengths. The keys are the document IDs, and the values are
             the document's length in that field.
+        k1 : float
+            The term frequency saturation parameter.
+        b : float
+            The length normalization parameter.
 
         Returns
         -------
         float
             The Okapi BM25 score of the document for the query.
         """
-
-        # TODO
-        pass
+        average_length = average_document_field_length or 1.0
+        length = document_lengths.get(document_id, average_length)
+        normalization = k1 * (1 - b + b * length / average_length)
+        score = 0.0
+        for term in query:
+            tf = self.index.get(term, {}).get(document_id, 0)
+            if tf == 0:
+                continue
+            df = len(self.statistics_index[term])
+            idf = np.log((self.N - df + 0.5) / (df + 0.5) + 1)
+            score += idf * tf * (k1 + 1) / (tf + normalization)
+        return float(score)
 
     def compute_scores_with_unigram_model(
-        self, query, smoothing_method, document_lengths=None, alpha=0.5, lamda=0.5
+        self, query, smoothing_method, document_lengths=None, alpha=0.5, lamda=0.5, document_ids=None
     ):
         """
         Calculates the scores for each document based on the unigram model.
 
         Parameters
         ----------
-        query : str
+        query : List[str]
             The query to search for.
         smoothing_method : str (bayes | naive | mixture)
             The method used for smoothing the probabilities in the unigram model.
         document_lengths : dict
             A dictionary of the document lengths. The keys are the document IDs, and the values are
-            the document's length in that field.
+            the document's length in that field. Only needed if the scorer has no collection model.
         alpha : float, optional
             The parameter used in bayesian smoothing method. Defaults to 0.5.
         lamda : float, optional
             The parameter used in some smoothing methods to balance between the document
             probability and the collection probability. Defaults to 0.5.
+        document_ids : list, optional
+            The documents to score. Defaults to the documents containing at least one query term.
 
         Returns
         -------
-        float
-            A dictionary of the document IDs and their scores.
+        dict
+            A dictionary of the document IDs and their log-likelihood scores (see CollectionModel.score).
         """
-
-        # TODO
-        pass
+        if self.collection_model is None:
+            self.collection_model = CollectionModel(self.index, document_lengths)
+        return self.collection_model.score(query, smoothing_method, alpha, lamda, document_ids)
 
     def compute_score_with_unigram_model(
         self, query, document_id, smoothing_method, document_lengths, alpha, lamda
@@ -225,7 +504,7 @@ class Scorer:
 
         Parameters
         ----------
-        query : str
+        query : List[str]
             The query to search for.
         document_id : str
             The document to calculate the score for.
@@ -245,6 +524,7 @@ class Scorer:
         float
             The Unigram score of the document for the query.
         """
-
-        # TODO
-        pass
+        scores = self.compute_scores_with_unigram_model(
+            query, smoothing_method, document_lengths, alpha, lamda, document_ids=[document_id]
+        )
+        return scores.get(document_id, float("-inf"))
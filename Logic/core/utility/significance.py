@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from evaluation import RelevanceMatrix, read_trec_qrels, read_trec_run
+
+
+def _randomization_count(differences, batches):
+    """
+    Counts the random sign flips of the differences whose mean is at least as far from 0 as the
+    observed mean, over the (size, seed) batches.
+    """
+    observed = abs(differences.mean())
+    count = 0
+    for size, seed in batches:
+        rng = np.random.default_rng(seed)
+        signs = rng.integers(0, 2, size=(size, len(differences)), dtype=np.int8) * 2 - 1
+        means = np.abs(signs @ differences) / len(differences)
+        # the tolerance keeps the permutations equal to the observed one from being lost to rounding
+        count += int((means >= observed - 1e-12).sum())
+    return count
+
+
+def _bootstrap_means(differences, batches):
+    """
+    Returns the means of the resamples (with replacement) of the differences, over the (size, seed)
+    batches.
+    """
+    means = []
+    for size, seed in batches:
+        rng = np.random.default_rng(seed)
+        indexes = rng.integers(0, len(differences), size=(size, len(differences)))
+        means.append(differences[indexes].mean(axis=1))
+    return np.concatenate(means) if means else np.empty(0, dtype=np.float64)
+
+
+def _run_parallel(function, differences, num_samples, seed, batch_size, workers):
+    """
+    Splits the samples into batches of batch_size, each with its own random stream, and the
+    batches between the workers, and returns the list of their results in batch order. The
+    samples only depend on the seed and the batch size, not on the number of workers.
+    """
+    num_batches = -(-num_samples // batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(num_batches)
+    batches = [
+        (min(batch_size, num_samples - i * batch_size), batch_seed) for i, batch_seed in enumerate(seeds)
+    ]
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, num_batches))
+    if workers == 1:
+        return [function(differences, batches)]
+    # contiguous chunks, so concatenating the results keeps the batch order
+    chunks = [batches[i * num_batches // workers:(i + 1) * num_batches // workers] for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(function, differences, chunk) for chunk in chunks]
+        return [future.result() for future in futures]
+
+
+def paired_randomization_test(first, second, num_samples=10000, seed=None, batch_size=1000, workers=None):
+    """
+    Paired randomization (permutation) test of the difference of the means of two systems'
+    per-query metrics: under the null hypothesis, the sign of each query's difference is random.
+
+    The resamples are generated as batch_size x queries sign matrices, so each batch is one
+    matrix product, and the batches are split between worker processes. Each batch has its own
+    random stream, so the p-value for a seed does not depend on the number of workers.
+
+    Parameters
+    ----------
+    first : array-like
+        The metric of each query for the first system.
+    second : array-like
+        The metric of the same queries for the second system.
+    num_samples : int
+        The number of random sign assignments.
+    seed : int
+        The seed of the random generator, for reproducible p-values.
+    batch_size : int
+        The number of resamples per matrix product.
+    workers : int
+        The number of processes, all the cores if None.
+
+    Returns
+    -------
+    dict
+        The mean difference (first - second) and the two-sided p-value.
+    """
+    differences = np.asarray(first, dtype=np.float64) - np.asarray(second, dtype=np.float64)
+    counts = _run_parallel(_randomization_count, differences, num_samples, seed, batch_size, workers)
+    return {
+        "mean_difference": float(differences.mean()),
+        "p_value": (sum(counts) + 1) / (num_samples + 1),
+    }
+
+
+def paired_bootstrap_test(
+    first, second, num_samples=10000, confidence=0.95, seed=None, batch_size=1000, workers=None
+):
+    """
+    Paired bootstrap test of the difference of the means of two systems' per-query metrics: the
+    queries are resampled with replacement, which gives a percentile confidence interval of the
+    mean difference, and the p-value is the share of the resampled differences, shifted to a mean
+    of 0, at least as far from 0 as the observed one.
+
+    Parameters
+    ----------
+    first : array-like
+        The metric of each query for the first system.
+    second : array-like
+        The metric of the same queries for the second system.
+    num_samples : int
+        The number of resamples.
+    confidence : float
+        The confidence level of the interval.
+    seed : int
+        The seed of the random generator.
+    batch_size : int
+        The number of resamples drawn at once.
+    workers : int
+        The number of processes, all the cores if None.
+
+    Returns
+    -------
+    dict
+        The mean difference (first - second), its confidence interval and the two-sided p-value.
+    """
+    differences = np.asarray(first, dtype=np.float64) - np.asarray(second, dtype=np.float64)
+    means = np.concatenate(_run_parallel(_bootstrap_means, differences, num_samples, seed, batch_size, workers))
+    observed = differences.mean()
+    alpha = 1 - confidence
+    low, high = np.percentile(means, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    p_value = (np.sum(np.abs(means - observed) >= abs(observed) - 1e-12) + 1) / (num_samples + 1)
+    return {
+        "mean_difference": float(observed),
+        "confidence_interval": [float(low), float(high)],
+        "p_value": float(p_value),
+    }
+
+
+def compare_runs(actual, first, second, metrics=("AP", "NDCG@10"), num_samples=10000, seed=None, workers=None):
+    """
+    Compares two rankings of the same queries with both tests, for each metric.
+
+    Parameters
+    ----------
+    actual : List[List[str]]
+        The actual results of each query (see RelevanceMatrix).
+    first : List[List[str]]
+        The predicted results of each query by the first system.
+    second : List[List[str]]
+        The predicted results of each query by the second system.
+    metrics : iterable of str
+        Names of metrics of RelevanceMatrix.evaluate, e.g. "AP", "NDCG@10" or "P@5".
+    num_samples : int
+        The number of resamples of each test.
+    seed : int
+        The seed of the random generators.
+    workers : int
+        The number of processes, all the cores if None.
+
+    Returns
+    -------
+    dict
+        For each metric, the means of both systems and the results of both tests.
+    """
+    cutoffs = {None if "@" not in metric else int(metric.split("@")[1]) for metric in metrics}
+    first_metrics = RelevanceMatrix(actual, first).evaluate(cutoffs)
+    second_metrics = RelevanceMatrix(actual, second).evaluate(cutoffs)
+    results = {}
+    for metric in metrics:
+        results[metric] = {
+            "first": float(first_metrics[metric].mean()),
+            "second": float(second_metrics[metric].mean()),
+            "randomization": paired_randomization_test(
+                first_metrics[metric], second_metrics[metric], num_samples, seed, workers=workers
+            ),
+            "bootstrap": paired_bootstrap_test(
+                first_metrics[metric], second_metrics[metric], num_samples, seed=seed, workers=workers
+            ),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two TREC runs with paired significance tests")
+    parser.add_argument("--qrels", required=True)
+    parser.add_argument("--first", required=True, help="the run file of the first system")
+    parser.add_argument("--second", required=True, help="the run file of the second system")
+    parser.add_argument("--metrics", nargs="*", default=["AP", "NDCG@10"])
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output", help="where to write the JSON results")
+    args = parser.parse_args()
+
+    qrels = read_trec_qrels(args.qrels)
+    first_run = dict(read_trec_run(args.first))
+    second_run = dict(read_trec_run(args.second))
+    # the judged queries, a query missing from a run has no results
+    query_ids = sorted(query_id for query_id in qrels if query_id in first_run or query_id in second_run)
+    results = compare_runs(
+        [qrels[query_id] for query_id in query_ids],
+        [first_run.get(query_id, []) for query_id in query_ids],
+        [second_run.get(query_id, []) for query_id in query_ids],
+        args.metrics,
+        args.samples,
+        args.seed,
+        args.workers,
+    )
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
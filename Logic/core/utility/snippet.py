@@ -1,9 +1,13 @@
 import re
-import nltk
-from nltk.stem import WordNetLemmatizer, PorterStemmer
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from term_normalizer import get_default_normalizer
+from tokenizer import get_tokenizer
 
 class Snippet:
-    def __init__(self, number_of_words_on_each_side=5):
+    def __init__(self, number_of_words_on_each_side=5, normalizer=None, tokenizer="fast"):
         """
         Initialize the Snippet
 
@@ -11,11 +15,16 @@ class Snippet:
         ----------
         number_of_words_on_each_side : int
             The number of words on each side of the query word in the doc to be presented in the snippet.
+        normalizer : TermNormalizer
+            Normalizes the doc and query tokens the same way as the index. Defaults to the
+            normalizer shared by the process.
+        tokenizer : str
+            "fast" or "nltk", see Preprocessor.
         """
         self.number_of_words_on_each_side = number_of_words_on_each_side
         self.stopwords = [r"\bthis\b", r"\bthat\b", r"\babout\b", r"\bwhom\b", r"\bbeing\b", r"\bwhere\b", r"\bwhy\b", r"\bhad\b", r"\bshould\b", r"\beach\b"]
-        self.stemmer = PorterStemmer()
-        self.lemmatizer = WordNetLemmatizer()
+        self.normalizer = normalizer if normalizer is not None else get_default_normalizer()
+        self.tokenizer = get_tokenizer(tokenizer)
 
     def remove_stop_words_from_query(self, query):
         """
@@ -56,90 +65,244 @@ class Snippet:
         not_exist_words : list
             Words in the query which don't exist in the doc.
         """
+        final_snippet, not_exist_words, _ = self.find_snippet_with_highlights(doc, query)
+        return final_snippet, not_exist_words
+
+    def analyze_doc(self, doc):
+        """
+        Tokenize and normalize a doc for find_snippet_with_highlights.
+
+        Parameters
+        ----------
+        doc : str
+            The doc.
+
+        Returns
+        -------
+        tuple
+            The tokens, their normalized terms and their character offsets in doc.
+        """
+        doc_tokens = self.tokenizer(doc)
+        doc_terms = self.normalizer.normalize_tokens([token.lower() for token in doc_tokens])
+        return doc_tokens, doc_terms, self.get_token_offsets(doc, doc_tokens)
+
+    def find_snippet_with_highlights(self, doc, query, analyzed_doc=None):
+        """
+        Find snippet in a doc based on a query, with the positions of the query words in the doc.
+
+        Each query term gets a slot (repeated terms share one). The windows of the snippet are
+        chosen greedily: the window of 2 * number_of_words_on_each_side + 1 words covering the most
+        query slots not covered yet (then the most occurrences), found with a sliding window over
+        the occurrences, until every slot occurring in the doc is covered. Each window is extended
+        by number_of_words_on_each_side words on both sides of its first and last occurrences, the
+        overlapping windows are merged, and they are joined with "..." in the order of the doc.
+        Everything is linear in the length of the doc for a given query.
+
+        Parameters
+        ----------
+        doc : str
+            The retrieved doc which the snippet should be extracted from that.
+        query : str
+            The query which the snippet should be extracted based on that.
+        analyzed_doc : tuple
+            The result of analyze_doc(doc), if it is already known.
+
+        Returns
+        -------
+        final_snippet : str
+            The final extracted snippet, with the query words wrapped by ***.
+        not_exist_words : list
+            Words in the query which don't exist in the doc.
+        highlights : list of tuple
+            (start, end) character offsets in doc of all the occurrences of the query words.
+        """
         k = self.number_of_words_on_each_side
-        doc_tokens = nltk.word_tokenize(doc)
-        query_tokens = nltk.word_tokenize(query)
-        doc_tokens_stemmed = [self.stemmer.stem(token) for token in doc_tokens]
-        query_tokens_stemmed = [self.stemmer.stem(token) for token in query_tokens]
-
-        # occurances
-        occs = []
-        exist_words = set()
-        for i, token in enumerate(doc_tokens_stemmed):
-            if token in query_tokens_stemmed:
-                occs.append((i, query_tokens_stemmed.index(token)))
-                exist_words.add(query_tokens_stemmed.index(token))
-        not_exist_words = [query_tokens[i] for i in range(len(query_tokens)) if i not in exist_words]
-
-        foo = [{} for query_index in range(len(query_tokens_stemmed))]
-        for (doc_pos, query_pos) in occs:
-            cnt = 0
-            for i in range(doc_pos - 1, doc_pos - k - 1, -1):
-                if i < 0:
-                    break
-                if doc_tokens_stemmed[i] in query_tokens_stemmed:
-                    cnt += 1
-            for i in range(doc_pos + 1, doc_pos + k + 1, 1):
-                if i >= len(doc_tokens_stemmed):
-                    break
-                if doc_tokens_stemmed[i] in query_tokens_stemmed:
-                    cnt += 1
-            foo[query_pos][doc_pos] = cnt
-        
-        for i in range(len(foo)):
-            if len(foo[i]) == 0:
-                continue
-            (doc_pos_mx, cnt_mx) = (-1, 0)
-            for doc_pos, cnt in foo[i].items():
-                if cnt > cnt_mx:
-                    (doc_pos_mx, cnt_mx) = (doc_pos, cnt)
-            foo[i] = {doc_pos_mx: cnt_mx}
-        
-        # (cnt, list of consecutive indexes)
-        windows = list()
-        visited_query_indexes = set()
-        for i in range(len(foo)):
-            if len(foo[i]) == 0 or i in visited_query_indexes:
-                continue
-            visited_query_indexes.add(i)
-            cnt = 1
-            pos = list(foo[i].keys())[0]
-            around_indexes = [pos]
-            for j in range(pos - 1, pos - 1 - k, -1):
-                if j < 0:
-                    break
-                around_indexes.append(j)
-            
-            j = pos + 1
-            bound = pos + 1 + k
-            while j < bound:
-                if j >= len(doc_tokens_stemmed):
-                    break
-                around_indexes.append(j)
-                if doc_tokens_stemmed[j] in query_tokens_stemmed:
-                    visited_query_indexes.add(query_tokens_stemmed.index(doc_tokens_stemmed[j]))
-                    bound = j + 1 + k
-                    cnt += 1
-                j += 1
-            
-            around_indexes = sorted(around_indexes)
-            windows.append((cnt, around_indexes))
-        
-        windows = sorted(windows)
+        doc_tokens, doc_terms, offsets = analyzed_doc if analyzed_doc is not None else self.analyze_doc(doc)
+        query_tokens = self.tokenizer(query)
+        query_terms = self.normalizer.normalize_tokens([token.lower() for token in query_tokens])
+
+        slots = dict()
+        for term in query_terms:
+            if term not in slots:
+                slots[term] = len(slots)
+        # (doc position, query slot) of the occurrences, in the order of the doc
+        occurrences = [(position, slots[term]) for position, term in enumerate(doc_terms) if term in slots]
+        found_slots = {slot for _, slot in occurrences}
+        not_exist_words = [
+            token for token, term in zip(query_tokens, query_terms) if slots[term] not in found_slots
+        ]
+
+        windows = []
+        uncovered_slots = set(found_slots)
+        while uncovered_slots:
+            first, last = self.find_best_window(occurrences, uncovered_slots, 2 * k + 1)
+            uncovered_slots -= {slot for position, slot in occurrences if first <= position <= last}
+            windows.append((max(0, first - k), min(len(doc_terms) - 1, last + k)))
+        merged_windows = []
+        for start, end in sorted(windows):
+            if merged_windows and start <= merged_windows[-1][1] + 1:
+                merged_windows[-1][1] = max(merged_windows[-1][1], end)
+            else:
+                merged_windows.append([start, end])
+
         window_strings = []
-        for window in windows:
-            around_indexes = window[1]
-            window_str = ""
-            for i in around_indexes:
-                if doc_tokens_stemmed[i] in query_tokens_stemmed:
-                    window_str += f"***{doc_tokens[i]}*** "
-                else:
-                    window_str += doc_tokens[i] + " "
-            window_str = window_str.strip()
-            window_strings.append(window_str)
-        result = "...".join(window_strings)
-        print(result)
-        return (result, not_exist_words)
+        for start, end in merged_windows:
+            window_tokens = [
+                f"***{doc_tokens[i]}***" if doc_terms[i] in slots else doc_tokens[i] for i in range(start, end + 1)
+            ]
+            window_strings.append(" ".join(window_tokens))
+        final_snippet = "...".join(window_strings)
+
+        highlights = [offsets[position] for position, _ in occurrences if offsets[position] is not None]
+        return final_snippet, not_exist_words, highlights
+
+    @staticmethod
+    def find_best_window(occurrences, slots, window_size):
+        """
+        Find the window of window_size consecutive words with the most distinct given slots, then
+        the most occurrences of them, with two pointers over the occurrences.
+
+        Parameters
+        ----------
+        occurrences : list of tuple
+            (doc position, query slot), sorted by position.
+        slots : set
+            The slots that count.
+        window_size : int
+            The number of words of a window.
+
+        Returns
+        -------
+        tuple
+            The positions of the first and the last occurrence of the given slots in the best window.
+        """
+        positions = [position for position, slot in occurrences if slot in slots]
+        window_slots = [slot for _, slot in occurrences if slot in slots]
+        counts = dict()
+        best, best_score = (positions[0], positions[0]), (0, 0)
+        left = 0
+        for right, position in enumerate(positions):
+            counts[window_slots[right]] = counts.get(window_slots[right], 0) + 1
+            while position - positions[left] >= window_size:
+                counts[window_slots[left]] -= 1
+                if counts[window_slots[left]] == 0:
+                    del counts[window_slots[left]]
+                left += 1
+            score = (len(counts), right - left + 1)
+            if score > best_score:
+                best, best_score = (positions[left], position), score
+        return best
+
+    @staticmethod
+    def get_token_offsets(doc, tokens):
+        """
+        Returns the (start, end) character offsets of the tokens in doc, None for the tokens the
+        tokenizer changed (e.g. the quotes of nltk.word_tokenize).
+        """
+        offsets = []
+        cursor = 0
+        for token in tokens:
+            start = doc.find(token, cursor)
+            if start == -1:
+                offsets.append(None)
+                continue
+            offsets.append((start, start + len(token)))
+            cursor = start + len(token)
+        return offsets
+
+
+class SnippetGenerator:
+    def __init__(self, get_doc, snippet=None, max_workers=4, cache_size=4096, doc_cache_size=1024):
+        """
+        Snippets of many docs at once, e.g. of a page of results, with two LRU caches: the snippets
+        by (doc id, query words, window size), so re-rendering a page costs nothing, and the
+        analyzed (tokenized and normalized) docs by doc id, so a doc is only analyzed once for all
+        the queries retrieving it.
+
+        Parameters
+        ----------
+        get_doc : callable
+            Returns the text of a doc from its id.
+        snippet : Snippet
+            Extracts the snippets. A new one if None.
+        max_workers : int
+            The number of threads the snippets of a batch are extracted in.
+        cache_size : int
+            The number of cached snippets.
+        doc_cache_size : int
+            The number of cached analyzed docs.
+        """
+        self.get_doc = get_doc
+        self.snippet = snippet if snippet is not None else Snippet()
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self.doc_cache_size = doc_cache_size
+        self.cache = OrderedDict()
+        self.doc_cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="snippet")
+        self.hits = 0
+        self.misses = 0
+
+    def _get_cached(self, cache, key):
+        with self.lock:
+            value = cache.get(key, None)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _put_cached(self, cache, key, value, max_size):
+        with self.lock:
+            cache[key] = value
+            if len(cache) > max_size:
+                cache.popitem(last=False)
+
+    def get_snippet(self, doc_id, query):
+        """
+        Returns find_snippet_with_highlights(doc, query) of the doc with the given id, from the
+        cache if possible.
+        """
+        key = (doc_id, tuple(query.lower().split()), self.snippet.number_of_words_on_each_side)
+        result = self._get_cached(self.cache, key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        doc = self.get_doc(doc_id)
+        analyzed_doc = self._get_cached(self.doc_cache, doc_id)
+        if analyzed_doc is None:
+            analyzed_doc = self.snippet.analyze_doc(doc)
+            self._put_cached(self.doc_cache, doc_id, analyzed_doc, self.doc_cache_size)
+        result = self.snippet.find_snippet_with_highlights(doc, query, analyzed_doc)
+        self._put_cached(self.cache, key, result, self.cache_size)
+        return result
+
+    def get_snippets(self, doc_ids, query, trace=None):
+        """
+        Extracts the snippets of the docs for the query, the ones not cached in the thread pool.
+
+        Parameters
+        ----------
+        doc_ids : list
+            The ids of the docs, e.g. the top results of the query.
+        query : str
+            The query.
+        trace : SearchTrace
+            If given, the time is recorded in its "snippets" stage.
+
+        Returns
+        -------
+        list of tuple
+            (final_snippet, not_exist_words, highlights) of each doc, in order.
+        """
+        if trace is not None:
+            with trace.stage("snippets"):
+                return self.get_snippets(doc_ids, query)
+        return list(self.executor.map(lambda doc_id: self.get_snippet(doc_id, query), doc_ids))
+
+    def get_stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.cache), "docs": len(self.doc_cache)}
+
 
 if __name__ == "__main__":
     query = "stumble stupid floats flying machines"
@@ -1,5 +1,22 @@
 import os
 import json
+import heapq
+import argparse
+import tempfile
+import zipfile
+import zlib
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+# find_nearest_words pads with words sharing no shingle when fewer than 5 words share one
+NUMBER_OF_CANDIDATES = 5
+# bump when the saved model layout or the shingling changes, older models are then rejected by load
+MODEL_FORMAT_VERSION = 1
+DEFAULT_MODEL_PATH = os.getcwd() + "/Logic/Data/spell_correction_model.npz"
+# what load raises for a missing, outdated, truncated or corrupt model
+MODEL_LOAD_ERRORS = (OSError, EOFError, KeyError, ValueError, NotImplementedError, zipfile.BadZipFile, zlib.error)
 
 class SpellCorrection:
     def __init__(self, all_documents):
@@ -11,7 +28,32 @@ class SpellCorrection:
         all_documents : list of str
             The input documents.
         """
-        self.all_shingled_words, self.word_counter = self.shingling_and_counting(all_documents)
+        self.all_shingled_words, self.word_counter, self.shingle_index = self.shingling_and_counting(all_documents)
+        # the words ranked first among those with a Jaccard score of 0, see find_nearest_words
+        self.fallback_words = heapq.nlargest(2 * NUMBER_OF_CANDIDATES, self.word_counter)
+
+    @classmethod
+    def from_word_counter(cls, word_counter):
+        """
+        Initialize the SpellCorrection from already counted words instead of documents.
+
+        Parameters
+        ----------
+        word_counter : dict
+            A dictionary from words to their TFs (or any other frequency).
+
+        Returns
+        -------
+        SpellCorrection
+            The spell corrector of the given vocabulary.
+        """
+        spell_correction = cls.__new__(cls)
+        spell_correction.word_counter = dict(word_counter)
+        spell_correction.all_shingled_words, spell_correction.shingle_index = spell_correction.index_words(
+            spell_correction.word_counter
+        )
+        spell_correction.fallback_words = heapq.nlargest(2 * NUMBER_OF_CANDIDATES, spell_correction.word_counter)
+        return spell_correction
 
     def shingle_word(self, word, k=2):
         """
@@ -76,9 +118,10 @@ class SpellCorrection:
             A dictionary from words to their shingle sets.
         word_counter : dict
             A dictionary from words to their TFs.
+        shingle_index : dict
+            An inverted index from each shingle to the list of words containing it.
         """
         documents = [doc.lower() for doc in all_documents]
-        all_shingled_words = dict()
         word_counter = dict()
 
         for doc in documents:
@@ -86,11 +129,118 @@ class SpellCorrection:
             for term in doc_splitted:
                 if term not in word_counter:
                     word_counter[term] = 0
-                    all_shingled_words[term] = self.shingle_word(term)
                 word_counter[term] += 1
-                
-        return all_shingled_words, word_counter
-    
+
+        all_shingled_words, shingle_index = self.index_words(word_counter)
+        return all_shingled_words, word_counter, shingle_index
+
+    def index_words(self, words):
+        """
+        Shingle the words and build the inverted index from shingles to words.
+
+        Parameters
+        ----------
+        words : iterable of str
+            The vocabulary, in the order the words were first seen.
+
+        Returns
+        -------
+        all_shingled_words : dict
+            A dictionary from words to their shingle sets.
+        shingle_index : dict
+            An inverted index from each shingle to the list of words containing it.
+        """
+        all_shingled_words = dict()
+        shingle_index = dict()
+        for term in words:
+            all_shingled_words[term] = self.shingle_word(term)
+            for shingle in all_shingled_words[term]:
+                if shingle not in shingle_index:
+                    shingle_index[shingle] = []
+                shingle_index[shingle].append(term)
+        return all_shingled_words, shingle_index
+
+    def save(self, path=DEFAULT_MODEL_PATH):
+        """
+        Save the model (vocabulary, counts and shingle index) in a compressed numpy archive.
+
+        The words and the shingles are stored as newline separated utf-8 bytes (they never contain
+        whitespace), the counts as an array and the posting lists as word ids in one flat array
+        with offsets, which is much smaller and faster to read than the json corpus. The archive is
+        written to a temporary file that then replaces the model, so a process loading the model,
+        or saving it at the same time, never sees a half-written archive.
+
+        Parameters
+        ----------
+        path : str
+            The path of the .npz file.
+        """
+        words = list(self.word_counter)
+        word_ids = {word: i for i, word in enumerate(words)}
+        shingles = list(self.shingle_index)
+        postings = [word_ids[word] for shingle in shingles for word in self.shingle_index[shingle]]
+        offsets = np.cumsum([0] + [len(self.shingle_index[shingle]) for shingle in shingles])
+        if not path.endswith(".npz"):
+            # as np.savez_compressed does for a path
+            path += ".npz"
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path) or "."
+        )
+        try:
+            with os.fdopen(file_descriptor, "wb") as file:
+                np.savez_compressed(
+                    file,
+                    version=np.array([MODEL_FORMAT_VERSION]),
+                    words=np.frombuffer("\n".join(words).encode("utf-8"), dtype=np.uint8),
+                    counts=np.array([self.word_counter[word] for word in words], dtype=np.int64),
+                    shingles=np.frombuffer("\n".join(shingles).encode("utf-8"), dtype=np.uint8),
+                    postings=np.array(postings, dtype=np.int32),
+                    offsets=offsets.astype(np.int64),
+                )
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL_PATH):
+        """
+        Load a model saved by save. The shingle sets of the words are not stored, they are
+        recomputed from the words.
+
+        Parameters
+        ----------
+        path : str
+            The path of the .npz file.
+
+        Returns
+        -------
+        SpellCorrection
+            The loaded spell corrector.
+        """
+        with np.load(path) as model:
+            version = int(model["version"][0])
+            if version != MODEL_FORMAT_VERSION:
+                raise ValueError(
+                    f"Spell correction model {path} has format version {version}, expected "
+                    f"{MODEL_FORMAT_VERSION}; rebuild it with spell_correction.py"
+                )
+            words = model["words"].tobytes().decode("utf-8").split("\n") if model["words"].size else []
+            shingles = model["shingles"].tobytes().decode("utf-8").split("\n") if model["shingles"].size else []
+            counts = model["counts"].tolist()
+            postings = model["postings"].tolist()
+            offsets = model["offsets"].tolist()
+
+        spell_correction = cls.__new__(cls)
+        spell_correction.word_counter = dict(zip(words, counts))
+        spell_correction.all_shingled_words = {word: spell_correction.shingle_word(word) for word in words}
+        spell_correction.shingle_index = {
+            shingle: [words[word_id] for word_id in postings[offsets[i]:offsets[i + 1]]]
+            for i, shingle in enumerate(shingles)
+        }
+        spell_correction.fallback_words = heapq.nlargest(2 * NUMBER_OF_CANDIDATES, spell_correction.word_counter)
+        return spell_correction
+
     def find_nearest_words(self, word):
         """
         Find correct form of a misspelled word.
@@ -105,24 +255,140 @@ class SpellCorrection:
         list of str
             5 nearest words.
         """
-        # (jaccard_score of term with word_shingle, term)
-        top5_candidates = list()
-
         word_shingled = self.shingle_word(word)
-        for term, term_shingled in self.all_shingled_words.items():
-            top5_candidates.append((self.jaccard_score(word_shingled, term_shingled), term))
-            if len(top5_candidates) > 5:
-                top5_candidates = sorted(top5_candidates, reverse=True)
-                del top5_candidates[-1]
+        # only the words sharing a shingle with the word can have a non-zero Jaccard score; the
+        # size of the intersection is the number of posting lists a word appears in
+        overlaps = Counter()
+        for shingle in word_shingled:
+            overlaps.update(self.shingle_index.get(shingle, ()))
+        shingles = self.all_shingled_words
+        # (jaccard_score of term with word_shingle, term)
+        top5_candidates = heapq.nlargest(
+            NUMBER_OF_CANDIDATES,
+            (
+                (overlap / (len(word_shingled) + len(shingles[term]) - overlap), term)
+                for term, overlap in overlaps.items()
+            ),
+        )
+        if len(top5_candidates) < NUMBER_OF_CANDIDATES:
+            top5_candidates += [(0, term) for term in self.fallback_words if term not in overlaps]
+            top5_candidates = top5_candidates[:NUMBER_OF_CANDIDATES]
         max_cf = self.word_counter[top5_candidates[0][1]]
         for i in range(1, len(top5_candidates)):
             max_cf = max(max_cf, self.word_counter[top5_candidates[i][1]])
         new_list = [(foo[0] * (self.word_counter[foo[1]] / max_cf), foo[0], foo[1]) for foo in top5_candidates]
         new_list = sorted(new_list, reverse=True)
-        top5_candidates = [(new_list[i][1], new_list[i][2]) for i in range(5)]
+        top5_candidates = [(new_list[i][1], new_list[i][2]) for i in range(len(new_list))]
 
         return [cand[1] for cand in top5_candidates]
     
+    def get_shingle_matrix(self):
+        """
+        Returns the vocabulary as a sparse binary matrix from words (rows, in word_counter order) to
+        shingles (columns, in shingle_index order), built on the first call.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            The word-shingle matrix.
+        """
+        if getattr(self, "_shingle_matrix", None) is None:
+            word_ids = {word: i for i, word in enumerate(self.word_counter)}
+            rows = [word_ids[word] for posting in self.shingle_index.values() for word in posting]
+            columns = [column for column, posting in enumerate(self.shingle_index.values()) for _ in posting]
+            self._shingle_matrix = sparse.csr_matrix(
+                (np.ones(len(rows), dtype=np.float64), (rows, columns)),
+                shape=(len(word_ids), len(self.shingle_index)),
+            )
+        return self._shingle_matrix
+
+    def find_nearest_words_batch(self, words, k=NUMBER_OF_CANDIDATES, chunk_size=256):
+        """
+        Find correct forms of many misspelled words at once, e.g. to clean a query log.
+
+        The words are encoded as sparse binary shingle matrices like the vocabulary, so the sizes of
+        the intersections of all the pairs are one sparse product, and the Jaccard scores, the top k
+        and the rescoring by frequency are array operations. The words are processed chunk_size at a
+        time so only a chunk_size x vocabulary array is in memory. With k = 5, the candidates and
+        their order are the same as find_nearest_words.
+
+        Parameters
+        ----------
+        words : list of str
+            The misspelled words.
+        k : int
+            The number of candidates per word.
+        chunk_size : int
+            The number of words scored together.
+
+        Returns
+        -------
+        list of list of str
+            The k nearest words of each word.
+        """
+        vocabulary_matrix = self.get_shingle_matrix()
+        vocabulary = np.array(list(self.word_counter), dtype=object)
+        counts = np.array(list(self.word_counter.values()), dtype=np.float64)
+        vocabulary_lengths = np.array([len(self.all_shingled_words[word]) for word in vocabulary], dtype=np.float64)
+        # find_nearest_words breaks ties between equal scores by the larger word
+        ranks = np.empty(len(vocabulary), dtype=np.float64)
+        words_by_rank = np.argsort(vocabulary)
+        ranks[words_by_rank] = np.arange(len(vocabulary))
+        words_by_rank = words_by_rank[::-1].tolist()
+        shingle_ids = {shingle: i for i, shingle in enumerate(self.shingle_index)}
+        k = min(k, len(vocabulary))
+
+        nearest_words = []
+        for chunk_start in range(0, len(words), chunk_size):
+            chunk = words[chunk_start:chunk_start + chunk_size]
+            word_shingles = [self.shingle_word(word) for word in chunk]
+            rows, columns = [], []
+            for row, shingles in enumerate(word_shingles):
+                # shingles absent from the vocabulary only count in the size of the word's set
+                for shingle in shingles:
+                    if shingle in shingle_ids:
+                        rows.append(row)
+                        columns.append(shingle_ids[shingle])
+            chunk_matrix = sparse.csr_matrix(
+                (np.ones(len(rows), dtype=np.float64), (rows, columns)),
+                shape=(len(chunk), vocabulary_matrix.shape[1]),
+            )
+            lengths = np.array([len(shingles) for shingles in word_shingles], dtype=np.float64)
+
+            # only the pairs sharing a shingle have a non-zero score, as in find_nearest_words
+            intersections = (chunk_matrix @ vocabulary_matrix.T).tocsr()
+            row_lengths = np.diff(intersections.indptr)
+            candidate_rows = np.repeat(np.arange(len(chunk)), row_lengths)
+            candidates = intersections.indices
+            overlaps = intersections.data
+            candidate_scores = overlaps / (lengths[candidate_rows] + vocabulary_lengths[candidates] - overlaps)
+            # two different Jaccard scores differ by at least 1 / max_union ** 2, so adding less than
+            # that in total for the rank orders equal scores by word without changing the others
+            max_union = lengths.max(initial=0) + vocabulary_lengths.max(initial=0) + 1
+            keys = candidate_scores + ranks[candidates] / (2 * max_union ** 2 * len(vocabulary))
+            # the candidates of each row stay in the row's range of the arrays, best first (keys are
+            # below 2, so sorting row * 2 - key sorts by row, then by decreasing key)
+            order = np.argsort(candidate_rows * 2.0 - keys)
+            positions = intersections.indptr[:-1, None] + np.arange(k)[None, :]
+            found = np.arange(k)[None, :] < row_lengths[:, None]
+            top = np.zeros((len(chunk), k), dtype=np.int64)
+            top_scores = np.zeros((len(chunk), k), dtype=np.float64)
+            top[found] = candidates[order[positions[found]]]
+            top_scores[found] = candidate_scores[order[positions[found]]]
+            # words sharing no shingle have a score of 0, the largest words come first
+            for row in np.flatnonzero(row_lengths < k):
+                present = set(top[row, :row_lengths[row]].tolist())
+                padding = (column for column in words_by_rank if column not in present)
+                for position in range(row_lengths[row], k):
+                    top[row, position] = next(padding)
+
+            top_counts = counts[top]
+            rescored = top_scores * (top_counts / top_counts.max(axis=1, keepdims=True))
+            # the rows sorted by (rescored, score, word), decreasing, as in find_nearest_words
+            order = np.lexsort((ranks[top], top_scores, rescored), axis=1)[:, ::-1]
+            nearest_words.extend(vocabulary[np.take_along_axis(top, order, axis=1)].tolist())
+        return nearest_words
+
     def spell_check(self, query):
         """
         Find correct form of a misspelled query.
@@ -151,10 +417,17 @@ class SpellCorrection:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the spell correction model and save it")
+    parser.add_argument("--corpus", default=os.getcwd() + "/Logic/Data/corpus_for_spell_correction.json")
+    parser.add_argument("--output", default=DEFAULT_MODEL_PATH)
+    args = parser.parse_args()
+
     corpus = []
-    with open(os.getcwd() + "/Logic/Data/corpus_for_spell_correction.json", "r") as file:
+    with open(args.corpus, "r") as file:
         corpus = json.load(file)
     spell_corrector = SpellCorrection(corpus)
+    spell_corrector.save(args.output)
+    print(f"Saved the model of {len(spell_corrector.word_counter)} words to {args.output}")
     nws = spell_corrector.find_nearest_words("how")
     print(nws)
     foo = spell_corrector.spell_check("Whaat the hel are yo doing")
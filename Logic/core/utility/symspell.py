@@ -0,0 +1,244 @@
+import os
+import json
+import heapq
+import argparse
+
+from spell_correction import SpellCorrection, NUMBER_OF_CANDIDATES
+
+
+def edit_distance(first_word, second_word, max_distance):
+    """
+    Optimal string alignment distance (Levenshtein with transpositions of adjacent letters).
+
+    Parameters
+    ----------
+    first_word : str
+        The first word.
+    second_word : str
+        The second word.
+    max_distance : int
+        The largest distance of interest.
+
+    Returns
+    -------
+    int
+        The distance, or max_distance + 1 if it is larger than max_distance.
+    """
+    if abs(len(first_word) - len(second_word)) > max_distance:
+        return max_distance + 1
+    # the common prefix and suffix do not change the distance
+    start = 0
+    for first_letter, second_letter in zip(first_word, second_word):
+        if first_letter != second_letter:
+            break
+        start += 1
+    end = 0
+    for first_letter, second_letter in zip(reversed(first_word), reversed(second_word)):
+        if first_letter != second_letter or end == min(len(first_word), len(second_word)) - start:
+            break
+        end += 1
+    first_word = first_word[start:len(first_word) - end]
+    second_word = second_word[start:len(second_word) - end]
+    if not first_word or not second_word:
+        distance = len(first_word) + len(second_word)
+        return distance if distance <= max_distance else max_distance + 1
+    if max_distance == 0:
+        return 1
+    # the first letters differ: try each edit of them, with a tighter bound as better ones are found
+    # (max_distance is small, so this is cheaper than filling the dynamic programming table)
+    best = max_distance + 1
+    edits = [(first_word[1:], second_word[1:]), (first_word[1:], second_word), (first_word, second_word[1:])]
+    if first_word[:2] == second_word[1::-1]:
+        edits.append((first_word[2:], second_word[2:]))
+    for first_rest, second_rest in edits:
+        if best < 2:
+            break
+        best = min(best, 1 + edit_distance(first_rest, second_rest, best - 2))
+    return best
+
+
+class SymSpell:
+    def __init__(self, word_counter, max_edit_distance=2, prefix_length=7):
+        """
+        Spell correction with the symmetric delete algorithm, an alternative to the Jaccard score
+        on bigrams of SpellCorrection.
+
+        Every word of the vocabulary is indexed under all the strings obtained by deleting up to
+        max_edit_distance of its letters. A misspelled word is looked up under its own deletes,
+        which gives every word within max_edit_distance edits without generating insertions or
+        substitutions, and the candidates are ranked by edit distance, then by frequency.
+
+        Parameters
+        ----------
+        word_counter : dict
+            A dictionary from words to their TFs, e.g. SpellCorrection.word_counter.
+        max_edit_distance : int
+            The largest number of edits corrected.
+        prefix_length : int
+            Only the deletes of the first prefix_length letters of the words are indexed, which
+            bounds the size of the dictionary for long words.
+        """
+        self.word_counter = word_counter
+        self.max_edit_distance = max_edit_distance
+        self.prefix_length = prefix_length
+        self.deletes = dict()
+        for word in word_counter:
+            for delete in self.get_deletes(word[:prefix_length]):
+                if delete not in self.deletes:
+                    self.deletes[delete] = []
+                self.deletes[delete].append(word)
+
+    @classmethod
+    def from_spell_correction(cls, spell_correction, **kwargs):
+        """
+        Build the dictionary from the vocabulary and the counts of a SpellCorrection.
+        """
+        return cls(spell_correction.word_counter, **kwargs)
+
+    def get_deletes(self, word):
+        """
+        Returns the word and all the strings made by deleting up to max_edit_distance letters.
+
+        Parameters
+        ----------
+        word : str
+            The input word.
+
+        Returns
+        -------
+        set
+            The deletes, including the word itself.
+        """
+        deletes = {word}
+        queue = [word]
+        for distance in range(self.max_edit_distance):
+            next_queue = []
+            for current in queue:
+                for i in range(len(current)):
+                    delete = current[:i] + current[i + 1:]
+                    if delete not in deletes:
+                        deletes.add(delete)
+                        next_queue.append(delete)
+            queue = next_queue
+        return deletes
+
+    def lookup(self, word, max_edit_distance=None, count=None):
+        """
+        Find the words of the vocabulary within max_edit_distance edits of the word.
+
+        Parameters
+        ----------
+        word : str
+            The misspelled word.
+        max_edit_distance : int
+            At most the max_edit_distance of the dictionary. The dictionary's if None.
+        count : int
+            If given, only the count best candidates are needed: once count candidates are found,
+            the words farther than the count-th of them are not looked up anymore.
+
+        Returns
+        -------
+        list of tuple
+            (word, distance, count) of the candidates, by distance then by decreasing count.
+        """
+        if max_edit_distance is None:
+            max_edit_distance = self.max_edit_distance
+        max_edit_distance = min(max_edit_distance, self.max_edit_distance)
+        word = word.lower()
+        candidates = dict()
+        # the negated distances of the count closest candidates, the farthest first
+        closest = []
+        checked = set()
+        prefix = word[:self.prefix_length]
+        deletes = {prefix}
+        queue = [prefix]
+        for distance in range(max_edit_distance + 1):
+            next_queue = []
+            for delete in queue:
+                for candidate in self.deletes.get(delete, ()):
+                    if candidate in checked:
+                        continue
+                    checked.add(candidate)
+                    candidate_distance = edit_distance(word, candidate, max_edit_distance)
+                    if candidate_distance > max_edit_distance:
+                        continue
+                    candidates[candidate] = candidate_distance
+                    if count is not None:
+                        if len(closest) < count:
+                            heapq.heappush(closest, -candidate_distance)
+                        elif -candidate_distance > closest[0]:
+                            heapq.heapreplace(closest, -candidate_distance)
+                        if len(closest) == count:
+                            max_edit_distance = -closest[0]
+                if distance < max_edit_distance:
+                    for i in range(len(delete)):
+                        next_delete = delete[:i] + delete[i + 1:]
+                        if next_delete not in deletes:
+                            deletes.add(next_delete)
+                            next_queue.append(next_delete)
+            # a word is at least as many edits away as the letters deleted from the misspelled word
+            # to reach it
+            if distance >= max_edit_distance:
+                break
+            queue = next_queue
+        suggestions = sorted(
+            (
+                (candidate, candidate_distance, self.word_counter[candidate])
+                for candidate, candidate_distance in candidates.items()
+                if candidate_distance <= max_edit_distance
+            ),
+            key=lambda suggestion: (suggestion[1], -suggestion[2], suggestion[0]),
+        )
+        return suggestions if count is None else suggestions[:count]
+
+    def find_nearest_words(self, word):
+        """
+        Find correct form of a misspelled word.
+
+        Parameters
+        ----------
+        word : str
+            The misspelled word.
+
+        Returns
+        -------
+        list of str
+            At most 5 nearest words, none if no word is within max_edit_distance edits.
+        """
+        return [suggestion[0] for suggestion in self.lookup(word, count=NUMBER_OF_CANDIDATES)]
+
+    def spell_check(self, query):
+        """
+        Find correct form of a misspelled query. Terms without a word within max_edit_distance
+        edits are kept as they are.
+
+        Parameters
+        ----------
+        query : str
+            The misspelled query.
+
+        Returns
+        -------
+        str
+            Correct form of the query.
+        """
+        fixed_query = []
+        for term in query.lower().split():
+            if term in self.word_counter:
+                fixed_query.append(term)
+            else:
+                candidates = self.lookup(term, count=1)
+                fixed_query.append(candidates[0][0] if candidates else term)
+        return " ".join(fixed_query)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Correct a query with the symmetric delete algorithm")
+    parser.add_argument("query", nargs="?", default="Whaat the hel are yo doing")
+    parser.add_argument("--corpus", default=os.getcwd() + "/Logic/Data/corpus_for_spell_correction.json")
+    args = parser.parse_args()
+
+    with open(args.corpus, "r") as file:
+        spell_corrector = SymSpell.from_spell_correction(SpellCorrection(json.load(file)))
+    print(spell_corrector.find_nearest_words("how"))
+    print(spell_corrector.spell_check(args.query))
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import nltk
+from nltk.stem import WordNetLemmatizer, PorterStemmer
+
+# bump when the normalization itself changes (e.g. a new step), so persisted caches are discarded
+NORMALIZATION_VERSION = 1
+DEFAULT_CACHE_PATH = os.getcwd() + "/Logic/Data/normalization_cache.json"
+
+
+class TermNormalizer:
+    def __init__(self, max_size=200000):
+        """
+        Maps a lower case raw token to its normalized term (Porter stemming, then WordNet
+        lemmatization of the stem), with a bounded LRU cache in front of the stemmer and the
+        lemmatizer.
+
+        The vocabulary is Zipfian, so a cache of the most frequent tokens removes most of the
+        stemming work. Indexing (Preprocessor), query processing and snippets all normalize
+        through this class, so a token is always normalized the same way on both sides.
+
+        Parameters
+        ----------
+        max_size : int
+            The maximum number of cached tokens. The least recently used ones are evicted.
+        """
+        self.max_size = max_size
+        self.stemmer = PorterStemmer()
+        self.lemmatizer = WordNetLemmatizer()
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def signature(self):
+        """
+        Identifies the normalization: the version of this class, of NLTK and the stemmer mode.
+        A persisted cache is only used if it was built with the same signature.
+        """
+        description = f"{NORMALIZATION_VERSION}|{nltk.__version__}|{self.stemmer.mode}|{type(self.lemmatizer).__name__}"
+        return hashlib.sha1(description.encode()).hexdigest()[:16]
+
+    def normalize(self, token: str):
+        """
+        Normalize a lower case token.
+
+        Parameters
+        ----------
+        token : str
+            The token.
+
+        Returns
+        ----------
+        str
+            The stemmed and lemmatized token.
+        """
+        term = self.cache.get(token, None)
+        if term is not None:
+            self.hits += 1
+            try:
+                self.cache.move_to_end(token)
+            except KeyError:
+                # evicted by another thread in the meantime
+                pass
+            return term
+        self.misses += 1
+        term = self.lemmatizer.lemmatize(self.stemmer.stem(token))
+        with self.lock:
+            self.cache[token] = term
+            if len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        return term
+
+    def normalize_tokens(self, tokens):
+        """
+        Normalize a list of lower case tokens.
+        """
+        return [self.normalize(token) for token in tokens]
+
+    def warm_up(self, tokens):
+        """
+        Fill the cache with the given tokens, e.g. the most frequent tokens of the corpus.
+        """
+        for token in tokens:
+            self.normalize(token)
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.cache),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def save(self, path=DEFAULT_CACHE_PATH):
+        """
+        Store the cache with the signature of the normalization.
+        """
+        with self.lock:
+            terms = dict(self.cache)
+        with open(path, "w") as file:
+            json.dump({"signature": self.signature, "terms": terms}, file)
+
+    def load(self, path=DEFAULT_CACHE_PATH):
+        """
+        Load a stored cache. It is ignored if it was built with another normalization.
+
+        Returns
+        ----------
+        bool
+            Whether the cache was loaded.
+        """
+        if not os.path.exists(path):
+            return False
+        with open(path, "r") as file:
+            stored = json.load(file)
+        if stored.get("signature", None) != self.signature:
+            print(f"Ignoring the normalization cache {path}: it was built with another normalization")
+            return False
+        with self.lock:
+            for token, term in stored["terms"].items():
+                self.cache[token] = term
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        return True
+
+
+_default_normalizer = None
+_default_normalizer_lock = threading.Lock()
+
+
+def get_default_normalizer():
+    """
+    Returns the normalizer shared by the whole process, loading the stored cache the first time.
+    """
+    global _default_normalizer
+    if _default_normalizer is None:
+        with _default_normalizer_lock:
+            if _default_normalizer is None:
+                normalizer = TermNormalizer()
+                normalizer.load()
+                _default_normalizer = normalizer
+    return _default_normalizer
+
+
+if __name__ == "__main__":
+    import argparse
+    import re
+    from collections import Counter
+
+    parser = argparse.ArgumentParser(description="Build the normalization cache from the most frequent tokens of the corpus")
+    parser.add_argument("--corpus", default=os.getcwd() + "/Logic/tests/CrawlerResults/IMDB_Crawled.json")
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--output", default=DEFAULT_CACHE_PATH)
+    args = parser.parse_args()
+
+    with open(args.corpus, "r") as file:
+        movies = json.load(file)
+    counts = Counter()
+    for movie in movies:
+        for field in ["genres", "summaries", "stars"]:
+            for text in movie[field] or []:
+                counts.update(re.findall(r"[a-z0-9_]+", text.lower()))
+    normalizer = TermNormalizer(args.size)
+    # the most frequent tokens last, so they are the most recently used
+    normalizer.warm_up(reversed([token for token, _ in counts.most_common(args.size)]))
+    normalizer.save(args.output)
+    covered = sum(count for _, count in counts.most_common(args.size)) / max(sum(counts.values()), 1)
+    print(f"{len(normalizer.cache)} tokens cached in {args.output}, covering {covered:.1%} of the token occurrences")
@@ -0,0 +1,58 @@
+import re
+
+import nltk
+
+# the only rules of nltk.word_tokenize that split a token made of word characters: the Treebank
+# contractions, always split after their third letter ("cannot" -> "can", "not")
+CONTRACTIONS = frozenset(["cannot", "gimme", "gonna", "gotta", "lemme", "wanna"])
+CONTRACTION_PATTERN = re.compile(r"(?i)\b(?:cannot|gimme|gonna|gotta|lemme|wanna)\b")
+NOT_WORD_OR_SPACE_PATTERN = re.compile(r"[^\w\s]")
+
+
+def fast_tokenize(text: str):
+    """
+    Tokenize the text like nltk.word_tokenize, but with str.split when the text has no
+    punctuation, which is always the case after Preprocessor.remove_punctuations.
+
+    Without punctuation, word_tokenize has a single sentence and only splits the Treebank
+    contractions on top of the whitespace, so the two are token-identical. Text with punctuation
+    is passed to nltk.word_tokenize.
+
+    Parameters
+    ----------
+    text : str
+        The text to be tokenized.
+
+    Returns
+    ----------
+    list
+        The list of words.
+    """
+    if NOT_WORD_OR_SPACE_PATTERN.search(text) is not None:
+        return nltk.word_tokenize(text)
+    tokens = text.split()
+    if CONTRACTION_PATTERN.search(text) is None:
+        return tokens
+    split_tokens = []
+    for token in tokens:
+        if token.lower() in CONTRACTIONS:
+            split_tokens.append(token[:3])
+            split_tokens.append(token[3:])
+        else:
+            split_tokens.append(token)
+    return split_tokens
+
+
+TOKENIZERS = {
+    "nltk": nltk.word_tokenize,
+    "fast": fast_tokenize,
+}
+
+
+def get_tokenizer(name: str):
+    """
+    Returns the tokenizer with the given name: "fast" (default) or "nltk".
+    """
+    if name not in TOKENIZERS:
+        raise ValueError(f"Unknown tokenizer {name}, expected one of {list(TOKENIZERS)}")
+    return TOKENIZERS[name]
@@ -0,0 +1,443 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.append(os.getcwd() + "/Logic/")
+sys.path.append(os.getcwd() + "/Logic/core/utility/")
+
+
+class ServiceError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        """
+        An error that is reported back to the client as a JSON response.
+
+        Parameters
+        ----------
+        status : HTTPStatus
+            The HTTP status of the response.
+        message : str
+            The message sent to the client.
+        """
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class SearchService:
+    def __init__(
+        self,
+        backend=None,
+        host="127.0.0.1",
+        port=8080,
+        max_workers=4,
+        max_queue=64,
+        max_body_size=64 * 1024,
+        request_timeout=30.0,
+        executor=None,
+    ):
+        """
+        A standalone asyncio JSON/HTTP service in front of the search engine.
+
+        Parameters
+        ----------
+        backend : module
+            The object providing `search`, `correct_text`, `get_movie_by_id` and `movies_dataset`.
+            Defaults to `Logic/utils.py`.
+        host : str
+            The host to listen on.
+        port : int
+            The port to listen on.
+        max_workers : int
+            The number of requests that are processed by the executor at the same time.
+        max_queue : int
+            The number of requests that may wait for a free worker. Requests beyond
+            max_workers + max_queue are rejected with 503 instead of being queued.
+        max_body_size : int
+            The maximum size of a request body in bytes.
+        request_timeout : float
+            Seconds to wait for reading a request and for the backend to answer it.
+        executor : concurrent.futures.Executor
+            The executor used for CPU-bound work. A ThreadPoolExecutor with max_workers threads
+            is created if None.
+        """
+        if backend is None:
+            import utils as backend
+        self.backend = backend
+        self.host = host
+        self.port = port
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_body_size = max_body_size
+        self.request_timeout = request_timeout
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers=max_workers)
+        self.snippet = None
+        self.server = None
+        self.workers = None
+        self.pending = 0
+        self.routes = {
+            "/health": self.handle_health,
+            "/search": self.handle_search,
+            "/spell": self.handle_spell,
+            "/snippet": self.handle_snippet,
+            "/movie": self.handle_movie,
+        }
+
+    async def start(self):
+        """
+        Loads the backend data in the executor and starts listening.
+        """
+        loop = asyncio.get_running_loop()
+        self.workers = asyncio.Semaphore(self.max_workers)
+        if hasattr(self.backend, "init_utils"):
+            await loop.run_in_executor(self.executor, self.backend.init_utils)
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, limit=self.max_body_size
+        )
+        return self.server
+
+    async def serve_forever(self):
+        """
+        Starts the service and serves requests until cancelled.
+        """
+        await self.start()
+        print(f"Search service listening on http://{self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        """
+        Stops listening and shuts the executor down.
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=False)
+
+    async def run_in_executor(self, function, *args):
+        """
+        Runs the CPU-bound function in the executor, applying backpressure.
+
+        At most max_workers jobs run at the same time and at most max_queue jobs wait for them.
+        Anything beyond that is rejected right away, so a burst of requests cannot pile up
+        unbounded work behind the executor. A request that times out gets a 504, but its job keeps
+        its slot until it actually finishes, so jobs left running by timeouts are still bounded.
+
+        Parameters
+        ----------
+        function : callable
+            The function to run.
+        args : list
+            The arguments of the function.
+
+        Returns
+        -------
+        object
+            The return value of the function.
+        """
+        if self.pending >= self.max_workers + self.max_queue:
+            raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many pending requests")
+        self.pending += 1
+        loop = asyncio.get_running_loop()
+        # the timeout covers both the wait for a worker and the job
+        deadline = loop.time() + self.request_timeout
+        try:
+            await asyncio.wait_for(self.workers.acquire(), self.request_timeout)
+        except BaseException as e:
+            self.pending -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                raise ServiceError(HTTPStatus.GATEWAY_TIMEOUT, "The search backend timed out")
+            raise
+        try:
+            future = self.executor.submit(function, *args)
+        except BaseException:
+            self.release_slot()
+            raise
+        # the slot is released when the function is done (or cancelled before it started), not when
+        # the request stops waiting, so timed out jobs still running keep counting against the limits
+        future.add_done_callback(lambda _: self.call_in_loop(loop, self.release_slot))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            raise ServiceError(HTTPStatus.GATEWAY_TIMEOUT, "The search backend timed out")
+
+    def release_slot(self):
+        self.pending -= 1
+        self.workers.release()
+
+    @staticmethod
+    def call_in_loop(loop, callback):
+        """
+        Schedules the callback in the event loop from an executor thread, unless the loop is closed.
+        """
+        try:
+            loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            pass
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serves the HTTP requests of one connection. Keep-alive connections are served until the
+        client closes them or sends `Connection: close`.
+        """
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), self.request_timeout)
+                except ServiceError as e:
+                    await self.write_response(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+                method, path, params, keep_alive = request
+                status, body = await self.dispatch(method, path, params)
+                await self.write_response(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def read_request(self, reader):
+        """
+        Reads and parses one HTTP request.
+
+        Returns
+        -------
+        tuple
+            (method, path, params, keep_alive) or None if the client closed the connection.
+            params merges the query string with the JSON body of the request.
+        """
+        try:
+            request_line = await reader.readline()
+        except ValueError:
+            raise ServiceError(HTTPStatus.REQUEST_URI_TOO_LONG, "Request line too long")
+        if not request_line:
+            return None
+        parts = request_line.decode("latin-1").strip().split()
+        if len(parts) != 3:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+        method, target, version = parts
+
+        headers = {}
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                raise ServiceError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Header too long")
+            line = line.decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        length = headers.get("content-length", "0") or "0"
+        # only plain digits: int() would also accept signs, spaces and underscores
+        if not (length.isascii() and length.isdigit()):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length header")
+        length = int(length)
+        if length > self.max_body_size:
+            raise ServiceError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        if length > 0:
+            body = await reader.readexactly(length)
+            try:
+                data = json.loads(body)
+            except ValueError:
+                raise ServiceError(HTTPStatus.BAD_REQUEST, "The request body is not valid JSON")
+            if not isinstance(data, dict):
+                raise ServiceError(HTTPStatus.BAD_REQUEST, "The request body must be a JSON object")
+            params.update(data)
+        return method.upper(), url.path, params, keep_alive
+
+    async def write_response(self, writer, status, body, keep_alive):
+        """
+        Writes a JSON response and waits until the transport buffer drains.
+        """
+        payload = json.dumps(body).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        )
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            head += "Retry-After: 1\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + payload)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def dispatch(self, method, path, params):
+        """
+        Finds the handler of the path and runs it.
+
+        Returns
+        -------
+        tuple
+            (HTTPStatus, JSON-serializable body)
+        """
+        if method not in ("GET", "POST"):
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"Method {method} is not allowed"}
+        route = "/" + path.strip("/").split("/")[0]
+        handler = self.routes.get(route, None)
+        if handler is None:
+            return HTTPStatus.NOT_FOUND, {"error": f"No such endpoint: {path}"}
+        rest = path.strip("/").split("/")[1:]
+        if rest:
+            params.setdefault("id", rest[0])
+        try:
+            return HTTPStatus.OK, await handler(params)
+        except ServiceError as e:
+            return e.status, {"error": e.message}
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"}
+
+    def get_param(self, params, name, cast=str, default=None):
+        """
+        Returns a request parameter converted with cast, or default if it is missing.
+        """
+        value = params.get(name, None)
+        if value is None or value == "":
+            if default is None and cast is str:
+                raise ServiceError(HTTPStatus.BAD_REQUEST, f"Missing parameter: {name}")
+            return default
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, f"Invalid value for parameter: {name}")
+
+    async def handle_health(self, params):
+        return {"status": "ok", "pending": self.pending}
+
+    async def handle_search(self, params):
+        """
+        Parameters: query, max_results, method, weights (list or comma separated), safe_ranking,
+        smoothing_method, alpha, lamda.
+        """
+        query = self.get_param(params, "query")
+        weights = params.get("weights", [0.3, 0.3, 1])
+        if isinstance(weights, str):
+            weights = weights.split(",")
+        try:
+            weights = [float(w) for w in weights]
+        except (TypeError, ValueError):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "Invalid value for parameter: weights")
+        if len(weights) != 3:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "weights must have 3 values: stars, genres, summaries")
+        safe_ranking = params.get("safe_ranking", True)
+        if isinstance(safe_ranking, str):
+            safe_ranking = safe_ranking.lower() not in ("0", "false", "no")
+
+        max_results = self.get_param(params, "max_results", int, 10)
+        method = self.get_param(params, "method", str, "ltn.lnn")
+        smoothing_method = params.get("smoothing_method", None)
+        alpha = self.get_param(params, "alpha", float, 0.5)
+        lamda = self.get_param(params, "lamda", float, 0.5)
+
+        start = time.time()
+        result = await self.run_in_executor(
+            lambda: self.backend.search(
+                query,
+                max_results,
+                method,
+                weights,
+                unigram_smoothing=smoothing_method,
+                alpha=alpha,
+                lamda=lamda,
+                safe_ranking=bool(safe_ranking),
+            )
+        )
+        end = time.time()
+        return {
+            "query": query,
+            "results": [{"id": doc_id, "score": score} for doc_id, score in result],
+            "search_time_ms": (end - start) * 1e3,
+        }
+
+    async def handle_spell(self, params):
+        """
+        Parameters: text.
+        """
+        text = self.get_param(params, "text")
+        corrected = await self.run_in_executor(self.backend.correct_text, text)
+        return {"text": text, "corrected": corrected}
+
+    async def handle_snippet(self, params):
+        """
+        Parameters: query and either doc (the text) or id (a movie whose first_page_summary is used).
+        """
+        query = self.get_param(params, "query")
+        doc = params.get("doc", None)
+        if doc is None:
+            movie = self.get_movie(self.get_param(params, "id"))
+            doc = movie.get("first_page_summary", None) or ""
+        if self.snippet is None:
+            from snippet import Snippet
+            self.snippet = Snippet()
+        snippet, not_exist_words = await self.run_in_executor(self.snippet.find_snippet, doc, query)
+        return {"snippet": snippet, "not_exist_words": not_exist_words}
+
+    async def handle_movie(self, params):
+        """
+        Parameters: id (also accepted as /movie/<id>).
+        """
+        return self.get_movie(self.get_param(params, "id"))
+
+    def get_movie(self, id):
+        movie = self.backend.get_movie_by_id(id, self.backend.movies_dataset)
+        if movie is None:
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"No movie with id {id}")
+        return movie
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="JSON/HTTP search service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue", type=int, default=64)
+    parser.add_argument(
+        "--processes", type=int, default=0,
+        help="score queries in this many pre-forked worker processes instead of in threads",
+    )
+    args = parser.parse_args()
+
+    import utils
+    pool = None
+    if args.processes > 0:
+        sys.path.append(os.getcwd() + "/Logic/core/")
+        from search_pool import SearchWorkerPool
+        # the pool has the same search() as SearchEngine, so utils.search is routed to the workers
+        # the pool reads every index (tiered too) and builds the scoring caches before forking, so
+        # the workers share them
+        utils.preload_search_engine()
+        pool = SearchWorkerPool(utils.get_search_engine(), args.processes).start()
+        utils.search_engine = pool
+        args.workers = max(args.workers, args.processes)
+
+    service = SearchService(backend=utils, host=args.host, port=args.port, max_workers=args.workers, max_queue=args.queue)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if pool is not None:
+            pool.close()
@@ -0,0 +1,74 @@
+import os
+import sys
+
+import numpy as np
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(TESTS_DIRECTORY, "..", "core", "utility"))
+from evaluation import Evaluation, RelevanceMatrix
+
+
+def check(name, actual, expected):
+    assert np.allclose(actual, expected), f"Error: {name} is {actual} instead of {expected}"
+
+
+def check_relevance_matrix():
+    # the gains are a=3, b=2, c=1, so the ranking has gains [2, 0, 3, 0] and the ideal one [3, 2, 1]
+    actual = [["a", "b", "c"], ["a", "b", "c", "d", "e", "f", "g", "h"], ["a"]]
+    predicted = [["b", "x", "a", "d"], ["a", "b"], ["x", "y", "a"]]
+    ideal_dcg = 3 + 2 / np.log2(3) + 1 / 2
+    ideal_dcg_at_2 = 3 + 2 / np.log2(3)
+    # the second query: gains 8 and 7 out of 8..1
+    ideal_dcg_2 = sum((8 - rank) / np.log2(rank + 2) for rank in range(8))
+    matrix = RelevanceMatrix(actual, predicted)
+
+    check("P", matrix.precision(), [2 / 4, 2 / 2, 1 / 3])
+    check("P@2", matrix.precision(2), [1 / 2, 2 / 2, 0])
+    check("R", matrix.recall(), [2 / 3, 2 / 8, 1])
+    check("R@2", matrix.recall(2), [1 / 3, 2 / 8, 0])
+    check("AP", matrix.average_precision(), [(1 + 2 / 3) / 3, (1 + 1) / 8, (1 / 3) / 1])
+    check("AP@2", matrix.average_precision(2), [1 / 3, (1 + 1) / 8, 0])
+    check("DCG", matrix.dcg(), [2 + 3 / 2, 8 + 7 / np.log2(3), 1 / 2])
+    check("DCG@2", matrix.dcg(2), [2, 8 + 7 / np.log2(3), 0])
+    check("NDCG", matrix.ndcg(), [(2 + 3 / 2) / ideal_dcg, (8 + 7 / np.log2(3)) / ideal_dcg_2, 1 / 2])
+    check("NDCG@2", matrix.ndcg(2), [2 / ideal_dcg_at_2, 1, 0])
+    check("RR", matrix.reciprocal_rank(), [1, 1, 1 / 3])
+    check("RR@2", matrix.reciprocal_rank(2), [1, 1, 0])
+
+    metrics = matrix.evaluate([None, 2])
+    check("evaluate NDCG@2", metrics["NDCG@2"], matrix.ndcg(2))
+    check("evaluate AP", metrics["AP"], matrix.average_precision())
+
+    # a repeated result only counts at its first rank
+    check("repeated DCG", RelevanceMatrix([["a", "b"]], [["a", "a"]]).dcg(), [2])
+    # no results at all
+    empty = RelevanceMatrix([["a"]], [[]]).evaluate([None, 5])
+    for name, values in empty.items():
+        check("empty " + name, values, [0])
+
+
+def check_evaluation():
+    evaluation = Evaluation("test")
+    actual = [["a", "b", "c"], ["a", "b", "c", "d", "e", "f", "g", "h"]]
+    predicted = [["b", "x", "a", "d"], ["a", "b"]]
+
+    check("precision", evaluation.calculate_precision(actual, predicted), 4 / 6)
+    check("precision@2", evaluation.calculate_precision(actual, predicted, 2), 3 / 4)
+    check("recall", evaluation.calculate_recall(actual, predicted), 4 / 11)
+    check("recall@2", evaluation.calculate_recall(actual, predicted, 2), 3 / 11)
+    check("F1", evaluation.calculate_F1(actual, predicted), 2 * (4 / 6) * (4 / 11) / (4 / 6 + 4 / 11))
+    check("AP", evaluation.calculate_AP(actual[0], predicted[0]), (1 + 2 / 3) / 3)
+    check("AP@2", evaluation.calculate_AP(actual[0], predicted[0], 2), 1 / 3)
+    check("MAP", evaluation.calculate_MAP(actual, predicted), ((1 + 2 / 3) / 3 + 2 / 8) / 2)
+    check("DCG@2", evaluation.cacluate_DCG(actual, predicted, 2), (2 + 8 + 7 / np.log2(3)) / 2)
+    check("NDCG@2", evaluation.cacluate_NDCG(actual, predicted, 2), (2 / (3 + 2 / np.log2(3)) + 1) / 2)
+    check("NDCG@2 of a perfect ranking", evaluation.cacluate_NDCG([list("abcdefgh")], [["a", "b"]], 2), 1)
+    check("RR", evaluation.cacluate_RR(["a"], ["x", "y", "a"]), 1 / 3)
+    check("RR@2", evaluation.cacluate_RR(["a"], ["x", "y", "a"], 2), 0)
+    check("MRR", evaluation.cacluate_MRR([["a"], ["b"]], [["x", "a"], ["b"]]), (1 / 2 + 1) / 2)
+    check("RR of no results", evaluation.cacluate_RR(["a"], []), 0)
+    print("the evaluation metrics match the hand-computed values")
+
+
+check_relevance_matrix()
+check_evaluation()
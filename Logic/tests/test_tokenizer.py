@@ -0,0 +1,43 @@
+import json
+import os
+import sys
+
+import nltk
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(TESTS_DIRECTORY, "..", "core", "utility"))
+from preprocess import Preprocessor
+from tokenizer import fast_tokenize
+
+
+def check_tokenizer_compatibility(json_file_path):
+    with open(json_file_path, "r") as file:
+        data = json.load(file)
+    preprocessor = Preprocessor([])
+
+    texts = ["i cannot go, gonna wanna gotta lemme gimme", "Cannot WANNA", "the_cannot can not wanna"]
+    for movie in data:
+        for field in ["title", "first_page_summary", "genres", "stars", "summaries", "synopsis", "reviews"]:
+            value = movie.get(field, None)
+            if value is None:
+                continue
+            if isinstance(value, str):
+                value = [value]
+            for text in value:
+                if isinstance(text, list):
+                    text = text[0]
+                texts.append(text)
+                # the text the index and the queries are actually tokenized from
+                texts.append(preprocessor.remove_punctuations(preprocessor.remove_links(text)).lower())
+
+    for text in texts:
+        expected = nltk.word_tokenize(text)
+        actual = fast_tokenize(text)
+        assert actual == expected, f"Error: fast tokenizer gives {actual[:20]} instead of {expected[:20]} for {text[:100]!r}"
+    print(f"fast tokenizer is token-identical to nltk.word_tokenize on {len(texts)} texts")
+
+
+json_file_path = os.path.join(TESTS_DIRECTORY, "CrawlerResults", "IMDB_Crawled.json")
+if not os.path.exists(json_file_path):
+    json_file_path = os.path.join(TESTS_DIRECTORY, "CrawlerResults", "IMDB_Crawled_Head.json")
+check_tokenizer_compatibility(json_file_path)
@@ -1,24 +1,148 @@
 from typing import Dict, List
 from core.search import SearchEngine
-from core.spell_correction import SpellCorrection
-from core.snippet import Snippet
+from core.spell_correction import SpellCorrection, DEFAULT_MODEL_PATH, MODEL_LOAD_ERRORS
+from core.index_spell_correction import IndexSpellCorrection
+from core.snippet import Snippet, SnippetGenerator
 from core.indexer.indexes_enum import Indexes, Index_types
 import json
 import os
+import threading
 
 movies_dataset = None  # TODO
-search_engine = SearchEngine()
-
-def init_utils():
-    with open(os.getcwd() + "/Logic/tests/CrawlerResults/IMDB_Crawled.json", "r") as file:
-        global movies_dataset
-        foo = json.load(file)
-        movies_dataset = dict()
-        for movie in foo:
-            movies_dataset[movie["id"]] = movie
+# created on first use by get_search_engine, so importing this module does not read the indexes
+search_engine = None
+_search_engine_lock = threading.Lock()
+_preload_thread = None
+_search_engine_ready = False
+# loaded on first use by get_spell_model and get_spell_corrector and shared by all the requests
+spell_model = None
+spell_corrector = None
+_spell_corrector_lock = threading.Lock()
+snippet_generator = None
+_snippet_generator_lock = threading.Lock()
+
+
+def get_search_engine():
+    """
+    Returns the search engine, creating it on the first call. Creating it does not read any index,
+    they are read on first use or by the background preload started by init_utils.
+    """
     global search_engine
     if search_engine is None:
-        search_engine = SearchEngine()
+        with _search_engine_lock:
+            if search_engine is None:
+                search_engine = SearchEngine(warm_up=False)
+    return search_engine
+
+
+def get_spell_model():
+    """
+    Returns the shared spell correction model, loading the prebuilt model on the first call. If the
+    model is missing, outdated or corrupt, it is built from the spell correction corpus and saved
+    for the next start.
+    """
+    global spell_model
+    if spell_model is None:
+        with _spell_corrector_lock:
+            if spell_model is None:
+                try:
+                    spell_model = SpellCorrection.load(DEFAULT_MODEL_PATH)
+                except MODEL_LOAD_ERRORS:
+                    with open(os.getcwd() + "/Logic/Data/corpus_for_spell_correction.json", "r") as file:
+                        spell_model = SpellCorrection(json.load(file))
+                    spell_model.save(DEFAULT_MODEL_PATH)
+    return spell_model
+
+
+def get_spell_corrector():
+    """
+    Returns the shared spell corrector: the words of the spell model that are in the indexes of
+    the search engine, weighted by their document frequencies.
+    """
+    global spell_corrector
+    if spell_corrector is None:
+        model = get_spell_model()
+        engine = get_search_engine()
+        with _spell_corrector_lock:
+            if spell_corrector is None:
+                spell_corrector = IndexSpellCorrection(
+                    model,
+                    [reader.index for reader in engine.document_indexes.values()],
+                    engine.query_analyzer,
+                )
+    return spell_corrector
+
+
+def get_snippet_generator():
+    """
+    Returns the shared snippet generator of the movie summaries, creating it on the first call.
+    """
+    global snippet_generator
+    if snippet_generator is None:
+        with _snippet_generator_lock:
+            if snippet_generator is None:
+                snippet_generator = SnippetGenerator(
+                    lambda id: movies_dataset[id].get("first_page_summary", None) or ""
+                )
+    return snippet_generator
+
+
+def get_snippets(ids: List[str], query: str, trace=None):
+    """
+    Finds the snippets of the summaries of the movies with the given ids for the query, in a
+    thread pool and with a cache shared by all the requests.
+
+    Parameters
+    ----------
+    ids: list of str
+        The ids of the movies, e.g. the results shown on a page.
+    query: str
+        The query text.
+    trace:
+        An optional SearchTrace, the time is recorded in its "snippets" stage.
+
+    Returns
+    -------
+    list of tuple
+        (snippet, not_exist_words, highlights) of each movie, see Snippet.find_snippet_with_highlights.
+    """
+    return get_snippet_generator().get_snippets(ids, query, trace=trace)
+
+
+def needs_correction(text: str) -> bool:
+    """
+    Returns whether some word of the text is not in the indexes, so correct_text would change it.
+    """
+    return len(get_spell_corrector().get_unknown_words(text)) > 0
+
+
+def preload_search_engine():
+    """
+    Warms up the search engine, reads the indexes used by safe ranking and the spell correction
+    model, then prints the startup report.
+    """
+    global _search_engine_ready
+    engine = get_search_engine()
+    engine.warm_up()
+    report = engine.preload()
+    get_spell_corrector()
+    _search_engine_ready = True
+    print(f"Search engine ready: {report}")
+
+
+def init_utils(preload=True):
+    global movies_dataset
+    if movies_dataset is None:
+        with open(os.getcwd() + "/Logic/tests/CrawlerResults/IMDB_Crawled.json", "r") as file:
+            foo = json.load(file)
+            movies_dataset = dict()
+            for movie in foo:
+                movies_dataset[movie["id"]] = movie
+    global _preload_thread
+    if preload and _preload_thread is None and not _search_engine_ready:
+        # in the background, so the UI comes up before the indexes are read
+        _preload_thread = threading.Thread(target=preload_search_engine, daemon=True)
+        _preload_thread.start()
 
 def correct_text(text: str, all_documents: List[str] = None) -> str:
     """
@@ -29,7 +153,7 @@ def correct_text(text: str, all_documents: List[str] = None) -> str:
     text: str
         The query text
     all_documents : list of str
-        The input documents.
+        The input documents. If None, the shared spell corrector of the indexes vocabulary is used.
 
     Returns
     str
@@ -37,9 +161,10 @@ def correct_text(text: str, all_documents: List[str] = None) -> str:
     """
     # TODO: You can add any preprocessing steps here, if needed!
     if all_documents == None:
-        with open(os.getcwd() + "/Logic/Data/corpus_for_spell_correction.json", "r") as file:
-            all_documents = json.load(file)
-    spell_correction_obj = SpellCorrection(all_documents)
+        # only the words missing from the indexes are corrected
+        spell_correction_obj = get_spell_corrector()
+    else:
+        spell_correction_obj = SpellCorrection(all_documents)
     text = spell_correction_obj.spell_check(text)
     return text
 
@@ -47,10 +172,15 @@ def correct_text(text: str, all_documents: List[str] = None) -> str:
 def search(
     query: str,
     max_result_count: int = 10,
-    method: str = "ltn-lnn",
+    method: str = "ltn.lnn",
     weights: list = [0.3, 0.3, 1],
     should_print=False,
     preferred_genre: str = None,
+    unigram_smoothing: str = None,
+    alpha: float = 0.5,
+    lamda: float = 0.5,
+    safe_ranking: bool = True,
+    trace=None,
 ):
     """
     Finds relevant documents to query
@@ -63,7 +193,7 @@ def search(
     max_result_count: Return top 'max_result_count' docs which have the highest scores.
                       notice that if max_result_count = -1, then you have to return all docs
 
-    method: 'ltn.lnn' or 'ltc.lnc' or 'OkapiBM25'
+    method: 'ltn.lnn' or 'ltc.lnc' or 'OkapiBM25' or 'BM25F' or 'unigram'
 
     weights:
         The list, containing importance weights in the search result for each of these items:
@@ -75,6 +205,18 @@ def search(
         A list containing preference rates for each genre. If None, the preference rates are equal.
         (You can leave it None for now)
 
+    unigram_smoothing: 'bayes' or 'naive' or 'mixture'
+        The smoothing method used when method is 'unigram'.
+
+    alpha, lamda:
+        The smoothing parameters of the unigram model.
+
+    safe_ranking:
+        If False, the tiered index is used instead of the whole index.
+
+    trace:
+        An optional SearchTrace to record the stages of this query in (see core/search_trace.py).
+
     Returns
     ----------------------------------------------------------------------------------------------------
     list
@@ -86,9 +228,16 @@ def search(
         Indexes.GENRES: weights[1],
         Indexes.SUMMARIES: weights[2]
     }
-    global search_engine
-    return search_engine.search(
-        query, method, weights, max_results=max_result_count, safe_ranking=True
+    return get_search_engine().search(
+        query,
+        method,
+        weights,
+        max_results=max_result_count,
+        safe_ranking=safe_ranking,
+        smoothing_method=unigram_smoothing,
+        alpha=alpha,
+        lamda=lamda,
+        trace=trace,
     )
 
 
@@ -128,4 +277,11 @@ def get_movie_by_id(id: str, movies_dataset: List[Dict[str, str]]) -> Dict[str,
     #     f"https://www.imdb.com/title/{result['id']}"  # The url pattern of IMDb movies
     # )
     # return result
+    if movies_dataset is None:
+        return None
+    if isinstance(movies_dataset, dict):
+        return movies_dataset.get(id, None)
+    for movie in movies_dataset:
+        if movie["id"] == id:
+            return movie
     return None
@@ -11,9 +11,6 @@ import utils
 import time
 from enum import Enum
 import random
-from snippet import Snippet
-
-snippet_obj = Snippet()
 
 
 class color(Enum):
@@ -48,21 +45,19 @@ def get_top_x_movies_by_rank(x: int, results: list):
     return actors, movies
 
 
-def get_summary_with_snippet(movie_info, query):
-    summary = movie_info["first_page_summary"]
-    snippet, not_exist_words = snippet_obj.find_snippet(summary, query)
+def get_summary_with_snippet(movie_info, snippet):
+    summary = movie_info["first_page_summary"] or ""
+    _, not_exist_words, highlights = snippet
     print(not_exist_words)
-    if "***" in snippet:
-        snippet = snippet.split()
-        for i in range(len(snippet)):
-            current_word = snippet[i]
-            if current_word.startswith("***") and current_word.endswith("***"):
-                current_word_without_star = current_word[3:-3]
-                summary = summary.lower().replace(
-                    current_word_without_star,
-                    f"<b><font size='4' color={random.choice(list(color)).value}>{current_word_without_star}</font></b>",
-                )
-    return summary
+    # the query words are highlighted at the offsets found by the snippet
+    parts = []
+    cursor = 0
+    for start, end in highlights:
+        parts.append(summary[cursor:start])
+        parts.append(f"<b><font size='4' color={random.choice(list(color)).value}>{summary[start:end]}</font></b>")
+        cursor = end
+    parts.append(summary[cursor:])
+    return "".join(parts)
 
 
 def search_time(start, end):
@@ -95,6 +90,7 @@ def search_handling(
             st.divider()
 
         st.markdown(f"**Top {num_filter_results} Movies:**")
+        snippets = utils.get_snippets(top_movies, search_term)
         for i in range(len(top_movies)):
             card = st.columns([3, 1])
             info = utils.get_movie_by_id(top_movies[i], utils.movies_dataset)
@@ -102,7 +98,7 @@ def search_handling(
                 st.title(info["title"])
                 st.markdown(f"[Link to movie]({info['URL']})")
                 st.markdown(
-                    f"<b><font size = '4'>Summary:</font></b> {get_summary_with_snippet(info, search_term)}",
+                    f"<b><font size = '4'>Summary:</font></b> {get_summary_with_snippet(info, snippets[i])}",
                     unsafe_allow_html=True,
                 )
 
@@ -135,11 +131,13 @@ def search_handling(
 
     if search_button:
         search_term_lowered = search_term.lower()
-        corrected_query = utils.correct_text(search_term)
+        # most queries only have words of the indexes and skip the spell correction
+        if utils.needs_correction(search_term):
+            corrected_query = utils.correct_text(search_term)
 
-        if corrected_query != search_term_lowered:
-            st.warning(f"Your search terms were corrected to: {corrected_query}")
-            search_term = corrected_query
+            if corrected_query != search_term_lowered:
+                st.warning(f"Your search terms were corrected to: {corrected_query}")
+                search_term = corrected_query
 
         with st.spinner("Searching..."):
             time.sleep(0.2)  # for showing the spinner! (can be removed)
@@ -163,6 +161,7 @@ def search_handling(
 
             search_time(start_time, end_time)
 
+        snippets = utils.get_snippets([doc_id for doc_id, _ in result], search_term)
         for i in range(len(result)):
             card = st.columns([3, 1])
             info = utils.get_movie_by_id(result[i][0], utils.movies_dataset)
@@ -171,7 +170,7 @@ def search_handling(
                 st.markdown(f"[Link to movie]({info['URL']})")
                 st.write(f"Relevance Score: {result[i][1]}")
                 st.markdown(
-                    f"<b><font size = '4'>Summary:</font></b> {get_summary_with_snippet(info, search_term)}",
+                    f"<b><font size = '4'>Summary:</font></b> {get_summary_with_snippet(info, snippets[i])}",
                     unsafe_allow_html=True,
                 )
 
@@ -252,7 +251,7 @@ def main():
 
         search_weights = [weight_stars, weight_genres, weight_summary]
         search_method = st.selectbox(
-            "Search method", ("ltn.lnn", "ltc.lnc", "OkapiBM25", "unigram")
+            "Search method", ("ltn.lnn", "ltc.lnc", "OkapiBM25", "BM25F", "unigram")
         )
 
         unigram_smoothing = None